@@ -1,8 +1,22 @@
 import json
-import os
-import psycopg2
 from typing import Dict, Any
 
+import db
+import metrics
+import passwords
+import ratelimit
+import response
+import session
+
+USER_COLUMNS = 'id, email, username, display_name, avatar_url, account_balance(id, balance) AS balance, role, is_verified, is_banned'
+
+
+def client_ip(event: Dict[str, Any]) -> str:
+    identity = (event.get('requestContext') or {}).get('identity') or {}
+    return identity.get('sourceIp', '')
+
+
+@metrics.instrumented
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Business: Авторизация и регистрация пользователей
@@ -13,117 +27,90 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': ''
-        }
+        return response.preflight_response('GET, POST, OPTIONS')
+    
+    body_data = json.loads(event.get('body') or '{}') if method == 'POST' else {}
+    action = body_data.get('action')
     
-    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    if action == 'login' and not ratelimit.allow_attempt(body_data.get('email'), client_ip(event)):
+        return response.error_response(429, 'Слишком много попыток входа, попробуйте позже')
+    if not session.is_configured():
+        return response.error_response(500, 'Авторизация не настроена: не задан SESSION_SECRET')
+    
+    conn = db.acquire()
     cur = conn.cursor()
     
     try:
         if method == 'POST':
-            body_data = json.loads(event.get('body', '{}'))
-            action = body_data.get('action')
-            
             if action == 'login':
                 email = body_data.get('email')
                 password = body_data.get('password')
                 
-                cur.execute(
-                    "SELECT id, email, username, display_name, avatar_url, balance, role, is_verified, is_banned FROM users WHERE email = %s AND password = %s",
-                    (email, password)
-                )
-                user = cur.fetchone()
+                cur.execute(f"SELECT {USER_COLUMNS}, password FROM users WHERE email = %s", (email,))
+                user = response.row_to_dict(cur, cur.fetchone())
                 
                 if not user:
-                    return {
-                        'statusCode': 401,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'isBase64Encoded': False,
-                        'body': json.dumps({'error': 'Неверный email или пароль'})
-                    }
+                    passwords.burn_verification_time(password or '')
+                    return response.error_response(401, 'Неверный email или пароль')
                 
-                if user[8]:
-                    return {
-                        'statusCode': 403,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'isBase64Encoded': False,
-                        'body': json.dumps({'error': 'Данный аккаунт заблокирован Администрацией'})
-                    }
+                stored = user.pop('password')
+                matches, needs_rehash = passwords.verify_password(password or '', stored)
+                if not matches:
+                    return response.error_response(401, 'Неверный email или пароль')
                 
-                user_data = {
-                    'id': user[0],
-                    'email': user[1],
-                    'username': user[2],
-                    'display_name': user[3],
-                    'avatar_url': user[4],
-                    'balance': float(user[5]),
-                    'role': user[6],
-                    'is_verified': user[7],
-                    'is_banned': user[8]
-                }
+                if needs_rehash:
+                    cur.execute("UPDATE users SET password = %s WHERE id = %s", (passwords.hash_password(password), user['id']))
+                    conn.commit()
                 
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'isBase64Encoded': False,
-                    'body': json.dumps({'user': user_data})
-                }
+                if user['is_banned']:
+                    return response.error_response(403, 'Данный аккаунт заблокирован Администрацией')
+                
+                return response.json_response(200, {'user': user, **session.issue_tokens(user)})
             
             elif action == 'register':
                 email = body_data.get('email')
                 password = body_data.get('password')
                 username = body_data.get('username')
                 
-                cur.execute("SELECT id FROM users WHERE email = %s OR username = %s", (email, username))
-                if cur.fetchone():
-                    return {
-                        'statusCode': 400,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'isBase64Encoded': False,
-                        'body': json.dumps({'error': 'Пользователь с таким email или логином уже существует'})
-                    }
+                if not email or not password or not username:
+                    return response.error_response(400, 'Укажите email, пароль и логин')
                 
                 cur.execute(
-                    "INSERT INTO users (email, password, username, display_name) VALUES (%s, %s, %s, %s) RETURNING id, email, username, display_name, avatar_url, balance, role, is_verified, is_banned",
-                    (email, password, username, username)
+                    f"INSERT INTO users (email, password, username, display_name) VALUES (%s, %s, %s, %s) ON CONFLICT DO NOTHING RETURNING {USER_COLUMNS}",
+                    (email, passwords.hash_password(password), username, username)
                 )
-                user = cur.fetchone()
+                user = response.row_to_dict(cur, cur.fetchone())
+                if not user:
+                    return response.error_response(400, 'Пользователь с таким email или логином уже существует')
                 conn.commit()
                 
-                user_data = {
-                    'id': user[0],
-                    'email': user[1],
-                    'username': user[2],
-                    'display_name': user[3],
-                    'avatar_url': user[4],
-                    'balance': float(user[5]),
-                    'role': user[6],
-                    'is_verified': user[7],
-                    'is_banned': user[8]
-                }
+                return response.json_response(200, {'user': user, **session.issue_tokens(user)})
+            
+            elif action == 'refresh':
+                try:
+                    claims = session.verify(body_data.get('refresh_token', ''), 'refresh')
+                except session.SessionError as error:
+                    return response.error_response(401, str(error))
+                
+                cur.execute("SELECT id, role, is_banned FROM users WHERE id = %s", (claims['uid'],))
+                user = response.row_to_dict(cur, cur.fetchone())
+                if not user or user['is_banned'] or session.is_revoked(cur, claims):
+                    return response.error_response(401, 'Сессия отозвана')
                 
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'isBase64Encoded': False,
-                    'body': json.dumps({'user': user_data})
-                }
+                return response.json_response(200, session.issue_tokens(user))
+        
+        elif method == 'GET':
+            try:
+                claims = session.authenticate(event, cur)
+            except session.SessionError as error:
+                return response.error_response(401, str(error))
+            if not claims:
+                return response.error_response(401, 'Требуется авторизация')
+            
+            return response.json_response(200, {'session': {'user_id': claims['uid'], 'role': claims['role'], 'expires_at': claims['exp']}})
         
-        return {
-            'statusCode': 405,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'isBase64Encoded': False,
-            'body': json.dumps({'error': 'Method not allowed'})
-        }
+        return response.error_response(405, 'Method not allowed')
     
     finally:
         cur.close()
-        conn.close()
+        db.release(conn)
@@ -0,0 +1,39 @@
+import base64
+import hashlib
+import hmac
+import os
+from typing import Tuple
+
+ALGORITHM = 'pbkdf2_sha256'
+ITERATIONS = int(os.environ.get('PASSWORD_HASH_ITERATIONS', '150000'))
+SALT_BYTES = 16
+
+
+def hash_password(password: str, iterations: int = ITERATIONS) -> str:
+    salt = os.urandom(SALT_BYTES)
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, iterations)
+    return f'{ALGORITHM}${iterations}${base64.b64encode(salt).decode()}${base64.b64encode(digest).decode()}'
+
+
+def verify_password(password: str, stored: str) -> Tuple[bool, bool]:
+    '''
+    Business: Проверка пароля против хеша или унаследованного открытого значения
+    Args: password - введённый пароль
+          stored - значение из users.password
+    Returns: (пароль верный, нужно ли перехешировать запись)
+    '''
+    if not stored.startswith(f'{ALGORITHM}$'):
+        matches = hmac.compare_digest(password.encode('utf-8'), stored.encode('utf-8'))
+        return matches, matches
+
+    _, iterations, salt, expected = stored.split('$')
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), base64.b64decode(salt), int(iterations))
+    matches = hmac.compare_digest(digest, base64.b64decode(expected))
+    return matches, matches and int(iterations) < ITERATIONS
+
+
+_DUMMY_HASH = hash_password('dummy-password')
+
+
+def burn_verification_time(password: str) -> None:
+    verify_password(password, _DUMMY_HASH)
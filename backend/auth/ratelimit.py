@@ -0,0 +1,49 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Tuple
+
+
+class TokenBucketLimiter:
+    '''
+    Business: Ограничение частоты попыток входа по ключу (email или IP) без обращения к БД
+    Args: capacity - сколько попыток подряд разрешено
+          refill_per_second - скорость восстановления попыток
+          max_keys - сколько ключей держать в памяти (старые вытесняются)
+    '''
+
+    def __init__(self, capacity: float, refill_per_second: float, max_keys: int = 10000):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.max_keys = max_keys
+        self._buckets: 'OrderedDict[str, Tuple[float, float]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def allow(self, key: str) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - updated) * self.refill_per_second)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return allowed
+
+
+email_limiter = TokenBucketLimiter(
+    capacity=float(os.environ.get('LOGIN_EMAIL_BURST', '5')),
+    refill_per_second=float(os.environ.get('LOGIN_EMAIL_PER_MINUTE', '5')) / 60
+)
+ip_limiter = TokenBucketLimiter(
+    capacity=float(os.environ.get('LOGIN_IP_BURST', '20')),
+    refill_per_second=float(os.environ.get('LOGIN_IP_PER_MINUTE', '30')) / 60
+)
+
+
+def allow_attempt(email: str, ip: str) -> bool:
+    ip_allowed = ip_limiter.allow(ip) if ip else True
+    return email_limiter.allow((email or '').strip().lower()) and ip_allowed
@@ -0,0 +1,146 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Sequence, Tuple
+from urllib.parse import urlencode
+
+import metrics
+
+
+class TTLCache:
+    '''
+    Business: LRU-кэш готовых JSON-ответов с TTL, живущий между тёплыми вызовами функции
+    Args: max_entries - сколько ответов держать в памяти
+          ttl - сколько секунд отдавать ответ без обращения к БД
+    Версия записи сверяется со счётчиком table_versions, поэтому после TTL
+    неизменившиеся данные продлеваются одним лёгким запросом вместо полной выборки.
+    '''
+
+    def __init__(self, max_entries: int = 256, ttl: float = 30.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: 'OrderedDict[str, Tuple[int, str, float]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.revalidations = 0
+        self.misses = 0
+
+    def lookup(self, cur: Any, table: str, key: str) -> Tuple[Optional[str], Optional[int]]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[2] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1], entry[0]
+
+        version = read_version(cur, table)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == version:
+                self._entries[key] = (version, entry[1], now + self.ttl)
+                self._entries.move_to_end(key)
+                self.revalidations += 1
+                return entry[1], version
+            self.misses += 1
+        return None, version
+
+    def store(self, key: str, version: Optional[int], body: str) -> None:
+        if version is None:
+            return
+        with self._lock:
+            self._entries[key] = (version, body, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, table: str) -> None:
+        with self._lock:
+            for key in [k for k in self._entries if k.startswith(f'{table}?')]:
+                del self._entries[key]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'hits': self.hits, 'revalidations': self.revalidations, 'misses': self.misses, 'size': len(self._entries)}
+
+
+def read_versions(cur: Any, tables: Sequence[str]) -> Dict[str, int]:
+    cur.execute(
+        "SELECT name, coalesce(sum(version), 0) FROM table_versions WHERE name = ANY(%s) GROUP BY name",
+        (list(tables),)
+    )
+    versions = {table: 0 for table in tables}
+    versions.update({row[0]: int(row[1]) for row in cur.fetchall()})
+    return versions
+
+
+def read_version(cur: Any, table: str) -> int:
+    return read_versions(cur, [table])[table]
+
+
+def make_etag(versions: Dict[str, int]) -> str:
+    return 'W/"' + '-'.join(f'{table}.{versions[table]}' for table in sorted(versions)) + '"'
+
+
+def is_not_modified(event: Dict[str, Any], etag: str) -> bool:
+    headers = event.get('headers') or {}
+    value = next((v for k, v in headers.items() if k.lower() == 'if-none-match'), None)
+    if not value:
+        return False
+    if value.strip() == '*':
+        return True
+    return etag.replace('W/', '') in [tag.strip().replace('W/', '') for tag in value.split(',')]
+
+
+def etag_headers(etag: str, cache_control: str) -> Dict[str, str]:
+    return {
+        'Access-Control-Expose-Headers': 'ETag',
+        'ETag': etag,
+        'Cache-Control': cache_control
+    }
+
+
+def not_modified_response(etag: str, cache_control: str) -> Dict[str, Any]:
+    return {
+        'statusCode': 304,
+        'headers': {
+            'ETag': etag,
+            'Cache-Control': cache_control,
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Expose-Headers': 'ETag'
+        },
+        'isBase64Encoded': False,
+        'body': ''
+    }
+
+
+def make_key(table: str, params: Dict[str, Any]) -> str:
+    return f'{table}?{urlencode(sorted(params.items()))}'
+
+
+_cache = TTLCache(
+    max_entries=int(os.environ.get('CACHE_MAX_ENTRIES', '256')),
+    ttl=float(os.environ.get('CACHE_TTL', '30'))
+)
+
+
+def lookup(cur: Any, table: str, key: str) -> Tuple[Optional[str], Optional[int]]:
+    hits, revalidations = _cache.hits, _cache.revalidations
+    body, version = _cache.lookup(cur, table, key)
+    request = metrics.current()
+    if request is not None:
+        request.extra['cache'] = 'hit' if _cache.hits > hits else 'revalidated' if _cache.revalidations > revalidations else 'miss'
+    return body, version
+
+
+def store(key: str, version: Optional[int], body: str) -> None:
+    _cache.store(key, version, body)
+
+
+def invalidate(table: str) -> None:
+    _cache.invalidate(table)
+
+
+def stats() -> Dict[str, int]:
+    return _cache.stats()
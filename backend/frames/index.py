@@ -1,8 +1,47 @@
 import json
-import os
-import psycopg2
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
 
+import cache
+import db
+import metrics
+import response
+import session
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 100
+
+PUBLIC_CACHE_CONTROL = 'public, max-age=60'
+PRIVATE_CACHE_CONTROL = 'private, no-cache'
+
+# Инвентарь одним запросом: активная рамка и страницы купленных рамок и игр (keyset по id покупки, limit + 1 строк)
+INVENTORY_SQL = '''SELECT
+    (SELECT json_build_object('id', f.id, 'name', f.name, 'image_url', f.image_url, 'image_thumb_url', image_variant_url(f.image_url, 'thumb'))
+     FROM user_frames uf JOIN frames f ON f.id = uf.frame_id
+     WHERE uf.user_id = %(user_id)s AND uf.is_active) AS active_frame,
+    (SELECT coalesce(json_agg(p ORDER BY p.owned_id DESC), '[]')
+     FROM (SELECT uf.id AS owned_id, f.id, f.name, f.price, f.image_url, image_variant_url(f.image_url, 'thumb') AS image_thumb_url,
+                  uf.is_active, uf.purchased_at
+           FROM user_frames uf JOIN frames f ON f.id = uf.frame_id
+           WHERE uf.user_id = %(user_id)s AND (%(frames_cursor)s::integer IS NULL OR uf.id < %(frames_cursor)s)
+           ORDER BY uf.id DESC
+           LIMIT %(limit)s) p) AS frames,
+    (SELECT coalesce(json_agg(p ORDER BY p.owned_id DESC), '[]')
+     FROM (SELECT ug.id AS owned_id, g.id, g.title, g.genre, g.logo_url, image_variant_url(g.logo_url, 'thumb') AS logo_thumb_url, ug.purchased_at
+           FROM user_games ug JOIN games g ON g.id = ug.game_id
+           WHERE ug.user_id = %(user_id)s AND (%(games_cursor)s::integer IS NULL OR ug.id < %(games_cursor)s)
+           ORDER BY ug.id DESC
+           LIMIT %(limit)s) p) AS games'''
+
+# Параллельные переключения рамки одного пользователя выполняются по очереди
+SET_ACTIVE_LOCK_SQL = "SELECT pg_advisory_xact_lock(hashtext('user_frames_active'), %(user_id)s)"
+
+
+def page(rows: List[Dict[str, Any]], limit: int) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+    next_cursor = rows[limit - 1]['owned_id'] if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+@metrics.instrumented
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Business: Управление рамками (создание, покупка, установка)
@@ -13,18 +52,9 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, PUT, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': ''
-        }
+        return response.preflight_response()
     
-    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    conn = db.acquire()
     cur = conn.cursor()
     
     try:
@@ -32,94 +62,132 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             params = event.get('queryStringParameters', {}) or {}
             user_id = params.get('user_id')
             
+            if user_id and params.get('view') == 'inventory':
+                try:
+                    limit = min(int(params.get('limit', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+                    args = {
+                        'user_id': int(user_id),
+                        'frames_cursor': int(params['frames_cursor']) if params.get('frames_cursor') else None,
+                        'games_cursor': int(params['games_cursor']) if params.get('games_cursor') else None
+                    }
+                except ValueError:
+                    return response.error_response(400, 'Некорректные параметры пагинации')
+                if limit < 1:
+                    limit = DEFAULT_PAGE_SIZE
+                
+                etag = cache.make_etag(cache.read_versions(cur, ['frames', 'games', 'user_frames', 'user_games']))
+                if cache.is_not_modified(event, etag):
+                    return cache.not_modified_response(etag, PRIVATE_CACHE_CONTROL)
+                
+                args['limit'] = limit + 1
+                cur.execute(INVENTORY_SQL, args)
+                active_frame, owned_frames, owned_games = cur.fetchone()
+                frames, next_frames_cursor = page(owned_frames, limit)
+                games, next_games_cursor = page(owned_games, limit)
+                
+                return response.json_response(
+                    200,
+                    {
+                        'active_frame': active_frame,
+                        'frames': frames,
+                        'games': games,
+                        'next_frames_cursor': next_frames_cursor,
+                        'next_games_cursor': next_games_cursor
+                    },
+                    cache.etag_headers(etag, PRIVATE_CACHE_CONTROL),
+                    event
+                )
+            
             if user_id:
+                etag = cache.make_etag(cache.read_versions(cur, ['frames', 'user_frames']))
+                if cache.is_not_modified(event, etag):
+                    return cache.not_modified_response(etag, PRIVATE_CACHE_CONTROL)
+                
                 cur.execute(
-                    """SELECT f.id, f.name, f.price, f.image_url, uf.is_active 
+                    """SELECT f.id, f.name, f.price, f.image_url, image_variant_url(f.image_url, 'thumb') AS image_thumb_url, uf.is_active 
                        FROM frames f 
                        JOIN user_frames uf ON f.id = uf.frame_id 
                        WHERE uf.user_id = %s""",
                     (user_id,)
                 )
-                frames = []
-                for frame in cur.fetchall():
-                    frames.append({
-                        'id': frame[0],
-                        'name': frame[1],
-                        'price': float(frame[2]),
-                        'image_url': frame[3],
-                        'is_active': frame[4]
-                    })
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'isBase64Encoded': False,
-                    'body': json.dumps({'frames': frames})
-                }
+                frames = response.rows_to_dicts(cur, cur.fetchall())
+                return response.json_response(200, {'frames': frames}, cache.etag_headers(etag, PRIVATE_CACHE_CONTROL), event)
+            
+            cache_key = cache.make_key('frames', params)
+            cached_body, version = cache.lookup(cur, 'frames', cache_key)
+            etag = cache.make_etag({'frames': version})
+            if cache.is_not_modified(event, etag):
+                return cache.not_modified_response(etag, PUBLIC_CACHE_CONTROL)
+            if cached_body is not None:
+                return response.body_response(200, cached_body, cache.etag_headers(etag, PUBLIC_CACHE_CONTROL), event)
             
-            cur.execute("SELECT id, name, price, image_url FROM frames ORDER BY id DESC")
-            frames = []
-            for frame in cur.fetchall():
-                frames.append({
-                    'id': frame[0],
-                    'name': frame[1],
-                    'price': float(frame[2]),
-                    'image_url': frame[3]
-                })
+            cur.execute("SELECT id, name, price, image_url, image_variant_url(image_url, 'thumb') AS image_thumb_url FROM frames ORDER BY id DESC")
+            body = response.dumps({'frames': response.rows_to_dicts(cur, cur.fetchall())})
+            cache.store(cache_key, version, body)
             
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'isBase64Encoded': False,
-                'body': json.dumps({'frames': frames})
-            }
+            return response.body_response(200, body, cache.etag_headers(etag, PUBLIC_CACHE_CONTROL), event)
         
         elif method == 'POST':
             body_data = json.loads(event.get('body', '{}'))
             action = body_data.get('action')
+            try:
+                claims = session.authenticate(event, cur)
+            except session.SessionError as error:
+                return response.error_response(401, str(error))
             
             if action == 'create':
+                if claims and claims['role'] != 'admin':
+                    return response.error_response(403, 'Недостаточно прав')
+                
                 cur.execute(
                     "INSERT INTO frames (name, price, image_url) VALUES (%s, %s, %s) RETURNING id",
                     (body_data.get('name'), body_data.get('price'), body_data.get('image_url'))
                 )
                 frame_id = cur.fetchone()[0]
                 conn.commit()
+                cache.invalidate('frames')
                 
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'isBase64Encoded': False,
-                    'body': json.dumps({'frame_id': frame_id, 'message': 'Рамка создана'})
-                }
+                return response.json_response(200, {'frame_id': frame_id, 'message': 'Рамка создана'})
         
         elif method == 'PUT':
             body_data = json.loads(event.get('body', '{}'))
             action = body_data.get('action')
             user_id = body_data.get('user_id')
             frame_id = body_data.get('frame_id')
+            try:
+                claims = session.authenticate(event, cur)
+            except session.SessionError as error:
+                return response.error_response(401, str(error))
+            if claims:
+                user_id = claims['uid']
             
             if action == 'set_active':
-                cur.execute("UPDATE user_frames SET is_active = false WHERE user_id = %s", (user_id,))
+                try:
+                    args = {'user_id': int(user_id), 'frame_id': int(frame_id) if frame_id is not None else None}
+                except (TypeError, ValueError):
+                    return response.error_response(400, 'Укажите user_id и frame_id')
+                
+                # Уникальный индекс активной рамки проверяется построчно, поэтому сначала снимается старая, потом
+                # включается новая; блокировка по пользователю упорядочивает параллельные переключения
+                cur.execute(SET_ACTIVE_LOCK_SQL, args)
                 cur.execute(
-                    "UPDATE user_frames SET is_active = true WHERE user_id = %s AND frame_id = %s",
-                    (user_id, frame_id)
+                    "UPDATE user_frames SET is_active = false WHERE user_id = %(user_id)s AND is_active AND frame_id IS DISTINCT FROM %(frame_id)s",
+                    args
                 )
+                if args['frame_id'] is not None:
+                    cur.execute(
+                        "UPDATE user_frames SET is_active = true WHERE user_id = %(user_id)s AND frame_id = %(frame_id)s RETURNING frame_id",
+                        args
+                    )
+                    if not cur.fetchone():
+                        conn.rollback()
+                        return response.error_response(404, 'Рамка не куплена')
                 conn.commit()
                 
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'isBase64Encoded': False,
-                    'body': json.dumps({'success': True})
-                }
+                return response.json_response(200, {'success': True, 'active_frame_id': args['frame_id']})
         
-        return {
-            'statusCode': 405,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'isBase64Encoded': False,
-            'body': json.dumps({'error': 'Method not allowed'})
-        }
+        return response.error_response(405, 'Method not allowed')
     
     finally:
         cur.close()
-        conn.close()
+        db.release(conn)
@@ -1,8 +1,290 @@
 import json
-import os
-import psycopg2
-from typing import Dict, Any
+from typing import Dict, Any, Tuple
 
+import cache
+import db
+import ingest
+import metrics
+import response
+import session
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 100
+MAX_BULK_SIZE = 500
+DEFAULT_RANKING_SIZE = 12
+MAX_RANKING_SIZE = 50
+MAX_REFRESH_BATCHES = 20
+DEFAULT_REFRESH_BATCH = 100000
+MAX_REFRESH_BATCH = 1000000
+MAX_REPORTED_ERRORS = 1000
+
+PUBLIC_CACHE_CONTROL = 'public, max-age=30'
+PRIVATE_CACHE_CONTROL = 'private, no-cache'
+
+FULL_COLUMNS = (
+    'id', 'title', 'description', 'price', 'developer_email', 'genre', 'age_rating',
+    'file_url', 'logo_url', "coalesce(screenshots, '{}') AS screenshots", 'publisher_username', 'status', 'is_featured'
+)
+CARD_COLUMNS = ('id', 'title', 'price', 'genre', 'age_rating', 'logo_url', 'publisher_username', 'status', 'is_featured')
+# URL вариантов из media (V0021): плитке каталога хватает card, странице игры - large и card для скриншотов
+CARD_VARIANT_COLUMNS = ("image_variant_url(logo_url, 'card') AS logo_card_url",)
+FULL_VARIANT_COLUMNS = (
+    "image_variant_url(logo_url, 'card') AS logo_card_url",
+    "image_variant_url(logo_url, 'large') AS logo_large_url",
+    "ARRAY(SELECT image_variant_url(s, 'card') FROM unnest(coalesce(screenshots, '{}')) s) AS screenshots_card_urls"
+)
+
+SEARCH_SQL = '''WITH matched AS (
+    SELECT id, genre, age_rating, ts_rank_cd(search_vector, q) AS rank
+    FROM games, websearch_to_tsquery('russian', %(query)s) q
+    WHERE search_vector @@ q AND {conditions}
+), total AS (
+    SELECT count(*) AS n FROM matched
+)
+SELECT json_build_object(
+    'games', (SELECT coalesce(json_agg(page ORDER BY page.rank DESC, page.id DESC), '[]')
+              FROM (SELECT {columns}, m.rank
+                    FROM matched m JOIN games g ON g.id = m.id
+                    ORDER BY m.rank DESC, m.id DESC
+                    LIMIT %(limit)s OFFSET %(offset)s) page),
+    'total', (SELECT n FROM total),
+    'facets', json_build_object(
+        'genre', (SELECT coalesce(json_object_agg(coalesce(genre, ''), n), '{{}}')
+                  FROM (SELECT genre, count(*) AS n FROM matched GROUP BY genre) x),
+        'age_rating', (SELECT coalesce(json_object_agg(coalesce(age_rating, ''), n), '{{}}')
+                       FROM (SELECT age_rating, count(*) AS n FROM matched GROUP BY age_rating) x)
+    ),
+    'next_offset', (SELECT CASE WHEN %(offset)s + %(limit)s < n THEN %(offset)s + %(limit)s END FROM total)
+)::text'''
+
+
+# Рейтинг -> порядок строк свёртки; для каждого есть индекс (item_type | genre, колонка DESC, item_id DESC)
+RANKING_ORDERS = {
+    'top': 'r.purchases DESC, r.item_id DESC',
+    'trending': 'r.trend_log DESC, r.item_id DESC'
+}
+# Тип товара -> (JOIN с карточкой, колонки карточки)
+RANKING_ITEMS = {
+    'game': (
+        "JOIN games g ON g.id = r.item_id AND g.status = 'approved'",
+        "g.id, g.title, g.price, g.genre, g.logo_url, image_variant_url(g.logo_url, 'card') AS logo_card_url, g.is_featured"
+    ),
+    'frame': ('JOIN frames f ON f.id = r.item_id', "f.id, f.name, f.price, f.image_url, image_variant_url(f.image_url, 'thumb') AS image_thumb_url")
+}
+
+RANKING_SQL = '''SELECT row_number() OVER (ORDER BY {order}) AS rank, {columns},
+       r.purchases, rankings_trend_score(r.trend_log) AS trend_score
+FROM item_rankings r {join}
+WHERE r.item_type = %(item_type)s {genre_condition}
+ORDER BY {order}
+LIMIT %(limit)s'''
+
+TOP_SELLERS_SQL = '''SELECT row_number() OVER (ORDER BY {order}) AS rank, u.id, u.username, u.display_name, u.avatar_url,
+       image_variant_url(u.avatar_url, 'thumb') AS avatar_thumb_url, u.is_verified, r.sales, r.revenue, rankings_trend_score(r.trend_log) AS trend_score
+FROM seller_rankings r
+JOIN users u ON u.id = r.seller_id AND NOT u.is_banned
+ORDER BY {order}
+LIMIT %(limit)s'''
+SELLER_ORDERS = {
+    'top': 'r.sales DESC, r.seller_id DESC',
+    'trending': 'r.trend_log DESC, r.seller_id DESC'
+}
+
+# Главная витрина одним запросом: каждая секция - чтение первых строк своего индекса, не зависит от объёма истории
+HOME_SQL = f'''SELECT json_build_object(
+    'featured', (SELECT coalesce(json_agg(p ORDER BY p.id DESC), '[]')
+                 FROM (SELECT {', '.join(CARD_COLUMNS + CARD_VARIANT_COLUMNS)} FROM games
+                       WHERE status = 'approved' AND is_featured = true
+                       ORDER BY id DESC LIMIT %(limit)s) p),
+    'top_games', (SELECT coalesce(json_agg(p ORDER BY p.rank), '[]')
+                  FROM ({RANKING_SQL.format(order=RANKING_ORDERS['top'], columns=RANKING_ITEMS['game'][1], join=RANKING_ITEMS['game'][0], genre_condition='')}) p),
+    'trending_games', (SELECT coalesce(json_agg(p ORDER BY p.rank), '[]')
+                       FROM ({RANKING_SQL.format(order=RANKING_ORDERS['trending'], columns=RANKING_ITEMS['game'][1], join=RANKING_ITEMS['game'][0], genre_condition='')}) p),
+    'top_sellers', (SELECT coalesce(json_agg(p ORDER BY p.rank), '[]')
+                    FROM ({TOP_SELLERS_SQL.format(order=SELLER_ORDERS['top'])}) p)
+)::text'''
+
+# Загрузка каталога: строки идут через COPY во временную таблицу, проверяются и сливаются в games наборными запросами
+IMPORT_STAGING_SQL = '''CREATE TEMP TABLE games_import (
+    row_no BIGINT NOT NULL,
+    title TEXT, description TEXT, price TEXT, developer_email TEXT, genre TEXT, age_rating TEXT,
+    file_url TEXT, logo_url TEXT, screenshots TEXT, publisher_username TEXT,
+    error TEXT,
+    existing_id INTEGER
+) ON COMMIT DROP'''
+
+IMPORT_VALIDATE_SQL = '''UPDATE games_import SET error = CASE
+    WHEN title IS NULL THEN 'Не указано название'
+    WHEN length(title) > 255 THEN 'Название длиннее 255 символов'
+    WHEN price IS NULL OR price !~ '^[0-9]{1,8}([.][0-9]{1,2})?$' THEN 'Цена должна быть числом от 0 с точностью до копеек'
+    WHEN publisher_username IS NULL THEN 'Не указан издатель'
+    WHEN length(publisher_username) > 100 THEN 'Имя издателя длиннее 100 символов'
+    WHEN length(developer_email) > 255 THEN 'Email разработчика длиннее 255 символов'
+    WHEN length(genre) > 100 THEN 'Жанр длиннее 100 символов'
+    WHEN length(age_rating) > 10 THEN 'Возрастной рейтинг длиннее 10 символов'
+END
+WHERE error IS NULL'''
+
+# Повторы внутри файла: остаётся последняя строка с тем же издателем и названием
+IMPORT_DEDUPE_SQL = '''UPDATE games_import s SET error = 'Повторяет строку ' || d.kept_row
+FROM (
+    SELECT row_no, first_value(row_no) OVER w AS kept_row, row_number() OVER w AS n
+    FROM games_import
+    WHERE error IS NULL
+    WINDOW w AS (PARTITION BY publisher_username, lower(title) ORDER BY row_no DESC)
+) d
+WHERE s.row_no = d.row_no AND d.n > 1'''
+
+# Загрузки одного издателя выполняются по очереди: иначе обе не увидят игры друг друга и вставят дубликаты
+IMPORT_LOCK_SQL = '''SELECT count(pg_advisory_xact_lock(hashtext('games_import:' || p.publisher_username)))
+FROM (SELECT DISTINCT publisher_username FROM games_import WHERE error IS NULL ORDER BY 1) p'''
+
+IMPORT_MATCH_SQL = '''UPDATE games_import s SET existing_id = g.id
+FROM games g
+WHERE s.error IS NULL AND g.publisher_username = s.publisher_username AND lower(g.title) = lower(s.title)'''
+
+IMPORT_MERGE_SQL = '''WITH updated AS (
+    UPDATE games g
+    SET description = s.description, price = s.price::numeric, developer_email = s.developer_email, genre = s.genre,
+        age_rating = s.age_rating, file_url = s.file_url, logo_url = s.logo_url,
+        screenshots = ARRAY(SELECT jsonb_array_elements_text(coalesce(s.screenshots, '[]')::jsonb)), status = 'pending'
+    FROM games_import s
+    WHERE g.id = s.existing_id AND s.error IS NULL
+    RETURNING g.id
+), inserted AS (
+    INSERT INTO games (title, description, price, developer_email, genre, age_rating, file_url, logo_url, screenshots, publisher_username, status)
+    SELECT s.title, s.description, s.price::numeric, s.developer_email, s.genre, s.age_rating, s.file_url, s.logo_url,
+           ARRAY(SELECT jsonb_array_elements_text(coalesce(s.screenshots, '[]')::jsonb)), s.publisher_username, 'pending'
+    FROM games_import s
+    WHERE s.existing_id IS NULL AND s.error IS NULL
+    ORDER BY s.row_no
+    RETURNING id
+)
+SELECT (SELECT count(*) FROM inserted), (SELECT count(*) FROM updated)'''
+
+# Массовые действия модерации -> (колонка, новое значение)
+BULK_OPERATIONS = {
+    'approve': ('status', 'approved'),
+    'reject': ('status', 'rejected'),
+    'feature': ('is_featured', True),
+    'unfeature': ('is_featured', False)
+}
+BULK_FILTER_FIELDS = ('status', 'genre', 'publisher_username')
+# Действия только для администратора с токеном; старые approve/reject/set_featured допускают вызов без токена
+ADMIN_TOKEN_ACTIONS = ('bulk_moderate', 'refresh_rankings')
+
+BULK_UPDATE_SQL = '''WITH requested AS (
+    {requested}
+), updated AS (
+    UPDATE games g SET {column} = %(value)s
+    FROM requested r
+    WHERE g.id = r.id AND g.{column} IS DISTINCT FROM %(value)s
+    RETURNING g.id
+)
+SELECT r.id,
+       CASE WHEN u.id IS NOT NULL THEN 'updated' WHEN g.id IS NOT NULL THEN 'unchanged' ELSE 'not_found' END
+FROM requested r
+LEFT JOIN updated u ON u.id = r.id
+LEFT JOIN games g ON g.id = r.id
+ORDER BY r.id'''
+
+
+def bulk_selection(body_data: Dict[str, Any], column: str) -> Tuple[str, Dict[str, Any]]:
+    '''
+    Business: Выбор игр для массовой модерации: явный список game_ids или filter по полям игры
+    Args: column - изменяемая колонка; filter выбирает только игры, где она ещё не равна %(value)s,
+          поэтому повторный вызов при has_more берёт следующие игры, а не те же самые
+    Returns: SQL, возвращающий колонку id, и его параметры; ValueError/TypeError при некорректном выборе
+    '''
+    if body_data.get('game_ids'):
+        ids = [int(game_id) for game_id in body_data['game_ids']]
+        if len(ids) > MAX_BULK_SIZE:
+            raise ValueError(len(ids))
+        return 'SELECT DISTINCT unnest(%(ids)s::integer[]) AS id', {'ids': ids}
+    
+    filters = body_data.get('filter') or {}
+    conditions = [f'{field} = %({field})s' for field in BULK_FILTER_FIELDS if filters.get(field)]
+    if not conditions:
+        raise ValueError(filters)
+    args = {field: filters[field] for field in BULK_FILTER_FIELDS if filters.get(field)}
+    args['limit'] = MAX_BULK_SIZE
+    conditions.append(f'{column} IS DISTINCT FROM %(value)s')
+    return f"SELECT id FROM games WHERE {' AND '.join(conditions)} ORDER BY id LIMIT %(limit)s", args
+
+
+def import_games(event: Dict[str, Any], params: Dict[str, Any], conn: Any, cur: Any) -> Dict[str, Any]:
+    '''
+    Business: Загрузка каталога игр одним запросом: NDJSON или CSV -> COPY во временную таблицу -> проверка -> слияние
+    Args: params - format (ndjson | csv), publisher (издатель по умолчанию), on_conflict (skip | update), dry_run
+    Returns: счётчики вставленных, обновлённых и отклонённых строк и ошибки по номерам строк
+    '''
+    fmt = params.get('format', 'ndjson')
+    on_conflict = params.get('on_conflict', 'skip')
+    if fmt not in ingest.FORMATS or on_conflict not in ('skip', 'update'):
+        return response.error_response(400, 'format: ndjson или csv, on_conflict: skip или update')
+    try:
+        claims = session.authenticate(event, cur)
+    except session.SessionError as error:
+        return response.error_response(401, str(error))
+    if not claims:
+        return response.error_response(401, 'Требуется авторизация')
+
+    # Издатель загружает только свой каталог, администратор - любой
+    force_publisher = None
+    if claims['role'] != 'admin':
+        cur.execute("SELECT username FROM users WHERE id = %s", (claims['uid'],))
+        publisher = cur.fetchone()
+        if not publisher:
+            return response.error_response(401, 'Пользователь сессии не найден')
+        force_publisher = publisher[0]
+
+    source = ingest.ImportSource(ingest.request_text(event), fmt, params.get('publisher'), force_publisher)
+    cur.execute(IMPORT_STAGING_SQL)
+    cur.copy_expert(
+        f"COPY games_import ({', '.join(ingest.COPY_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+        source.stream()
+    )
+    if source.fatal:
+        conn.rollback()
+        return response.error_response(400, source.fatal)
+
+    cur.execute("ANALYZE games_import")
+    cur.execute(IMPORT_VALIDATE_SQL)
+    cur.execute(IMPORT_DEDUPE_SQL)
+    cur.execute(IMPORT_LOCK_SQL)
+    cur.execute(IMPORT_MATCH_SQL)
+    if on_conflict == 'skip':
+        cur.execute(
+            "UPDATE games_import SET error = 'Игра уже есть в каталоге (id ' || existing_id || ')' WHERE existing_id IS NOT NULL AND error IS NULL"
+        )
+    cur.execute(IMPORT_MERGE_SQL)
+    inserted, updated = cur.fetchone()
+
+    cur.execute("SELECT count(*) FROM games_import WHERE error IS NOT NULL")
+    rejected = cur.fetchone()[0]
+    cur.execute("SELECT row_no, error FROM games_import WHERE error IS NOT NULL ORDER BY row_no LIMIT %s", (MAX_REPORTED_ERRORS,))
+    errors = [{'row': row[0], 'error': row[1]} for row in cur.fetchall()]
+
+    dry_run = params.get('dry_run') in ('true', '1')
+    if dry_run:
+        conn.rollback()
+    else:
+        conn.commit()
+        if inserted or updated:
+            cache.invalidate('games')
+
+    return response.json_response(200, {
+        'rows': source.rows,
+        'inserted': inserted,
+        'updated': updated,
+        'rejected': rejected,
+        'errors': errors,
+        'errors_truncated': rejected > len(errors),
+        'dry_run': dry_run
+    })
+
+
+@metrics.instrumented
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Business: Управление играми (публикация, одобрение, получение списка)
@@ -13,55 +295,138 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, PUT, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': ''
-        }
+        return response.preflight_response()
     
-    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    conn = db.acquire()
     cur = conn.cursor()
     
     try:
         if method == 'GET':
             params = event.get('queryStringParameters', {}) or {}
             status = params.get('status', 'approved')
+            view = params.get('view', 'full')
+            
+            try:
+                limit = min(int(params.get('limit', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+                cursor = int(params['cursor']) if params.get('cursor') else None
+                min_price = float(params['min_price']) if params.get('min_price') else None
+                max_price = float(params['max_price']) if params.get('max_price') else None
+                offset = max(int(params.get('offset', 0)), 0)
+            except ValueError:
+                return response.error_response(400, 'Некорректные параметры пагинации или фильтра')
+            if limit < 1:
+                limit = DEFAULT_PAGE_SIZE
+            
+            if view in ('home', 'rankings'):
+                ranking = params.get('ranking', 'top')
+                item_type = params.get('item_type', 'game')
+                try:
+                    ranking_limit = min(int(params.get('limit', DEFAULT_RANKING_SIZE)), MAX_RANKING_SIZE)
+                except ValueError:
+                    ranking_limit = DEFAULT_RANKING_SIZE
+                if ranking_limit < 1:
+                    ranking_limit = DEFAULT_RANKING_SIZE
+                if ranking not in RANKING_ORDERS or (item_type not in RANKING_ITEMS and item_type != 'seller'):
+                    return response.error_response(400, 'Неизвестный рейтинг')
+                
+                etag = cache.make_etag(cache.read_versions(cur, ['games', 'rankings']))
+                if cache.is_not_modified(event, etag):
+                    return cache.not_modified_response(etag, PUBLIC_CACHE_CONTROL)
+                ranking_headers = cache.etag_headers(etag, PUBLIC_CACHE_CONTROL)
+                args = {'limit': ranking_limit, 'item_type': item_type, 'genre': params.get('genre')}
+                
+                if view == 'home':
+                    args['item_type'] = 'game'
+                    cur.execute(HOME_SQL, args)
+                    return response.body_response(200, cur.fetchone()[0], ranking_headers, event)
+                
+                if item_type == 'seller':
+                    cur.execute(TOP_SELLERS_SQL.format(order=SELLER_ORDERS[ranking]), args)
+                else:
+                    join, columns = RANKING_ITEMS[item_type]
+                    genre_condition = 'AND r.genre = %(genre)s' if item_type == 'game' and args['genre'] else ''
+                    cur.execute(
+                        RANKING_SQL.format(order=RANKING_ORDERS[ranking], columns=columns, join=join, genre_condition=genre_condition),
+                        args
+                    )
+                items = response.rows_to_dicts(cur, cur.fetchall())
+                
+                return response.json_response(200, {'ranking': ranking, 'item_type': item_type, 'items': items}, ranking_headers, event)
+            
+            cache_key = cache.make_key('games', params) if status == 'approved' else None
+            cache_control = PUBLIC_CACHE_CONTROL if status == 'approved' else PRIVATE_CACHE_CONTROL
+            cached_body = None
+            if cache_key:
+                cached_body, version = cache.lookup(cur, 'games', cache_key)
+            else:
+                version = cache.read_version(cur, 'games')
+            
+            etag = cache.make_etag({'games': version})
+            if cache.is_not_modified(event, etag):
+                return cache.not_modified_response(etag, cache_control)
+            list_headers = cache.etag_headers(etag, cache_control)
             
+            if cached_body is not None:
+                return response.body_response(200, cached_body, list_headers, event)
+            
+            conditions = ['status = %(status)s']
+            args: Dict[str, Any] = {'status': status, 'limit': limit, 'offset': offset}
+            if params.get('genre'):
+                conditions.append('genre = %(genre)s')
+                args['genre'] = params['genre']
+            if params.get('age_rating'):
+                conditions.append('age_rating = %(age_rating)s')
+                args['age_rating'] = params['age_rating']
+            if min_price is not None:
+                conditions.append('price >= %(min_price)s')
+                args['min_price'] = min_price
+            if max_price is not None:
+                conditions.append('price <= %(max_price)s')
+                args['max_price'] = max_price
+            if params.get('is_featured') in ('true', '1'):
+                conditions.append('is_featured = true')
+            elif params.get('is_featured') in ('false', '0'):
+                conditions.append('is_featured = false')
+            
+            if params.get('search'):
+                args['query'] = params['search']
+                cur.execute(
+                    SEARCH_SQL.format(
+                        conditions=' AND '.join(conditions),
+                        columns=', '.join([f'g.{column}' for column in CARD_COLUMNS] + list(CARD_VARIANT_COLUMNS))
+                    ),
+                    args
+                )
+                body = cur.fetchone()[0]
+                if cache_key:
+                    cache.store(cache_key, version, body)
+                
+                return response.body_response(200, body, list_headers, event)
+            
+            if cursor is not None:
+                conditions.append('id < %(cursor)s')
+                args['cursor'] = cursor
+            
+            columns = CARD_COLUMNS + CARD_VARIANT_COLUMNS if view == 'card' else FULL_COLUMNS + FULL_VARIANT_COLUMNS
+            args['limit'] = limit + 1
             cur.execute(
-                "SELECT id, title, description, price, developer_email, genre, age_rating, file_url, logo_url, screenshots, publisher_username, status FROM games WHERE status = %s ORDER BY id DESC",
-                (status,)
+                f"SELECT {', '.join(columns)} FROM games WHERE {' AND '.join(conditions)} ORDER BY id DESC LIMIT %(limit)s",
+                args
             )
+            games = response.rows_to_dicts(cur, cur.fetchall())
             
-            games = []
-            for game in cur.fetchall():
-                games.append({
-                    'id': game[0],
-                    'title': game[1],
-                    'description': game[2],
-                    'price': float(game[3]),
-                    'developer_email': game[4],
-                    'genre': game[5],
-                    'age_rating': game[6],
-                    'file_url': game[7],
-                    'logo_url': game[8],
-                    'screenshots': game[9] or [],
-                    'publisher_username': game[10],
-                    'status': game[11]
-                })
+            next_cursor = games[limit - 1]['id'] if len(games) > limit else None
+            body = response.dumps({'games': games[:limit], 'next_cursor': next_cursor})
+            if cache_key:
+                cache.store(cache_key, version, body)
             
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'isBase64Encoded': False,
-                'body': json.dumps({'games': games})
-            }
+            return response.body_response(200, body, list_headers, event)
         
         elif method == 'POST':
+            params = event.get('queryStringParameters', {}) or {}
+            if params.get('mode') == 'import':
+                return import_games(event, params, conn, cur)
+            
             body_data = json.loads(event.get('body', '{}'))
             
             cur.execute(
@@ -83,17 +448,62 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             game_id = cur.fetchone()[0]
             conn.commit()
             
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'isBase64Encoded': False,
-                'body': json.dumps({'game_id': game_id, 'message': 'Игра отправлена на модерацию'})
-            }
+            return response.json_response(200, {'game_id': game_id, 'message': 'Игра отправлена на модерацию'})
         
         elif method == 'PUT':
             body_data = json.loads(event.get('body', '{}'))
             game_id = body_data.get('game_id')
             action = body_data.get('action')
+            try:
+                claims = session.authenticate(event, cur)
+            except session.SessionError as error:
+                return response.error_response(401, str(error))
+            if action in ADMIN_TOKEN_ACTIONS and not claims:
+                return response.error_response(401, 'Требуется авторизация')
+            if claims and claims['role'] != 'admin':
+                return response.error_response(403, 'Недостаточно прав')
+            
+            if action == 'bulk_moderate':
+                operation = BULK_OPERATIONS.get(body_data.get('operation'))
+                if not operation:
+                    return response.error_response(400, 'Неизвестное действие модерации')
+                try:
+                    requested, args = bulk_selection(body_data, operation[0])
+                except (TypeError, ValueError):
+                    return response.error_response(400, f'Укажите до {MAX_BULK_SIZE} game_ids или filter')
+                
+                column, args['value'] = operation
+                cur.execute(BULK_UPDATE_SQL.format(requested=requested, column=column), args)
+                results = [{'id': row[0], 'result': row[1]} for row in cur.fetchall()]
+                conn.commit()
+                cache.invalidate('games')
+                
+                return response.json_response(200, {
+                    'results': results,
+                    'updated': sum(1 for result in results if result['result'] == 'updated'),
+                    'has_more': 'ids' not in args and len(results) == MAX_BULK_SIZE
+                })
+            
+            if action == 'refresh_rankings':
+                # Окно за окном, каждое в своей транзакции, пока источники не догнаны или не исчерпан лимит вызова
+                try:
+                    batch = int(body_data.get('batch') or DEFAULT_REFRESH_BATCH)
+                except (TypeError, ValueError):
+                    return response.error_response(400, 'batch должен быть целым числом')
+                if not 0 < batch <= MAX_REFRESH_BATCH:
+                    return response.error_response(400, f'batch должен быть от 1 до {MAX_REFRESH_BATCH}')
+                windows: Dict[str, Dict[str, Any]] = {}
+                for _ in range(MAX_REFRESH_BATCHES):
+                    cur.execute("SELECT source, last_id, processed FROM rankings_refresh(p_batch => %s)", (batch,))
+                    rows = cur.fetchall()
+                    conn.commit()
+                    for source, last_id, processed in rows:
+                        previous = windows.get(source, {}).get('processed', 0)
+                        windows[source] = {'last_id': last_id, 'processed': previous + processed}
+                    if all(processed < batch for _, _, processed in rows):
+                        break
+                
+                return response.json_response(200, {'sources': windows})
             
             if action == 'approve':
                 cur.execute("UPDATE games SET status = %s WHERE id = %s", ('approved', game_id))
@@ -105,21 +515,12 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 is_featured = body_data.get('is_featured', True)
                 cur.execute("UPDATE games SET is_featured = %s WHERE id = %s", (is_featured, game_id))
                 conn.commit()
+            cache.invalidate('games')
             
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'isBase64Encoded': False,
-                'body': json.dumps({'success': True})
-            }
+            return response.json_response(200, {'success': True})
         
-        return {
-            'statusCode': 405,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'isBase64Encoded': False,
-            'body': json.dumps({'error': 'Method not allowed'})
-        }
+        return response.error_response(405, 'Method not allowed')
     
     finally:
         cur.close()
-        conn.close()
\ No newline at end of file
+        db.release(conn)
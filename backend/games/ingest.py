@@ -0,0 +1,159 @@
+import base64
+import csv
+import io
+import json
+import os
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+MAX_IMPORT_ROWS = int(os.environ.get('GAMES_IMPORT_MAX_ROWS', '100000'))
+
+IMPORT_COLUMNS = (
+    'title', 'description', 'price', 'developer_email', 'genre', 'age_rating',
+    'file_url', 'logo_url', 'screenshots', 'publisher_username'
+)
+COPY_COLUMNS = ('row_no',) + IMPORT_COLUMNS + ('error',)
+FORMATS = ('ndjson', 'csv')
+
+
+def request_text(event: Dict[str, Any]) -> str:
+    body = event.get('body') or ''
+    if event.get('isBase64Encoded'):
+        return base64.b64decode(body).decode('utf-8')
+    return body
+
+
+def iter_lines(text: str) -> Iterator[str]:
+    '''
+    Business: Строки текста по одной (с переводом строки), без списка всех строк в памяти
+    '''
+    start = 0
+    while start < len(text):
+        end = text.find('\n', start)
+        end = len(text) if end == -1 else end + 1
+        yield text[start:end]
+        start = end
+
+
+def screenshots_json(value: Any) -> Optional[str]:
+    if value in (None, ''):
+        return None
+    if isinstance(value, str):
+        value = json.loads(value) if value.lstrip().startswith('[') else value.split()
+    if not isinstance(value, list) or not all(isinstance(url, str) for url in value):
+        raise ValueError(value)
+    return json.dumps(value, ensure_ascii=False)
+
+
+class CopyStream:
+    '''
+    Business: Файлоподобный источник для COPY FROM STDIN: строки формируются по мере чтения драйвером
+    Args: lines - итератор готовых строк в формате COPY
+    '''
+
+    def __init__(self, lines: Iterator[str]):
+        self._lines = lines
+        self._buffer = bytearray()
+
+    def read(self, size: int = -1) -> bytes:
+        while size < 0 or len(self._buffer) < size:
+            line = next(self._lines, None)
+            if line is None:
+                break
+            self._buffer += line.encode('utf-8')
+        if size < 0:
+            size = len(self._buffer)
+        chunk = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return chunk
+
+    readline = read
+
+
+class ImportSource:
+    '''
+    Business: Разбор NDJSON/CSV каталога игр в строки CSV для COPY в таблицу загрузки
+    Ошибки отдельной строки уходят в колонку error и проверяются вместе с остальными в SQL;
+    ошибки всего файла (заголовок CSV, лимит строк) сохраняются в fatal и отменяют загрузку.
+    Args: text - тело запроса
+          fmt - ndjson или csv
+          publisher - издатель по умолчанию для строк без publisher_username
+          force_publisher - издатель, подставляемый во все строки (загрузка от имени самого издателя)
+    '''
+
+    def __init__(self, text: str, fmt: str, publisher: Optional[str] = None, force_publisher: Optional[str] = None):
+        self.text = text
+        self.fmt = fmt
+        self.publisher = force_publisher or publisher
+        self.force_publisher = force_publisher is not None
+        self.rows = 0
+        self.fatal: Optional[str] = None
+
+    def _ndjson_records(self) -> Iterator[Tuple[int, Optional[Dict[str, Any]], Optional[str]]]:
+        for line_no, line in enumerate(iter_lines(self.text), 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                yield line_no, None, 'Некорректный JSON'
+                continue
+            if not isinstance(record, dict):
+                yield line_no, None, 'Строка должна быть JSON-объектом'
+                continue
+            yield line_no, record, None
+
+    def _csv_records(self) -> Iterator[Tuple[int, Optional[Dict[str, Any]], Optional[str]]]:
+        reader = csv.reader(iter_lines(self.text))
+        header = [column.strip() for column in next(reader, [])]
+        unknown = [column for column in header if column not in IMPORT_COLUMNS]
+        if not header or unknown:
+            self.fatal = f"Неизвестные колонки CSV: {', '.join(unknown) or '(пустой заголовок)'}"
+            return
+        try:
+            for row in reader:
+                if not any(cell.strip() for cell in row):
+                    continue
+                if len(row) != len(header):
+                    yield reader.line_num, None, f'Ожидалось {len(header)} полей, получено {len(row)}'
+                    continue
+                yield reader.line_num, dict(zip(header, row)), None
+        except csv.Error as error:
+            self.fatal = f'Некорректный CSV в строке {reader.line_num}: {error}'
+
+    def _values(self, record: Dict[str, Any]) -> List[Optional[str]]:
+        values: List[Optional[str]] = []
+        for column in IMPORT_COLUMNS:
+            value = record.get(column)
+            if column == 'screenshots':
+                values.append(screenshots_json(value))
+                continue
+            if column == 'publisher_username' and (self.force_publisher or value in (None, '')):
+                value = self.publisher
+            if isinstance(value, (dict, list)):
+                raise ValueError(column)
+            value = None if value is None else str(value).strip()
+            values.append(value or None)
+        return values
+
+    def copy_lines(self) -> Iterator[str]:
+        records = self._ndjson_records() if self.fmt == 'ndjson' else self._csv_records()
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator='\n')
+        for row_no, record, error in records:
+            if self.rows >= MAX_IMPORT_ROWS:
+                self.fatal = f'Не более {MAX_IMPORT_ROWS} строк за одну загрузку'
+                return
+            self.rows += 1
+            values: List[Optional[str]] = [None] * len(IMPORT_COLUMNS)
+            if record is not None:
+                try:
+                    values = self._values(record)
+                except ValueError:
+                    error = 'Некорректное значение поля (screenshots - список URL, остальные - строки или числа)'
+            writer.writerow([row_no] + values + [error])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    def stream(self) -> CopyStream:
+        return CopyStream(self.copy_lines())
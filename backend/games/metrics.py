@@ -0,0 +1,143 @@
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, Callable, Iterator, List, Optional
+
+import psycopg2
+import psycopg2.extensions
+
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '100'))
+SERVER_TIMING_ENABLED = os.environ.get('SERVER_TIMING_ENABLED', '') in ('1', 'true')
+LOG_ENABLED = os.environ.get('REQUEST_LOG_ENABLED', '1') in ('1', 'true')
+
+_local = threading.local()
+
+
+class RequestMetrics:
+    '''
+    Business: Счётчики одного вызова функции: запросы к БД, их время и строки, время сериализации
+    '''
+
+    def __init__(self, request_id: str, function_name: str, method: str):
+        self.request_id = request_id
+        self.function_name = function_name
+        self.method = method
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.rows = 0
+        self.db_ms = 0.0
+        self.spans: Dict[str, float] = {}
+        self.slow_queries: List[Dict[str, Any]] = []
+        self.extra: Dict[str, Any] = {}
+
+    def record_query(self, query: str, elapsed_ms: float, rows: int, plan: Optional[Any]) -> None:
+        self.queries += 1
+        self.db_ms += elapsed_ms
+        self.rows += max(rows, 0)
+        if plan is not None:
+            self.slow_queries.append({'query': query[:500], 'ms': round(elapsed_ms, 2), 'rows': rows, 'plan': plan})
+
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def server_timing(self) -> str:
+        parts = [f'db;dur={self.db_ms:.1f};desc="{self.queries} queries"']
+        parts.extend(f'{name};dur={ms:.1f}' for name, ms in self.spans.items())
+        parts.append(f'total;dur={self.total_ms():.1f}')
+        return ', '.join(parts)
+
+
+def current() -> Optional[RequestMetrics]:
+    return getattr(_local, 'request', None)
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        request = current()
+        if request is not None:
+            request.spans[name] = request.spans.get(name, 0.0) + (time.perf_counter() - started) * 1000
+
+
+class TimedCursor(psycopg2.extensions.cursor):
+    '''
+    Business: Курсор, замеряющий каждый запрос; медленные запросы логируются вместе с EXPLAIN
+    '''
+
+    def execute(self, query: Any, vars: Any = None) -> None:
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            request = current()
+            if request is not None:
+                plan = self._explain(query, vars) if elapsed_ms >= SLOW_QUERY_MS else None
+                request.record_query(str(query), elapsed_ms, self.rowcount, plan)
+
+    def _explain(self, query: Any, vars: Any) -> Optional[Any]:
+        statement = self.mogrify(query, vars).decode('utf-8', 'replace')
+        if not statement.lstrip().upper().startswith(('SELECT', 'WITH', 'UPDATE', 'INSERT', 'DELETE')):
+            return None
+        if self.connection.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_INERROR:
+            return None
+        cur = self.connection.cursor(cursor_factory=psycopg2.extensions.cursor)
+        try:
+            cur.execute(f'EXPLAIN (FORMAT JSON) {statement}')
+            return cur.fetchone()[0][0].get('Plan')
+        except psycopg2.Error:
+            return None
+        finally:
+            cur.close()
+
+
+def instrumented(handler: Callable[[Dict[str, Any], Any], Dict[str, Any]]) -> Callable[[Dict[str, Any], Any], Dict[str, Any]]:
+    '''
+    Business: Обёртка обработчика: одна структурированная строка лога на вызов и опциональный Server-Timing
+    '''
+
+    @functools.wraps(handler)
+    def wrapper(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+        request = RequestMetrics(
+            getattr(context, 'request_id', ''),
+            getattr(context, 'function_name', ''),
+            event.get('httpMethod', 'GET')
+        )
+        _local.request = request
+        status_code = 500
+        try:
+            result = handler(event, context)
+            status_code = result.get('statusCode', 200)
+            if SERVER_TIMING_ENABLED:
+                result.setdefault('headers', {})['Server-Timing'] = request.server_timing()
+            return result
+        finally:
+            _local.request = None
+            if LOG_ENABLED:
+                log_request(request, status_code)
+
+    return wrapper
+
+
+def log_request(request: RequestMetrics, status_code: int) -> None:
+    record = {
+        'request_id': request.request_id,
+        'function_name': request.function_name,
+        'method': request.method,
+        'status': status_code,
+        'total_ms': round(request.total_ms(), 2),
+        'db_ms': round(request.db_ms, 2),
+        'queries': request.queries,
+        'rows': request.rows,
+        **{f'{name}_ms': round(ms, 2) for name, ms in request.spans.items()},
+        **request.extra
+    }
+    if request.slow_queries:
+        record['slow_queries'] = request.slow_queries
+    print(json.dumps(record, ensure_ascii=False, default=str), flush=True)
@@ -1,8 +1,54 @@
 import json
-import os
-import psycopg2
-from typing import Dict, Any
+from datetime import datetime
+from typing import Dict, Any, List, Tuple
 
+import cache
+import db
+import metrics
+import response
+import session
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 100
+MAX_CART_SIZE = 100
+
+LIST_CACHE_CONTROL = 'public, no-cache'
+
+FEED_INSERT_SQL = """INSERT INTO marketplace_feed (listing_id, seller_id, seller_username, item_type, item_id, item_name, item_image, price, created_at)
+   SELECT m.id, m.seller_id, u.username, m.item_type, m.item_id,
+   CASE 
+     WHEN m.item_type = 'game' THEN g.title
+     WHEN m.item_type = 'frame' THEN f.name
+   END,
+   CASE 
+     WHEN m.item_type = 'game' THEN g.logo_url
+     WHEN m.item_type = 'frame' THEN f.image_url
+   END,
+   m.price, m.created_at
+   FROM marketplace_items m
+   JOIN users u ON m.seller_id = u.id
+   LEFT JOIN games g ON m.item_type = 'game' AND m.item_id = g.id
+   LEFT JOIN frames f ON m.item_type = 'frame' AND m.item_id = f.id
+   WHERE m.id = %s"""
+
+BUY_ERRORS = {
+    'not_found': (404, 'Товар не найден'),
+    'sold': (409, 'Товар уже продан'),
+    'buyer_not_found': (404, 'Покупатель не найден'),
+    'insufficient_funds': (400, 'Недостаточно средств')
+}
+
+
+def format_cursor(created_at: datetime, listing_id: int) -> str:
+    return f'{created_at.isoformat()}_{listing_id}'
+
+
+def parse_cursor(cursor: str) -> Tuple[datetime, int]:
+    created_at, _, listing_id = cursor.rpartition('_')
+    return datetime.fromisoformat(created_at), int(listing_id)
+
+
+@metrics.instrumented
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Business: Торговая площадка для игр и рамок
@@ -13,133 +59,138 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, PUT, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': ''
-        }
+        return response.preflight_response()
     
-    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    conn = db.acquire()
     cur = conn.cursor()
     
     try:
         if method == 'GET':
+            params = event.get('queryStringParameters', {}) or {}
+            
+            try:
+                limit = min(int(params.get('limit', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+                cursor = parse_cursor(params['cursor']) if params.get('cursor') else None
+                min_price = float(params['min_price']) if params.get('min_price') else None
+                max_price = float(params['max_price']) if params.get('max_price') else None
+            except ValueError:
+                return response.error_response(400, 'Некорректные параметры пагинации или фильтра')
+            if limit < 1:
+                limit = DEFAULT_PAGE_SIZE
+            
+            etag = cache.make_etag(cache.read_versions(cur, ['marketplace_feed']))
+            if cache.is_not_modified(event, etag):
+                return cache.not_modified_response(etag, LIST_CACHE_CONTROL)
+            
+            conditions = ['true']
+            args: List[Any] = []
+            if cursor is not None:
+                conditions.append('(created_at, listing_id) < (%s, %s)')
+                args.extend(cursor)
+            if params.get('item_type'):
+                conditions.append('item_type = %s')
+                args.append(params['item_type'])
+            if min_price is not None:
+                conditions.append('price >= %s')
+                args.append(min_price)
+            if max_price is not None:
+                conditions.append('price <= %s')
+                args.append(max_price)
+            args.append(limit + 1)
+            
             cur.execute(
-                """SELECT m.id, m.seller_id, m.item_type, m.item_id, m.price, u.username,
-                   CASE 
-                     WHEN m.item_type = 'game' THEN g.title
-                     WHEN m.item_type = 'frame' THEN f.name
-                   END as item_name,
-                   CASE 
-                     WHEN m.item_type = 'game' THEN g.logo_url
-                     WHEN m.item_type = 'frame' THEN f.image_url
-                   END as item_image
-                   FROM marketplace_items m
-                   JOIN users u ON m.seller_id = u.id
-                   LEFT JOIN games g ON m.item_type = 'game' AND m.item_id = g.id
-                   LEFT JOIN frames f ON m.item_type = 'frame' AND m.item_id = f.id
-                   WHERE m.status = 'active'
-                   ORDER BY m.created_at DESC"""
+                f"""SELECT listing_id AS id, seller_id, item_type, item_id, price, seller_username, item_name, item_image,
+                          image_variant_url(item_image, 'card') AS item_image_card_url, created_at
+                   FROM marketplace_feed
+                   WHERE {' AND '.join(conditions)}
+                   ORDER BY created_at DESC, listing_id DESC
+                   LIMIT %s""",
+                tuple(args)
             )
+            items = response.rows_to_dicts(cur, cur.fetchall())
             
-            items = []
-            for item in cur.fetchall():
-                items.append({
-                    'id': item[0],
-                    'seller_id': item[1],
-                    'item_type': item[2],
-                    'item_id': item[3],
-                    'price': float(item[4]),
-                    'seller_username': item[5],
-                    'item_name': item[6],
-                    'item_image': item[7]
-                })
+            last = items[limit - 1] if len(items) > limit else None
+            next_cursor = format_cursor(last['created_at'], last['id']) if last else None
             
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'isBase64Encoded': False,
-                'body': json.dumps({'items': items})
-            }
+            return response.json_response(
+                200,
+                {'items': items[:limit], 'next_cursor': next_cursor},
+                cache.etag_headers(etag, LIST_CACHE_CONTROL),
+                event
+            )
         
         elif method == 'POST':
             body_data = json.loads(event.get('body', '{}'))
             action = body_data.get('action')
+            try:
+                claims = session.authenticate(event, cur)
+            except session.SessionError as error:
+                return response.error_response(401, str(error))
+            actor_id = claims['uid'] if claims else None
             
             if action == 'sell':
                 cur.execute(
                     "INSERT INTO marketplace_items (seller_id, item_type, item_id, price) VALUES (%s, %s, %s, %s) RETURNING id",
-                    (body_data.get('seller_id'), body_data.get('item_type'), body_data.get('item_id'), body_data.get('price'))
+                    (actor_id or body_data.get('seller_id'), body_data.get('item_type'), body_data.get('item_id'), body_data.get('price'))
                 )
                 item_id = cur.fetchone()[0]
+                cur.execute(FEED_INSERT_SQL, (item_id,))
                 conn.commit()
                 
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'isBase64Encoded': False,
-                    'body': json.dumps({'item_id': item_id, 'message': 'Товар выставлен на продажу'})
-                }
+                return response.json_response(200, {'item_id': item_id, 'message': 'Товар выставлен на продажу'})
             
             elif action == 'buy':
                 item_id = body_data.get('item_id')
-                buyer_id = body_data.get('buyer_id')
+                buyer_id = actor_id or body_data.get('buyer_id')
                 
-                cur.execute("SELECT seller_id, item_type, item_id, price FROM marketplace_items WHERE id = %s AND status = 'active'", (item_id,))
-                item = cur.fetchone()
+                cur.execute("SELECT status, buyer_balance FROM marketplace_buy(%s, %s)", (item_id, buyer_id))
+                status, buyer_balance = cur.fetchone()
                 
-                if not item:
-                    return {
-                        'statusCode': 404,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'isBase64Encoded': False,
-                        'body': json.dumps({'error': 'Товар не найден'})
-                    }
+                if status != 'ok':
+                    conn.rollback()
+                    status_code, error = BUY_ERRORS[status]
+                    return response.error_response(status_code, error, status=status)
                 
-                seller_id, item_type, item_ref_id, price = item
-                seller_gets = float(price) * 0.9
+                conn.commit()
                 
-                cur.execute("SELECT balance FROM users WHERE id = %s", (buyer_id,))
-                buyer_balance = cur.fetchone()[0]
+                return response.json_response(200, {'success': True, 'message': 'Покупка успешна!', 'balance': buyer_balance})
+            
+            elif action == 'checkout':
+                buyer_id = actor_id or body_data.get('buyer_id')
+                item_ids = body_data.get('item_ids') or []
+                all_or_nothing = body_data.get('mode', 'all_or_nothing') != 'best_effort'
                 
-                if float(buyer_balance) < float(price):
-                    return {
-                        'statusCode': 400,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'isBase64Encoded': False,
-                        'body': json.dumps({'error': 'Недостаточно средств'})
-                    }
+                if not isinstance(item_ids, list) or not item_ids or len(item_ids) > MAX_CART_SIZE:
+                    return response.error_response(400, f'В корзине должно быть от 1 до {MAX_CART_SIZE} товаров')
+                try:
+                    item_ids = [int(item_id) for item_id in item_ids]
+                except (TypeError, ValueError):
+                    return response.error_response(400, 'item_ids должен быть списком целых id лотов')
                 
-                cur.execute("UPDATE users SET balance = balance - %s WHERE id = %s", (price, buyer_id))
-                cur.execute("UPDATE users SET balance = balance + %s WHERE id = %s", (seller_gets, seller_id))
+                cur.execute(
+                    "SELECT listing_id, status, price, buyer_balance FROM marketplace_checkout(%s::integer[], %s, %s)",
+                    (item_ids, buyer_id, all_or_nothing)
+                )
+                rows = cur.fetchall()
+                results = [{'item_id': row[0], 'status': row[1]} for row in rows]
+                purchased = sum(1 for row in rows if row[1] == 'ok')
                 
-                if item_type == 'game':
-                    cur.execute("INSERT INTO user_games (user_id, game_id) VALUES (%s, %s) ON CONFLICT DO NOTHING", (buyer_id, item_ref_id))
-                elif item_type == 'frame':
-                    cur.execute("INSERT INTO user_frames (user_id, frame_id) VALUES (%s, %s) ON CONFLICT DO NOTHING", (buyer_id, item_ref_id))
+                if purchased == 0 or (all_or_nothing and purchased < len(rows)):
+                    conn.rollback()
+                    return response.error_response(409, 'Не удалось оформить корзину', results=results)
                 
-                cur.execute("UPDATE marketplace_items SET status = 'sold' WHERE id = %s", (item_id,))
                 conn.commit()
                 
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'isBase64Encoded': False,
-                    'body': json.dumps({'success': True, 'message': 'Покупка успешна!'})
-                }
+                return response.json_response(200, {
+                    'success': True,
+                    'purchased': purchased,
+                    'total': sum(row[2] for row in rows if row[1] == 'ok'),
+                    'balance': rows[0][3],
+                    'results': results
+                })
         
-        return {
-            'statusCode': 405,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'isBase64Encoded': False,
-            'body': json.dumps({'error': 'Method not allowed'})
-        }
+        return response.error_response(405, 'Method not allowed')
     
     finally:
         cur.close()
-        conn.close()
+        db.release(conn)
@@ -0,0 +1,154 @@
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+from typing import Dict, Any, List, Optional
+
+ACCESS_TOKEN_TTL = int(os.environ.get('SESSION_ACCESS_TTL', '900'))
+REFRESH_TOKEN_TTL = int(os.environ.get('SESSION_REFRESH_TTL', str(30 * 24 * 3600)))
+REVOCATION_REFRESH_INTERVAL = float(os.environ.get('SESSION_REVOCATION_REFRESH', '30'))
+
+
+class SessionError(Exception):
+    pass
+
+
+class SessionConfigError(RuntimeError):
+    pass
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+
+def is_configured() -> bool:
+    return bool(os.environ.get('SESSION_SECRET'))
+
+
+def _signature(payload: str) -> str:
+    if not is_configured():
+        raise SessionConfigError('Не задан SESSION_SECRET: подпись сессий невозможна')
+    secret = os.environ['SESSION_SECRET'].encode('utf-8')
+    return _b64encode(hmac.new(secret, payload.encode('ascii'), hashlib.sha256).digest())
+
+
+def sign(claims: Dict[str, Any]) -> str:
+    payload = _b64encode(json.dumps(claims, separators=(',', ':')).encode('utf-8'))
+    return f'{payload}.{_signature(payload)}'
+
+
+def issue_tokens(user: Dict[str, Any]) -> Dict[str, Any]:
+    '''
+    Business: Выпуск пары подписанных токенов (access + refresh) для пользователя
+    Args: user - dict с id, role, is_banned
+    Returns: dict с token, refresh_token, expires_in
+    '''
+    now = int(time.time())
+    claims = {'uid': user['id'], 'role': user['role'], 'ban': bool(user['is_banned']), 'iat': now}
+    return {
+        'token': sign({**claims, 'typ': 'access', 'exp': now + ACCESS_TOKEN_TTL}),
+        'refresh_token': sign({**claims, 'typ': 'refresh', 'exp': now + REFRESH_TOKEN_TTL}),
+        'expires_in': ACCESS_TOKEN_TTL
+    }
+
+
+def verify(token: str, token_type: str = 'access') -> Dict[str, Any]:
+    payload, _, signature = token.partition('.')
+    # Не-ASCII символы в токене ломают кодирование подписи и base64: это подделка, а не ошибка сервера
+    try:
+        if not signature or not hmac.compare_digest(signature.encode('ascii'), _signature(payload).encode('ascii')):
+            raise SessionError('Недействительный токен')
+        claims = json.loads(_b64decode(payload))
+    except (UnicodeError, binascii.Error, ValueError):
+        raise SessionError('Недействительный токен')
+    if claims.get('typ') != token_type:
+        raise SessionError('Неверный тип токена')
+    if claims.get('exp', 0) < time.time():
+        raise SessionError('Срок действия токена истёк')
+    return claims
+
+
+class RevocationList:
+    '''
+    Business: Список отозванных сессий (баны), перечитываемый из БД не чаще раза в REVOCATION_REFRESH_INTERVAL
+    Хранятся только отзывы за последние REFRESH_TOKEN_TTL секунд: более ранние токены уже истекли.
+    '''
+
+    def __init__(self, refresh_interval: float):
+        self.refresh_interval = refresh_interval
+        self._revoked: Dict[int, float] = {}
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def _refresh(self, cur: Any) -> None:
+        cur.execute(
+            "SELECT user_id, extract(epoch FROM revoked_at) FROM session_revocations WHERE revoked_at > now() - make_interval(secs => %s)",
+            (REFRESH_TOKEN_TTL,)
+        )
+        revoked = {row[0]: float(row[1]) for row in cur.fetchall()}
+        with self._lock:
+            self._revoked = revoked
+            self._loaded_at = time.monotonic()
+
+    def is_revoked(self, cur: Any, claims: Dict[str, Any]) -> bool:
+        if time.monotonic() - self._loaded_at > self.refresh_interval:
+            self._refresh(cur)
+        with self._lock:
+            revoked_at = self._revoked.get(claims['uid'])
+        return revoked_at is not None and claims['iat'] <= revoked_at
+
+    def add(self, user_id: int) -> None:
+        with self._lock:
+            self._revoked[user_id] = time.time()
+
+
+_revocations = RevocationList(REVOCATION_REFRESH_INTERVAL)
+
+
+def bearer_token(event: Dict[str, Any]) -> Optional[str]:
+    headers = event.get('headers') or {}
+    value = next((v for k, v in headers.items() if k.lower() in ('authorization', 'x-auth-token')), None)
+    if not value:
+        return None
+    return value[7:].strip() if value.lower().startswith('bearer ') else value.strip()
+
+
+def authenticate(event: Dict[str, Any], cur: Any) -> Optional[Dict[str, Any]]:
+    '''
+    Business: Проверка access-токена из заголовка Authorization без обращения к таблице users
+    Args: event - событие с headers
+          cur - курсор, нужен только для периодического обновления списка отзывов
+    Returns: claims токена или None, если токен не передан; SessionError при невалидном токене
+    '''
+    token = bearer_token(event)
+    if token is None:
+        return None
+    claims = verify(token)
+    if claims.get('ban') or _revocations.is_revoked(cur, claims):
+        raise SessionError('Данный аккаунт заблокирован Администрацией')
+    return claims
+
+
+def is_revoked(cur: Any, claims: Dict[str, Any]) -> bool:
+    return _revocations.is_revoked(cur, claims)
+
+
+def revoke_user(cur: Any, user_id: int) -> None:
+    revoke_users(cur, [user_id])
+
+
+def revoke_users(cur: Any, user_ids: List[int]) -> None:
+    cur.execute(
+        "INSERT INTO session_revocations (user_id) SELECT unnest(%s::integer[]) ON CONFLICT (user_id) DO UPDATE SET revoked_at = now()",
+        (list(user_ids),)
+    )
+    for user_id in user_ids:
+        _revocations.add(user_id)
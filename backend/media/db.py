@@ -0,0 +1,152 @@
+import os
+import threading
+import time
+import psycopg2
+import psycopg2.extensions
+from typing import Dict, Any, List, Optional
+
+import metrics
+
+
+class PoolExhausted(Exception):
+    pass
+
+
+class ConnectionPool:
+    '''
+    Business: Пул соединений PostgreSQL, живущий на уровне модуля между тёплыми вызовами функции
+    Args: dsn - строка подключения к БД
+          max_size - максимум одновременно открытых соединений
+          healthcheck_interval - через сколько секунд простоя соединение проверяется SELECT 1
+          acquire_timeout - сколько секунд ждать свободное соединение при исчерпании пула
+    '''
+
+    def __init__(self, dsn: str, max_size: int = 4, healthcheck_interval: float = 30.0, acquire_timeout: float = 5.0):
+        self.dsn = dsn
+        self.max_size = max_size
+        self.healthcheck_interval = healthcheck_interval
+        self.acquire_timeout = acquire_timeout
+        self._idle: List[Any] = []
+        self._last_used: Dict[int, float] = {}
+        self._opened = 0
+        self._lock = threading.Condition()
+        self.hits = 0
+        self.misses = 0
+        self.reconnects = 0
+        self.discarded = 0
+
+    def _connect(self) -> Any:
+        return psycopg2.connect(self.dsn, cursor_factory=metrics.TimedCursor)
+
+    def _is_healthy(self, conn: Any) -> bool:
+        if conn.closed:
+            return False
+        idle_for = time.monotonic() - self._last_used.get(id(conn), 0.0)
+        if idle_for < self.healthcheck_interval:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute('SELECT 1')
+            cur.close()
+            conn.rollback()
+            return True
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            return False
+
+    def _drop(self, conn: Any) -> None:
+        self._last_used.pop(id(conn), None)
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+        with self._lock:
+            self._opened -= 1
+            self.discarded += 1
+            self._lock.notify()
+
+    def acquire(self) -> Any:
+        deadline = time.monotonic() + self.acquire_timeout
+        while True:
+            with self._lock:
+                conn: Optional[Any] = self._idle.pop() if self._idle else None
+                if conn is None:
+                    if self._opened >= self.max_size:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise PoolExhausted(f'Все {self.max_size} соединений заняты')
+                        self._lock.wait(remaining)
+                        continue
+                    self._opened += 1
+                    self.misses += 1
+
+            if conn is None:
+                try:
+                    return self._connect()
+                except Exception:
+                    with self._lock:
+                        self._opened -= 1
+                        self._lock.notify()
+                    raise
+
+            if self._is_healthy(conn):
+                with self._lock:
+                    self.hits += 1
+                return conn
+
+            self._drop(conn)
+            with self._lock:
+                self.reconnects += 1
+
+    def release(self, conn: Any) -> None:
+        if conn.closed:
+            self._drop(conn)
+            return
+        if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                self._drop(conn)
+                return
+        self._last_used[id(conn)] = time.monotonic()
+        with self._lock:
+            self._idle.append(conn)
+            self._lock.notify()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'reconnects': self.reconnects,
+                'discarded': self.discarded,
+                'open': self._opened,
+                'idle': len(self._idle)
+            }
+
+
+_pool: Optional[ConnectionPool] = None
+
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    if _pool is None:
+        _pool = ConnectionPool(
+            os.environ['DATABASE_URL'],
+            max_size=int(os.environ.get('DB_POOL_MAX_SIZE', '4')),
+            healthcheck_interval=float(os.environ.get('DB_POOL_HEALTHCHECK_INTERVAL', '30'))
+        )
+    return _pool
+
+
+def acquire() -> Any:
+    pool = get_pool()
+    misses = pool.misses
+    conn = pool.acquire()
+    request = metrics.current()
+    if request is not None:
+        request.extra['pool_miss'] = pool.misses > misses
+    return conn
+
+
+def release(conn: Any) -> None:
+    get_pool().release(conn)
@@ -0,0 +1,101 @@
+import hashlib
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Tuple
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+    ImageOps = None
+
+import storage
+
+# Вариант -> наибольшая сторона в пикселях; меньшие изображения не растягиваются
+VARIANTS = {'thumb': 96, 'card': 320, 'large': 1024}
+VARIANT_FORMAT = 'WEBP'
+VARIANT_QUALITY = int(os.environ.get('ASSET_WEBP_QUALITY', '80'))
+MAX_PIXELS = int(os.environ.get('ASSET_MAX_PIXELS', str(40_000_000)))
+ORIGINAL_FORMATS = {'JPEG': ('jpg', 'image/jpeg'), 'PNG': ('png', 'image/png'), 'WEBP': ('webp', 'image/webp'), 'GIF': ('gif', 'image/gif')}
+
+# Пул живёт между тёплыми вызовами; Pillow отпускает GIL при декодировании и масштабировании
+_pool = ThreadPoolExecutor(max_workers=int(os.environ.get('ASSET_WORKERS', '4')), thread_name_prefix='assets')
+
+if Image is not None:
+    Image.MAX_IMAGE_PIXELS = MAX_PIXELS
+
+
+class ImageError(Exception):
+    pass
+
+
+def available() -> bool:
+    return Image is not None
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def asset_key(digest: str, name: str) -> str:
+    return f'{digest[:2]}/{digest}/{name}'
+
+
+def render_variant(image: Any, size: int) -> bytes:
+    variant = image.copy()
+    variant.thumbnail((size, size), Image.LANCZOS)
+    if variant.mode not in ('RGB', 'RGBA'):
+        variant = variant.convert('RGBA' if 'A' in variant.getbands() or 'transparency' in variant.info else 'RGB')
+    buffer = io.BytesIO()
+    variant.save(buffer, VARIANT_FORMAT, quality=VARIANT_QUALITY, method=4)
+    return buffer.getvalue()
+
+
+def process(data: bytes) -> Dict[str, Any]:
+    '''
+    Business: Проверка изображения, варианты размеров в WebP и запись оригинала и вариантов в хранилище
+    Args: data - содержимое загруженного файла
+    Returns: dict с content_hash, url, mime_type, width, height, bytes, variants; ImageError для не-изображений
+    '''
+    digest = content_hash(data)
+    try:
+        with Image.open(io.BytesIO(data)) as probe:
+            probe.verify()
+        image = Image.open(io.BytesIO(data))
+        original_format = image.format
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError) as error:
+        raise ImageError(f'Файл не является изображением: {error}')
+    if original_format not in ORIGINAL_FORMATS:
+        raise ImageError(f'Формат {original_format} не поддерживается')
+
+    target = storage.get_storage()
+    extension, mime_type = ORIGINAL_FORMATS[original_format]
+    variants = {name: target.put(asset_key(digest, f'{name}.webp'), render_variant(image, size), 'image/webp') for name, size in VARIANTS.items()}
+    url = target.put(asset_key(digest, f'original.{extension}'), data, mime_type)
+    return {
+        'content_hash': digest,
+        'url': url,
+        'mime_type': mime_type,
+        'width': image.width,
+        'height': image.height,
+        'bytes': len(data),
+        'variants': variants
+    }
+
+
+def process_many(images: List[bytes]) -> List[Tuple[Dict[str, Any], str]]:
+    '''
+    Business: Обработка пакета изображений в пуле потоков
+    Returns: для каждого изображения (результат process, текст ошибки) в исходном порядке
+    '''
+    futures = [_pool.submit(process, data) for data in images]
+    results: List[Tuple[Dict[str, Any], str]] = []
+    for future in futures:
+        try:
+            results.append((future.result(), ''))
+        except ImageError as error:
+            results.append(({}, str(error)))
+    return results
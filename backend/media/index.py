@@ -0,0 +1,159 @@
+import base64
+import binascii
+import json
+from typing import Dict, Any, List
+
+import db
+import images
+import metrics
+import response
+import session
+import storage
+
+MAX_IMAGE_BYTES = 10 * 2 ** 20
+MAX_BATCH = 10
+
+ASSET_COLUMNS = 'content_hash, url, mime_type, width, height, bytes, variants'
+
+INSERT_ASSETS_SQL = f'''INSERT INTO image_assets (content_hash, url, mime_type, width, height, bytes, variants, uploaded_by)
+SELECT * FROM unnest(%(hashes)s::char(64)[], %(urls)s::text[], %(mime_types)s::varchar[], %(widths)s::integer[],
+                     %(heights)s::integer[], %(sizes)s::integer[], %(variants)s::jsonb[], %(uploaded_by)s::integer[])
+ON CONFLICT (content_hash) DO NOTHING'''
+
+
+def decode_images(items: List[Any]) -> List[bytes]:
+    '''
+    Business: Декодирование base64 из тела запроса (допускается префикс data:image/...;base64,)
+    Returns: содержимое файлов; ValueError с текстом для ответа 400
+    '''
+    decoded: List[bytes] = []
+    for item in items:
+        data = item.get('data') if isinstance(item, dict) else item
+        if not isinstance(data, str) or not data:
+            raise ValueError('Каждое изображение: поле data с base64')
+        if data.startswith('data:'):
+            data = data.partition(',')[2]
+        try:
+            content = base64.b64decode(data, validate=True)
+        except (binascii.Error, ValueError):
+            raise ValueError('Некорректный base64 в поле data')
+        if len(content) > MAX_IMAGE_BYTES:
+            raise ValueError(f'Изображение больше {MAX_IMAGE_BYTES // 2 ** 20} МБ')
+        decoded.append(content)
+    return decoded
+
+
+def upload(contents: List[bytes], cur: Any, user_id: int) -> List[Dict[str, Any]]:
+    '''
+    Business: Загрузка пакета: повторное содержимое берётся из image_assets, новое обрабатывается в пуле и сохраняется
+    Returns: для каждого изображения в исходном порядке url, variants, width, height, deduplicated или error
+    '''
+    hashes = [images.content_hash(content) for content in contents]
+    cur.execute(f"SELECT {ASSET_COLUMNS} FROM image_assets WHERE content_hash = ANY(%s)", (list(set(hashes)),))
+    known = {row['content_hash']: row for row in response.rows_to_dicts(cur, cur.fetchall())}
+
+    # Одинаковые файлы внутри пакета обрабатываются один раз
+    pending = {digest: content for digest, content in zip(hashes, contents) if digest not in known}
+    with metrics.span('images'):
+        processed = dict(zip(pending, images.process_many(list(pending.values()))))
+
+    created = [asset for asset, error in processed.values() if not error]
+    if created:
+        cur.execute(INSERT_ASSETS_SQL, {
+            'hashes': [asset['content_hash'] for asset in created],
+            'urls': [asset['url'] for asset in created],
+            'mime_types': [asset['mime_type'] for asset in created],
+            'widths': [asset['width'] for asset in created],
+            'heights': [asset['height'] for asset in created],
+            'sizes': [asset['bytes'] for asset in created],
+            'variants': [json.dumps(asset['variants']) for asset in created],
+            'uploaded_by': [user_id] * len(created)
+        })
+
+    results: List[Dict[str, Any]] = []
+    for digest in hashes:
+        if digest in known:
+            asset, error, deduplicated = known[digest], '', True
+        else:
+            (asset, error), deduplicated = processed[digest], False
+        if error:
+            results.append({'error': error})
+            continue
+        results.append({
+            'content_hash': digest,
+            'url': asset['url'],
+            'variants': asset['variants'],
+            'width': asset['width'],
+            'height': asset['height'],
+            'deduplicated': deduplicated
+        })
+    return results
+
+
+@metrics.instrumented
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    '''
+    Business: Загрузка изображений (логотипы, скриншоты, рамки, аватары) с вариантами размеров для списков
+    Args: event - dict с httpMethod, body, queryStringParameters, headers (для загрузки нужен Authorization)
+          context - объект с атрибутами request_id, function_name
+    Returns: HTTP response dict
+    '''
+    method: str = event.get('httpMethod', 'GET')
+    
+    if method == 'OPTIONS':
+        return response.preflight_response('GET, POST, OPTIONS')
+    
+    conn = db.acquire()
+    cur = conn.cursor()
+    
+    try:
+        if method == 'GET':
+            params = event.get('queryStringParameters', {}) or {}
+            
+            if params.get('hash'):
+                cur.execute(f"SELECT {ASSET_COLUMNS} FROM image_assets WHERE content_hash = %s", (params['hash'].lower(),))
+            elif params.get('url'):
+                cur.execute(f"SELECT {ASSET_COLUMNS} FROM image_assets WHERE url = %s", (params['url'],))
+            else:
+                return response.error_response(400, 'Укажите hash или url')
+            
+            asset = response.row_to_dict(cur, cur.fetchone())
+            if not asset:
+                return response.error_response(404, 'Изображение не найдено')
+            
+            return response.json_response(200, {'asset': asset}, {'Cache-Control': 'public, max-age=3600'}, event=event)
+        
+        elif method == 'POST':
+            try:
+                claims = session.authenticate(event, cur)
+            except session.SessionError as error:
+                return response.error_response(401, str(error))
+            if not claims:
+                return response.error_response(401, 'Требуется авторизация')
+            
+            body_data = json.loads(event.get('body') or '{}')
+            action = body_data.get('action', 'upload')
+            
+            if action == 'upload':
+                items = body_data.get('images') or []
+                if not items or len(items) > MAX_BATCH:
+                    return response.error_response(400, f'Передайте от 1 до {MAX_BATCH} изображений')
+                try:
+                    contents = decode_images(items)
+                except ValueError as error:
+                    return response.error_response(400, str(error))
+                if not images.available():
+                    return response.error_response(503, 'Обработка изображений недоступна')
+                if not storage.is_configured():
+                    return response.error_response(500, 'Хранилище изображений не настроено: задайте ASSET_BASE_URL (и ASSET_BUCKET для s3)')
+                
+                results = upload(contents, cur, claims['uid'])
+                conn.commit()
+                
+                return response.json_response(200, {'images': results})
+        
+        return response.error_response(405, 'Method not allowed')
+    
+    finally:
+        cur.close()
+        db.release(conn)
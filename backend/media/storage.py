@@ -0,0 +1,106 @@
+import abc
+import os
+import threading
+from typing import Optional
+
+try:
+    import boto3
+except ImportError:
+    boto3 = None
+
+STORAGE_BACKEND = os.environ.get('ASSET_STORAGE', 'local')
+CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+class StorageConfigError(RuntimeError):
+    pass
+
+
+class Storage(abc.ABC):
+    '''
+    Business: Хранилище файлов изображений; ключи содержат хеш содержимого, поэтому файлы никогда не перезаписываются
+    '''
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip('/')
+
+    def url(self, key: str) -> str:
+        return f'{self.base_url}/{key}'
+
+    @abc.abstractmethod
+    def put(self, key: str, data: bytes, content_type: str) -> str:
+        ...
+
+
+class LocalStorage(Storage):
+    '''
+    Business: Файлы в локальном каталоге (разработка, тесты, диск за nginx)
+    Args: root - каталог для файлов
+          base_url - URL, по которому каталог раздаётся
+    '''
+
+    def __init__(self, root: str, base_url: str):
+        super().__init__(base_url)
+        self.root = root
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split('/'))
+
+    def put(self, key: str, data: bytes, content_type: str) -> str:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Запись во временный файл и rename: параллельная загрузка того же содержимого не увидит половину файла
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return self.url(key)
+
+
+class ObjectStorage(Storage):
+    '''
+    Business: S3-совместимое объектное хранилище (бакет за CDN)
+    Args: bucket - имя бакета
+          base_url - публичный URL бакета или CDN
+          endpoint_url - адрес S3 API, если это не AWS
+    '''
+
+    def __init__(self, bucket: str, base_url: str, endpoint_url: Optional[str] = None):
+        if boto3 is None:
+            raise RuntimeError('Для ASSET_STORAGE=s3 нужен пакет boto3')
+        super().__init__(base_url)
+        self.bucket = bucket
+        self.client = boto3.client('s3', endpoint_url=endpoint_url)
+
+    def put(self, key: str, data: bytes, content_type: str) -> str:
+        self.client.put_object(Bucket=self.bucket, Key=key, Body=data, ContentType=content_type, CacheControl=CACHE_CONTROL)
+        return self.url(key)
+
+
+_storage: Optional[Storage] = None
+_storage_lock = threading.Lock()
+
+
+def is_configured() -> bool:
+    # Без ASSET_BASE_URL в image_assets попали бы URL, по которым файлы никто не раздаёт
+    return bool(os.environ.get('ASSET_BASE_URL')) and (STORAGE_BACKEND != 's3' or bool(os.environ.get('ASSET_BUCKET')))
+
+
+def get_storage() -> Storage:
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            if not is_configured():
+                raise StorageConfigError('Не задан ASSET_BASE_URL (и ASSET_BUCKET для s3): сохранение изображений невозможно')
+            if STORAGE_BACKEND == 's3':
+                _storage = ObjectStorage(
+                    os.environ['ASSET_BUCKET'],
+                    os.environ['ASSET_BASE_URL'],
+                    os.environ.get('ASSET_S3_ENDPOINT_URL')
+                )
+            else:
+                _storage = LocalStorage(
+                    os.environ.get('ASSET_LOCAL_ROOT', '/tmp/assets'),
+                    os.environ['ASSET_BASE_URL']
+                )
+        return _storage
@@ -0,0 +1,210 @@
+import json
+import select
+import time
+from typing import Dict, Any, List
+
+import db
+import metrics
+import response
+import session
+
+DEFAULT_PAGE_SIZE = 30
+MAX_PAGE_SIZE = 100
+MAX_MESSAGE_LENGTH = 2000
+MAX_RECEIPTS = 100
+DEFAULT_POLL_TIMEOUT = 20.0
+MAX_POLL_TIMEOUT = 25.0
+
+MESSAGE_COLUMNS = 'id, sender_id, recipient_id, message, created_at, read_at'
+
+# Отправка: сообщение и обе строки диалога (у получателя растёт счётчик непрочитанных) одним запросом.
+# Параллельные отправки коммитятся не в порядке id, поэтому last_message_id только растёт (greatest)
+SEND_SQL = f'''WITH m AS (
+    INSERT INTO messages (sender_id, recipient_id, message)
+    SELECT %(sender_id)s, u.id, %(message)s FROM users u WHERE u.id = %(recipient_id)s AND NOT u.is_banned
+    RETURNING {MESSAGE_COLUMNS}
+), c AS (
+    INSERT INTO conversations (user_id, peer_id, last_message_id, unread_count)
+    SELECT sender_id, recipient_id, id, 0 FROM m
+    UNION ALL
+    SELECT recipient_id, sender_id, id, 1 FROM m
+    ON CONFLICT (user_id, peer_id) DO UPDATE
+    SET last_message_id = greatest(conversations.last_message_id, EXCLUDED.last_message_id), unread_count = conversations.unread_count + EXCLUDED.unread_count
+)
+SELECT {MESSAGE_COLUMNS} FROM m'''
+
+# Пакет отметок о прочтении: (собеседник, прочитано до id) -> отметки в messages и уменьшение счётчиков диалогов
+READ_SQL = '''WITH receipts AS (
+    SELECT * FROM unnest(%(peer_ids)s::integer[], %(up_to_ids)s::integer[]) AS r(peer_id, up_to_id)
+), marked AS (
+    UPDATE messages m SET read_at = now()
+    FROM receipts r
+    WHERE m.recipient_id = %(user_id)s AND m.sender_id = r.peer_id AND m.id <= r.up_to_id AND m.read_at IS NULL
+    RETURNING m.sender_id
+)
+UPDATE conversations c SET unread_count = greatest(c.unread_count - x.n, 0)
+FROM (SELECT sender_id, count(*) AS n FROM marked GROUP BY sender_id) x
+WHERE c.user_id = %(user_id)s AND c.peer_id = x.sender_id
+RETURNING c.peer_id, c.unread_count'''
+
+
+def inbox_channel(user_id: int) -> str:
+    return f'inbox_{int(user_id)}'
+
+
+def fetch_inbound(cur: Any, user_id: int, since: int) -> List[Dict[str, Any]]:
+    cur.execute(
+        f"SELECT {MESSAGE_COLUMNS} FROM messages WHERE recipient_id = %s AND id > %s ORDER BY id LIMIT %s",
+        (user_id, since, MAX_PAGE_SIZE)
+    )
+    return response.rows_to_dicts(cur, cur.fetchall())
+
+
+def wait_for_inbound(conn: Any, cur: Any, user_id: int, since: int, timeout: float) -> List[Dict[str, Any]]:
+    '''
+    Business: Long-poll входящих: LISTEN на канал пользователя и ожидание NOTIFY от отправки вместо частого опроса
+    Args: since - id последнего полученного сообщения
+          timeout - сколько секунд держать запрос, если новых сообщений нет
+    Returns: новые входящие сообщения (пустой список по таймауту)
+    '''
+    # authenticate мог открыть транзакцию (перечитывание списка отзывов); autocommit внутри неё не включить
+    conn.rollback()
+    conn.autocommit = True
+    cur.execute(f'LISTEN {inbox_channel(user_id)}')
+    try:
+        # Проверка после LISTEN: сообщение, пришедшее между запросом клиента и подпиской, не потеряется
+        messages = fetch_inbound(cur, user_id, since)
+        deadline = time.monotonic() + timeout
+        while not messages:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([conn], [], [], remaining)[0]:
+                break
+            conn.poll()
+            if conn.notifies:
+                conn.notifies.clear()
+                messages = fetch_inbound(cur, user_id, since)
+        return messages
+    finally:
+        cur.execute('UNLISTEN *')
+        conn.autocommit = False
+
+
+@metrics.instrumented
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    '''
+    Business: Личные сообщения: отправка, список диалогов, лента диалога, отметки о прочтении, long-poll входящих
+    Args: event - dict с httpMethod, body, queryStringParameters, headers (Authorization обязателен)
+          context - объект с атрибутами request_id, function_name
+    Returns: HTTP response dict
+    '''
+    method: str = event.get('httpMethod', 'GET')
+    
+    if method == 'OPTIONS':
+        return response.preflight_response('GET, POST, OPTIONS')
+    
+    conn = db.acquire()
+    cur = conn.cursor()
+    
+    try:
+        try:
+            claims = session.authenticate(event, cur)
+        except session.SessionError as error:
+            return response.error_response(401, str(error))
+        if not claims:
+            return response.error_response(401, 'Требуется авторизация')
+        user_id = claims['uid']
+        
+        if method == 'GET':
+            params = event.get('queryStringParameters', {}) or {}
+            
+            try:
+                limit = min(int(params.get('limit', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+                cursor = int(params['cursor']) if params.get('cursor') else None
+                peer_id = int(params['peer_id']) if params.get('peer_id') else None
+                since = int(params.get('since', 0))
+                timeout = min(float(params.get('timeout', DEFAULT_POLL_TIMEOUT)), MAX_POLL_TIMEOUT)
+            except ValueError:
+                return response.error_response(400, 'Некорректные параметры запроса')
+            if limit < 1:
+                limit = DEFAULT_PAGE_SIZE
+            
+            if params.get('view') == 'poll':
+                messages = wait_for_inbound(conn, cur, user_id, since, max(timeout, 0.0))
+                next_since = messages[-1]['id'] if messages else since
+                return response.json_response(200, {'messages': messages, 'next_since': next_since})
+            
+            if peer_id is not None:
+                cur.execute(
+                    f"""SELECT {MESSAGE_COLUMNS}
+                       FROM messages
+                       WHERE user_low = %(low)s AND user_high = %(high)s AND (%(cursor)s::integer IS NULL OR id < %(cursor)s)
+                       ORDER BY id DESC
+                       LIMIT %(limit)s""",
+                    {'low': min(user_id, peer_id), 'high': max(user_id, peer_id), 'cursor': cursor, 'limit': limit + 1}
+                )
+                messages = response.rows_to_dicts(cur, cur.fetchall())
+                next_cursor = messages[limit - 1]['id'] if len(messages) > limit else None
+                return response.json_response(200, {'messages': messages[:limit], 'next_cursor': next_cursor}, event=event)
+            
+            cur.execute(
+                """SELECT c.peer_id, u.username, u.display_name, u.avatar_url, c.unread_count,
+                          c.last_message_id, m.sender_id AS last_sender_id, m.message AS last_message, m.created_at AS last_message_at
+                   FROM conversations c
+                   JOIN users u ON u.id = c.peer_id
+                   JOIN messages m ON m.id = c.last_message_id
+                   WHERE c.user_id = %(user_id)s AND (%(cursor)s::integer IS NULL OR c.last_message_id < %(cursor)s)
+                   ORDER BY c.last_message_id DESC
+                   LIMIT %(limit)s""",
+                {'user_id': user_id, 'cursor': cursor, 'limit': limit + 1}
+            )
+            conversations = response.rows_to_dicts(cur, cur.fetchall())
+            next_cursor = conversations[limit - 1]['last_message_id'] if len(conversations) > limit else None
+            
+            return response.json_response(200, {'conversations': conversations[:limit], 'next_cursor': next_cursor}, event=event)
+        
+        elif method == 'POST':
+            body_data = json.loads(event.get('body') or '{}')
+            action = body_data.get('action')
+            
+            if action == 'send':
+                try:
+                    recipient_id = int(body_data.get('recipient_id'))
+                except (TypeError, ValueError):
+                    return response.error_response(400, 'Укажите получателя')
+                text = (body_data.get('message') or '').strip()
+                if not text or len(text) > MAX_MESSAGE_LENGTH:
+                    return response.error_response(400, f'Сообщение должно быть от 1 до {MAX_MESSAGE_LENGTH} символов')
+                if recipient_id == user_id:
+                    return response.error_response(400, 'Нельзя отправить сообщение самому себе')
+                
+                cur.execute(SEND_SQL, {'sender_id': user_id, 'recipient_id': recipient_id, 'message': text})
+                message = response.row_to_dict(cur, cur.fetchone())
+                if not message:
+                    conn.rollback()
+                    return response.error_response(404, 'Получатель не найден')
+                cur.execute("SELECT pg_notify(%s, %s)", (inbox_channel(message['recipient_id']), str(message['id'])))
+                conn.commit()
+                
+                return response.json_response(200, {'message': message})
+            
+            elif action == 'read':
+                receipts = body_data.get('receipts') or []
+                if not receipts or len(receipts) > MAX_RECEIPTS:
+                    return response.error_response(400, f'Укажите от 1 до {MAX_RECEIPTS} отметок')
+                try:
+                    peer_ids = [int(receipt['peer_id']) for receipt in receipts]
+                    up_to_ids = [int(receipt['up_to_id']) for receipt in receipts]
+                except (KeyError, TypeError, ValueError):
+                    return response.error_response(400, 'Каждая отметка: peer_id и up_to_id')
+                
+                cur.execute(READ_SQL, {'user_id': user_id, 'peer_ids': peer_ids, 'up_to_ids': up_to_ids})
+                updated = response.rows_to_dicts(cur, cur.fetchall())
+                conn.commit()
+                
+                return response.json_response(200, {'conversations': updated})
+        
+        return response.error_response(405, 'Method not allowed')
+    
+    finally:
+        cur.close()
+        db.release(conn)
@@ -1,8 +1,239 @@
 import json
-import os
-import psycopg2
-from typing import Dict, Any
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from typing import Dict, Any, List, Optional, Tuple
 
+import cache
+import db
+import metrics
+import response
+import session
+
+DEFAULT_SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 50
+TRIGRAM_MIN_LENGTH = 3
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 100
+MAX_BULK_SIZE = 500
+MAX_BALANCE = Decimal('99999999.99')
+MAX_STRIPES = 64
+MAX_PROFILE_BATCH = 100
+
+PROFILE_CACHE_CONTROL = 'private, no-cache'
+SEARCH_CACHE_CONTROL = 'private, max-age=10'
+DIRECTORY_CACHE_CONTROL = 'private, no-cache'
+
+ADMIN_ACTIONS = (
+    'admin_verify', 'admin_unverify', 'admin_ban', 'admin_unban', 'admin_bulk',
+    'update_balance', 'set_hot_account', 'reconcile_balances'
+)
+# Админ-действия, которые выполняются только с токеном; остальные допускают вызов без токена для совместимости
+ADMIN_TOKEN_ACTIONS = ('admin_bulk', 'set_hot_account', 'reconcile_balances')
+
+# Баланс всегда отдаётся с полосами горячего счёта (account_balance, V0023), а не голым users.balance
+USER_COLUMNS = 'id, email, username, display_name, avatar_url, account_balance(id, balance) AS balance, role, is_verified, is_banned'
+DIRECTORY_COLUMNS = USER_COLUMNS + ", image_variant_url(avatar_url, 'thumb') AS avatar_thumb_url, created_at"
+
+# Ключ сортировки справочника -> колонка
+DIRECTORY_SORTS = {
+    'verified': 'is_verified',
+    'created_at': 'created_at',
+    'balance': 'balance',
+    'id': 'id'
+}
+# Колонка -> выражение сортировки без NULL (индексы V0022 построены по тем же выражениям): кортежное
+# сравнение курсора с NULL не даёт ни true, ни false, и такие строки пропускались бы или повторялись
+DIRECTORY_SORT_KEYS = {
+    'is_verified': 'coalesce(is_verified, false)',
+    'created_at': "coalesce(created_at, '1970-01-01'::timestamp)",
+    'balance': 'coalesce(balance, 0)',
+    'id': 'id'
+}
+CURSOR_PARSERS = {
+    'is_verified': lambda value: value == 'True',
+    'created_at': datetime.fromisoformat,
+    'balance': float,
+    'id': int
+}
+
+
+# Профиль одним запросом: карточка пользователя, активная рамка и счётчики через LATERAL, в порядке запрошенных id
+PROFILE_SQL = '''SELECT u.id, u.username, u.display_name, u.avatar_url, image_variant_url(u.avatar_url, 'card') AS avatar_card_url, u.role, u.is_verified, u.is_banned, u.hours_online,
+       af.active_frame, gc.owned_games, fc.friends, lc.active_listings
+FROM unnest(%s::integer[]) WITH ORDINALITY AS r(id, ord)
+JOIN users u ON u.id = r.id
+LEFT JOIN LATERAL (
+    SELECT json_build_object('id', f.id, 'name', f.name, 'image_url', f.image_url, 'image_thumb_url', image_variant_url(f.image_url, 'thumb')) AS active_frame
+    FROM user_frames uf JOIN frames f ON f.id = uf.frame_id
+    WHERE uf.user_id = u.id AND uf.is_active
+) af ON true
+CROSS JOIN LATERAL (SELECT count(*) AS owned_games FROM user_games ug WHERE ug.user_id = u.id) gc
+CROSS JOIN LATERAL (SELECT count(*) AS friends FROM friendships fr WHERE fr.user_id = u.id) fc
+CROSS JOIN LATERAL (
+    SELECT count(*) AS active_listings FROM marketplace_items m WHERE m.seller_id = u.id AND m.status = 'active'
+) lc
+ORDER BY r.ord'''
+PROFILE_TABLES = ['users', 'frames', 'user_frames', 'user_games', 'friendships', 'marketplace_feed']
+
+# Страница друзей с карточками одним запросом (keyset по id дружбы); game_id оставляет друзей, купивших игру
+FRIENDS_SQL = '''SELECT f.id AS friendship_id, f.created_at AS friends_since,
+       u.id, u.username, u.display_name, u.avatar_url, image_variant_url(u.avatar_url, 'thumb') AS avatar_thumb_url,
+       u.is_verified, u.hours_online, af.active_frame
+FROM friendships f
+JOIN users u ON u.id = f.friend_id
+LEFT JOIN LATERAL (
+    SELECT json_build_object('id', fr.id, 'name', fr.name, 'image_url', fr.image_url, 'image_thumb_url', image_variant_url(fr.image_url, 'thumb')) AS active_frame
+    FROM user_frames uf JOIN frames fr ON fr.id = uf.frame_id
+    WHERE uf.user_id = u.id AND uf.is_active
+) af ON true
+WHERE f.user_id = %(user_id)s
+  AND (%(cursor)s::integer IS NULL OR f.id < %(cursor)s)
+  AND (%(game_id)s::integer IS NULL
+       OR EXISTS (SELECT 1 FROM user_games ug WHERE ug.user_id = f.friend_id AND ug.game_id = %(game_id)s))
+ORDER BY f.id DESC
+LIMIT %(limit)s'''
+FRIENDS_TABLES = ['friendships', 'users', 'frames', 'user_frames', 'user_games']
+
+# Число общих друзей пользователя с каждым из списка: пересечение по UNIQUE(user_id, friend_id)
+MUTUAL_FRIENDS_SQL = '''SELECT r.id AS user_id, m.mutual_friends
+FROM unnest(%(user_ids)s::integer[]) WITH ORDINALITY AS r(id, ord)
+CROSS JOIN LATERAL (
+    SELECT count(*) AS mutual_friends
+    FROM friendships a
+    JOIN friendships b ON b.user_id = %(user_id)s AND b.friend_id = a.friend_id
+    WHERE a.user_id = r.id
+) m
+ORDER BY r.ord'''
+
+# Обе строки пары одним INSERT; friend_found отличает несуществующего пользователя от уже добавленного друга
+ADD_FRIEND_SQL = '''WITH friend AS (
+    SELECT id FROM users WHERE id = %(friend_id)s
+), added AS (
+    INSERT INTO friendships (user_id, friend_id)
+    SELECT p.user_id, p.friend_id
+    FROM friend
+    CROSS JOIN LATERAL (VALUES (%(user_id)s, friend.id), (friend.id, %(user_id)s)) AS p(user_id, friend_id)
+    ON CONFLICT (user_id, friend_id) DO NOTHING
+    RETURNING 1
+)
+SELECT EXISTS (SELECT 1 FROM friend) AS friend_found, (SELECT count(*) FROM added) AS added'''
+
+# Массовые админ-действия -> (колонка, новое значение)
+BULK_OPERATIONS = {
+    'verify': ('is_verified', True),
+    'unverify': ('is_verified', False),
+    'ban': ('is_banned', True),
+    'unban': ('is_banned', False)
+}
+
+BULK_UPDATE_SQL = '''WITH requested AS (
+    {requested}
+), updated AS (
+    UPDATE users u SET {column} = %s
+    FROM requested r
+    WHERE u.id = r.id AND u.{column} IS DISTINCT FROM %s
+    RETURNING u.id
+)
+SELECT r.id,
+       CASE WHEN up.id IS NOT NULL THEN 'updated' WHEN u.id IS NOT NULL THEN 'unchanged' ELSE 'not_found' END
+FROM requested r
+LEFT JOIN updated up ON up.id = r.id
+LEFT JOIN users u ON u.id = r.id
+ORDER BY r.id'''
+
+
+def escape_like(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def parse_flag(value: Any) -> Optional[bool]:
+    if value in (None, ''):
+        return None
+    if isinstance(value, bool):
+        return value
+    if value in ('true', '1'):
+        return True
+    if value in ('false', '0'):
+        return False
+    raise ValueError(value)
+
+
+def format_cursor(value: Any, user_id: int) -> str:
+    return f'{value.isoformat() if isinstance(value, datetime) else value}_{user_id}'
+
+
+def parse_cursor(cursor: str, column: str) -> Tuple[Any, int]:
+    value, _, user_id = cursor.rpartition('_')
+    return CURSOR_PARSERS[column](value), int(user_id)
+
+
+def directory_filters(params: Dict[str, Any]) -> Tuple[List[str], List[Any]]:
+    '''
+    Business: Условия фильтра справочника пользователей из параметров запроса
+    Args: params - role, banned, verified, min_balance, max_balance, created_from, created_to
+    Returns: список SQL-условий и их параметры; ValueError при некорректном значении
+    '''
+    conditions: List[str] = []
+    args: List[Any] = []
+    if params.get('role'):
+        conditions.append('role = %s')
+        args.append(params['role'])
+    for param, column in (('banned', 'is_banned'), ('verified', 'is_verified')):
+        flag = parse_flag(params.get(param))
+        if flag is not None:
+            conditions.append(f'{column} = %s')
+            args.append(flag)
+    if params.get('min_balance'):
+        conditions.append('balance >= %s')
+        args.append(float(params['min_balance']))
+    if params.get('max_balance'):
+        conditions.append('balance <= %s')
+        args.append(float(params['max_balance']))
+    if params.get('created_from'):
+        conditions.append('created_at >= %s')
+        args.append(datetime.fromisoformat(params['created_from']))
+    if params.get('created_to'):
+        conditions.append('created_at < %s')
+        args.append(datetime.fromisoformat(params['created_to']))
+    return conditions, args
+
+
+def bulk_selection(body_data: Dict[str, Any], column: str, value: Any) -> Tuple[str, List[Any]]:
+    '''
+    Business: Выбор пользователей для массового действия: явный список user_ids или filter справочника
+    Args: column, value - изменяемая колонка и новое значение; filter выбирает только тех, у кого оно ещё другое,
+          поэтому повторный вызов при has_more берёт следующих пользователей, а не тех же самых
+    Returns: SQL, возвращающий колонку id, и его параметры; ValueError/TypeError при некорректном выборе
+    '''
+    if body_data.get('user_ids'):
+        ids = [int(user_id) for user_id in body_data['user_ids']]
+        if len(ids) > MAX_BULK_SIZE:
+            raise ValueError(len(ids))
+        return 'SELECT DISTINCT unnest(%s::integer[]) AS id', [ids]
+    
+    conditions, args = directory_filters(body_data.get('filter') or {})
+    if not conditions:
+        raise ValueError('filter')
+    conditions.append(f'{column} IS DISTINCT FROM %s')
+    return f"SELECT id FROM users WHERE {' AND '.join(conditions)} ORDER BY id LIMIT %s", args + [value, MAX_BULK_SIZE]
+
+
+def estimate_total(cur: Any, conditions: List[str], args: List[Any]) -> int:
+    '''
+    Business: Приблизительное число пользователей под фильтром без COUNT(*)
+    Без фильтров берётся reltuples из статистики, с фильтрами - оценка строк планировщиком.
+    '''
+    if not conditions:
+        cur.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = 'users'::regclass")
+        total = cur.fetchone()[0]
+        if total >= 0:
+            return total
+    where = ' AND '.join(conditions) or 'true'
+    cur.execute(f"EXPLAIN (FORMAT JSON) SELECT 1 FROM users WHERE {where}", tuple(args))
+    return int(cur.fetchone()[0][0]['Plan']['Plan Rows'])
+
+
+@metrics.instrumented
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Business: Управление пользователями (получение, обновление, админ действия)
@@ -13,18 +244,9 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, PUT, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': ''
-        }
+        return response.preflight_response()
     
-    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    conn = db.acquire()
     cur = conn.cursor()
     
     try:
@@ -33,108 +255,244 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             user_id = params.get('user_id')
             search = params.get('search')
             
+            if params.get('view') == 'profile':
+                try:
+                    ids = [int(value) for value in (params.get('user_ids') or user_id or '').split(',') if value.strip()]
+                except ValueError:
+                    return response.error_response(400, 'Некорректный список user_ids')
+                if not ids or len(ids) > MAX_PROFILE_BATCH:
+                    return response.error_response(400, f'Укажите от 1 до {MAX_PROFILE_BATCH} пользователей')
+                
+                etag = cache.make_etag(cache.read_versions(cur, PROFILE_TABLES))
+                if cache.is_not_modified(event, etag):
+                    return cache.not_modified_response(etag, PROFILE_CACHE_CONTROL)
+                
+                cur.execute(PROFILE_SQL, (ids,))
+                profiles = response.rows_to_dicts(cur, cur.fetchall())
+                headers = cache.etag_headers(etag, PROFILE_CACHE_CONTROL)
+                if params.get('user_ids'):
+                    return response.json_response(200, {'profiles': profiles}, headers, event)
+                if not profiles:
+                    return response.error_response(404, 'Пользователь не найден')
+                return response.json_response(200, {'profile': profiles[0]}, headers, event)
+            
+            if params.get('view') == 'friends':
+                try:
+                    limit = min(int(params.get('limit', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+                    args = {
+                        'user_id': int(user_id),
+                        'cursor': int(params['cursor']) if params.get('cursor') else None,
+                        'game_id': int(params['game_id']) if params.get('game_id') else None
+                    }
+                except (TypeError, ValueError):
+                    return response.error_response(400, 'Некорректные параметры пагинации или фильтра')
+                if limit < 1:
+                    limit = DEFAULT_PAGE_SIZE
+                
+                etag = cache.make_etag(cache.read_versions(cur, FRIENDS_TABLES))
+                if cache.is_not_modified(event, etag):
+                    return cache.not_modified_response(etag, PROFILE_CACHE_CONTROL)
+                
+                args['limit'] = limit + 1
+                cur.execute(FRIENDS_SQL, args)
+                friends = response.rows_to_dicts(cur, cur.fetchall())
+                next_cursor = friends[limit - 1]['friendship_id'] if len(friends) > limit else None
+                
+                return response.json_response(
+                    200,
+                    {'friends': friends[:limit], 'next_cursor': next_cursor},
+                    cache.etag_headers(etag, PROFILE_CACHE_CONTROL),
+                    event
+                )
+            
+            if params.get('view') == 'mutual_friends':
+                try:
+                    ids = [int(value) for value in (params.get('user_ids') or '').split(',') if value.strip()]
+                    args = {'user_id': int(user_id), 'user_ids': ids}
+                except (TypeError, ValueError):
+                    return response.error_response(400, 'Некорректный список user_ids')
+                if not ids or len(ids) > MAX_PROFILE_BATCH:
+                    return response.error_response(400, f'Укажите от 1 до {MAX_PROFILE_BATCH} пользователей')
+                
+                etag = cache.make_etag(cache.read_versions(cur, ['friendships']))
+                if cache.is_not_modified(event, etag):
+                    return cache.not_modified_response(etag, PROFILE_CACHE_CONTROL)
+                
+                cur.execute(MUTUAL_FRIENDS_SQL, args)
+                mutual = response.rows_to_dicts(cur, cur.fetchall())
+                
+                return response.json_response(200, {'mutual_friends': mutual}, cache.etag_headers(etag, PROFILE_CACHE_CONTROL), event)
+            
             if user_id:
                 cur.execute(
-                    "SELECT id, username, display_name, avatar_url, balance, role, is_verified, is_banned, hours_online FROM users WHERE id = %s",
+                    """SELECT id, username, display_name, avatar_url,
+                              account_balance(id, balance) AS balance,
+                              role, is_verified, is_banned, hours_online
+                       FROM users WHERE id = %s""",
                     (user_id,)
                 )
-                user = cur.fetchone()
+                user = response.row_to_dict(cur, cur.fetchone())
                 if user:
-                    user_data = {
-                        'id': user[0],
-                        'username': user[1],
-                        'display_name': user[2],
-                        'avatar_url': user[3],
-                        'balance': float(user[4]),
-                        'role': user[5],
-                        'is_verified': user[6],
-                        'is_banned': user[7],
-                        'hours_online': user[8]
-                    }
-                    return {
-                        'statusCode': 200,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'isBase64Encoded': False,
-                        'body': json.dumps({'user': user_data})
-                    }
+                    return response.json_response(200, {'user': user})
+                return response.json_response(200, {'users': []})
             
-            elif search:
-                cur.execute(
-                    "SELECT id, username, display_name, avatar_url, role, is_verified, is_banned FROM users WHERE username LIKE %s ORDER BY is_verified DESC, id DESC",
-                    (f'%{search}%',)
-                )
-            else:
-                cur.execute(
-                    "SELECT id, email, username, display_name, avatar_url, balance, role, is_verified, is_banned FROM users ORDER BY is_verified DESC, id DESC"
-                )
+            if not search:
+                try:
+                    claims = session.authenticate(event, cur)
+                except session.SessionError as error:
+                    return response.error_response(401, str(error))
+                if claims and claims['role'] != 'admin':
+                    return response.error_response(403, 'Недостаточно прав')
+                try:
+                    sort_column = DIRECTORY_SORTS[params.get('sort', 'verified')]
+                    limit = min(int(params.get('limit', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+                    cursor = parse_cursor(params['cursor'], sort_column) if params.get('cursor') else None
+                    conditions, args = directory_filters(params)
+                except (KeyError, ValueError):
+                    return response.error_response(400, 'Некорректные параметры пагинации или фильтра')
+                if limit < 1:
+                    limit = DEFAULT_PAGE_SIZE
+                if sort_column == 'balance' or params.get('min_balance') or params.get('max_balance'):
+                    # Сортировка и фильтр идут по users.balance (индекс V0022): сначала переносим в него полосы горячих счетов
+                    cur.execute("SELECT ledger_fold_all()")
+                    conn.commit()
+            
+            list_cache_control = SEARCH_CACHE_CONTROL if search else DIRECTORY_CACHE_CONTROL
+            etag = cache.make_etag(cache.read_versions(cur, ['users']))
+            if cache.is_not_modified(event, etag):
+                return cache.not_modified_response(etag, list_cache_control)
             
-            users = []
-            for user in cur.fetchall():
-                if search:
-                    users.append({
-                        'id': user[0],
-                        'username': user[1],
-                        'display_name': user[2],
-                        'avatar_url': user[3],
-                        'role': user[4],
-                        'is_verified': user[5],
-                        'is_banned': user[6]
-                    })
+            if search:
+                query = escape_like(search.strip().lower())
+                try:
+                    limit = min(int(params.get('limit', DEFAULT_SEARCH_LIMIT)), MAX_SEARCH_LIMIT)
+                except ValueError:
+                    limit = DEFAULT_SEARCH_LIMIT
+                if limit < 1:
+                    limit = DEFAULT_SEARCH_LIMIT
+                
+                if len(query) < TRIGRAM_MIN_LENGTH:
+                    cur.execute(
+                        "SELECT id, username, display_name, avatar_url, image_variant_url(avatar_url, 'thumb') AS avatar_thumb_url, role, is_verified, is_banned FROM users WHERE lower(username) LIKE %s ORDER BY is_verified DESC, id DESC LIMIT %s",
+                        (f'{query}%', limit)
+                    )
                 else:
-                    users.append({
-                        'id': user[0],
-                        'email': user[1],
-                        'username': user[2],
-                        'display_name': user[3],
-                        'avatar_url': user[4],
-                        'balance': float(user[5]),
-                        'role': user[6],
-                        'is_verified': user[7],
-                        'is_banned': user[8]
-                    })
+                    cur.execute(
+                        """SELECT id, username, display_name, avatar_url, image_variant_url(avatar_url, 'thumb') AS avatar_thumb_url, role, is_verified, is_banned
+                           FROM users
+                           WHERE lower(username) LIKE %(pattern)s OR lower(display_name) LIKE %(pattern)s
+                           ORDER BY lower(username) LIKE %(prefix)s DESC,
+                                    similarity(lower(username), %(query)s) DESC,
+                                    is_verified DESC, id DESC
+                           LIMIT %(limit)s""",
+                        {'pattern': f'%{query}%', 'prefix': f'{query}%', 'query': query, 'limit': limit}
+                    )
+                
+                users = response.rows_to_dicts(cur, cur.fetchall())
+                return response.json_response(200, {'users': users}, cache.etag_headers(etag, list_cache_control), event)
             
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'isBase64Encoded': False,
-                'body': json.dumps({'users': users})
-            }
+            sort_key = DIRECTORY_SORT_KEYS[sort_column]
+            page_conditions = conditions + ([f'({sort_key}, id) < (%s, %s)'] if cursor else [])
+            cur.execute(
+                f"""SELECT {DIRECTORY_COLUMNS}, {sort_key} AS sort_key
+                   FROM users
+                   WHERE {' AND '.join(page_conditions) or 'true'}
+                   ORDER BY {sort_key} DESC, id DESC
+                   LIMIT %s""",
+                tuple(args + list(cursor or ()) + [limit + 1])
+            )
+            users = response.rows_to_dicts(cur, cur.fetchall())
+            sort_keys = [user.pop('sort_key') for user in users]
+            
+            next_cursor = format_cursor(sort_keys[limit - 1], users[limit - 1]['id']) if len(users) > limit else None
+            
+            return response.json_response(
+                200,
+                {'users': users[:limit], 'next_cursor': next_cursor, 'total_estimate': estimate_total(cur, conditions, args)},
+                cache.etag_headers(etag, list_cache_control),
+                event
+            )
         
         elif method == 'PUT':
             body_data = json.loads(event.get('body', '{}'))
             user_id = body_data.get('user_id')
             action = body_data.get('action')
+            try:
+                claims = session.authenticate(event, cur)
+            except session.SessionError as error:
+                return response.error_response(401, str(error))
+            if action in ADMIN_TOKEN_ACTIONS and not claims:
+                return response.error_response(401, 'Требуется авторизация')
+            if claims and action in ADMIN_ACTIONS and claims['role'] != 'admin':
+                return response.error_response(403, 'Недостаточно прав')
             
             if action == 'update_profile':
+                if claims:
+                    user_id = claims['uid']
                 display_name = body_data.get('display_name')
                 username = body_data.get('username')
                 avatar_url = body_data.get('avatar_url')
                 
                 cur.execute(
-                    "UPDATE users SET display_name = %s, username = %s, avatar_url = %s WHERE id = %s RETURNING id, email, username, display_name, avatar_url, balance, role, is_verified, is_banned",
+                    f"UPDATE users SET display_name = %s, username = %s, avatar_url = %s WHERE id = %s RETURNING {USER_COLUMNS}",
                     (display_name, username, avatar_url, user_id)
                 )
-                user = cur.fetchone()
+                user = response.row_to_dict(cur, cur.fetchone())
+                conn.commit()
+                
+                return response.json_response(200, {'user': user})
+            
+            elif action in ('add_friend', 'remove_friend'):
+                if claims:
+                    user_id = claims['uid']
+                try:
+                    pair = {'user_id': int(user_id), 'friend_id': int(body_data.get('friend_id'))}
+                except (TypeError, ValueError):
+                    return response.error_response(400, 'Укажите user_id и friend_id')
+                if pair['user_id'] == pair['friend_id']:
+                    return response.error_response(400, 'Нельзя добавить в друзья самого себя')
+                
+                if action == 'add_friend':
+                    cur.execute(ADD_FRIEND_SQL, pair)
+                    friend_found, added = cur.fetchone()
+                    if not friend_found:
+                        conn.rollback()
+                        return response.error_response(404, 'Пользователь не найден')
+                    conn.commit()
+                    return response.json_response(200, {'success': True, 'added': added > 0})
+                
+                cur.execute(
+                    """DELETE FROM friendships
+                       WHERE (user_id, friend_id) IN ((%(user_id)s, %(friend_id)s), (%(friend_id)s, %(user_id)s))""",
+                    pair
+                )
+                removed = cur.rowcount > 0
                 conn.commit()
                 
-                user_data = {
-                    'id': user[0],
-                    'email': user[1],
-                    'username': user[2],
-                    'display_name': user[3],
-                    'avatar_url': user[4],
-                    'balance': float(user[5]),
-                    'role': user[6],
-                    'is_verified': user[7],
-                    'is_banned': user[8]
-                }
-                
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'isBase64Encoded': False,
-                    'body': json.dumps({'user': user_data})
-                }
+                return response.json_response(200, {'success': True, 'removed': removed})
+            
+            elif action == 'admin_bulk':
+                operation = BULK_OPERATIONS.get(body_data.get('operation'))
+                if not operation:
+                    return response.error_response(400, 'Неизвестное админ-действие')
+                column, value = operation
+                try:
+                    requested, args = bulk_selection(body_data, column, value)
+                except (TypeError, ValueError):
+                    return response.error_response(400, f'Укажите до {MAX_BULK_SIZE} user_ids или filter')
+                
+                cur.execute(BULK_UPDATE_SQL.format(requested=requested, column=column), tuple(args + [value, value]))
+                results = [{'id': row[0], 'result': row[1]} for row in cur.fetchall()]
+                updated_ids = [result['id'] for result in results if result['result'] == 'updated']
+                if body_data.get('operation') == 'ban' and updated_ids:
+                    session.revoke_users(cur, updated_ids)
+                conn.commit()
+                
+                return response.json_response(200, {
+                    'results': results,
+                    'updated': len(updated_ids),
+                    'has_more': not body_data.get('user_ids') and len(results) == MAX_BULK_SIZE
+                })
             
             elif action == 'admin_verify':
                 cur.execute("UPDATE users SET is_verified = %s WHERE id = %s", (True, user_id))
@@ -144,29 +502,61 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 conn.commit()
             elif action == 'admin_ban':
                 cur.execute("UPDATE users SET is_banned = %s WHERE id = %s", (True, user_id))
+                session.revoke_user(cur, user_id)
                 conn.commit()
             elif action == 'admin_unban':
                 cur.execute("UPDATE users SET is_banned = %s WHERE id = %s", (False, user_id))
                 conn.commit()
             elif action == 'update_balance':
-                balance = body_data.get('balance')
-                cur.execute("UPDATE users SET balance = %s WHERE id = %s", (balance, user_id))
+                try:
+                    user_id = int(user_id)
+                    balance = Decimal(str(body_data['balance']))
+                except (KeyError, TypeError, ValueError, InvalidOperation):
+                    return response.error_response(400, 'Укажите user_id и balance числом')
+                if not balance.is_finite() or not 0 <= balance <= MAX_BALANCE:
+                    return response.error_response(400, f'Баланс должен быть от 0 до {MAX_BALANCE}')
+                cur.execute("SELECT ledger_set_balance(%s, %s)", (user_id, balance))
+                if cur.fetchone()[0] is None:
+                    conn.rollback()
+                    return response.error_response(404, 'Пользователь не найден')
                 conn.commit()
+            elif action == 'set_hot_account':
+                try:
+                    user_id = int(user_id)
+                    stripes = int(body_data.get('stripes', 8))
+                except (TypeError, ValueError):
+                    return response.error_response(400, 'Укажите user_id и stripes целыми числами')
+                if stripes > MAX_STRIPES:
+                    return response.error_response(400, f'Не больше {MAX_STRIPES} полос')
+                if stripes > 0:
+                    cur.execute(
+                        """INSERT INTO hot_accounts (user_id, stripes)
+                           SELECT id, %s FROM users WHERE id = %s
+                           ON CONFLICT (user_id) DO UPDATE SET stripes = EXCLUDED.stripes""",
+                        (stripes, user_id)
+                    )
+                    if cur.rowcount == 0:
+                        conn.rollback()
+                        return response.error_response(404, 'Пользователь не найден')
+                else:
+                    cur.execute("DELETE FROM hot_accounts WHERE user_id = %s", (user_id,))
+                conn.commit()
+            elif action == 'reconcile_balances':
+                cur.execute("SELECT ledger_fold_all()")
+                folded = cur.fetchone()[0]
+                conn.commit()
+                cur.execute("SELECT ledger_take_snapshots()")
+                snapshots = cur.fetchone()[0]
+                conn.commit()
+                cur.execute("SELECT user_id, account_balance, ledger_balance FROM ledger_reconcile()")
+                mismatches = response.rows_to_dicts(cur, cur.fetchall())
+                
+                return response.json_response(200, {'folded': folded, 'snapshots': snapshots, 'mismatches': mismatches})
             
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'isBase64Encoded': False,
-                'body': json.dumps({'success': True})
-            }
+            return response.json_response(200, {'success': True})
         
-        return {
-            'statusCode': 405,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'isBase64Encoded': False,
-            'body': json.dumps({'error': 'Method not allowed'})
-        }
+        return response.error_response(405, 'Method not allowed')
     
     finally:
         cur.close()
-        conn.close()
+        db.release(conn)
@@ -0,0 +1,115 @@
+import base64
+import gzip
+import json
+import os
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Dict, Any, List, Optional, Sequence
+
+import metrics
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_BYTES = int(os.environ.get('RESPONSE_COMPRESS_MIN_BYTES', '2048'))
+
+JSON_HEADERS = {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f'Type is not JSON serializable: {type(value).__name__}')
+
+
+def dumps(payload: Any) -> str:
+    with metrics.span('serialize'):
+        if orjson is not None:
+            return orjson.dumps(payload, default=_default).decode('utf-8')
+        return json.dumps(payload, default=_default, separators=(',', ':'))
+
+
+def rows_to_dicts(cur: Any, rows: Sequence[Sequence[Any]]) -> List[Dict[str, Any]]:
+    columns = [column[0] for column in cur.description]
+    return [dict(zip(columns, row)) for row in rows]
+
+
+def row_to_dict(cur: Any, row: Optional[Sequence[Any]]) -> Optional[Dict[str, Any]]:
+    if row is None:
+        return None
+    return dict(zip([column[0] for column in cur.description], row))
+
+
+def _accepted_encodings(event: Optional[Dict[str, Any]]) -> str:
+    headers = (event or {}).get('headers') or {}
+    return next((v for k, v in headers.items() if k.lower() == 'accept-encoding'), '') or ''
+
+
+def body_response(status_code: int, body: str, headers: Optional[Dict[str, str]] = None, event: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    '''
+    Business: Ответ с готовым JSON-телом; крупные тела сжимаются brotli/gzip, если клиент это принимает
+    Args: status_code - HTTP статус
+          body - сериализованный JSON
+          headers - дополнительные заголовки (ETag, Cache-Control и т.п.)
+          event - исходное событие, нужно только для чтения Accept-Encoding
+    Returns: HTTP response dict
+    '''
+    response_headers = {**JSON_HEADERS, **(headers or {})}
+    encodings = _accepted_encodings(event)
+    raw = body.encode('utf-8')
+
+    if event is not None:
+        response_headers['Vary'] = 'Accept-Encoding'
+    if event is not None and len(raw) >= COMPRESS_MIN_BYTES:
+        compressed = None
+        with metrics.span('compress'):
+            if brotli is not None and 'br' in encodings:
+                compressed = brotli.compress(raw, quality=4)
+                response_headers['Content-Encoding'] = 'br'
+            elif 'gzip' in encodings:
+                compressed = gzip.compress(raw, compresslevel=5)
+                response_headers['Content-Encoding'] = 'gzip'
+        if compressed is not None:
+            return {
+                'statusCode': status_code,
+                'headers': response_headers,
+                'isBase64Encoded': True,
+                'body': base64.b64encode(compressed).decode('ascii')
+            }
+
+    return {
+        'statusCode': status_code,
+        'headers': response_headers,
+        'isBase64Encoded': False,
+        'body': body
+    }
+
+
+def json_response(status_code: int, payload: Any, headers: Optional[Dict[str, str]] = None, event: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    return body_response(status_code, dumps(payload), headers, event)
+
+
+def error_response(status_code: int, message: str, **extra: Any) -> Dict[str, Any]:
+    return json_response(status_code, {'error': message, **extra})
+
+
+def preflight_response(methods: str = 'GET, POST, PUT, OPTIONS') -> Dict[str, Any]:
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Allow-Methods': methods,
+            'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, If-None-Match, Authorization',
+            'Access-Control-Max-Age': '86400'
+        },
+        'body': ''
+    }
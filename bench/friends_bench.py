@@ -0,0 +1,124 @@
+'''
+Business: Граф друзей на 1M связей: страницы списка друзей, общие друзья, друзья с игрой, добавление и удаление
+Запуск: DATABASE_URL=postgresql://... python bench/friends_bench.py --users 50000 --edges 1000000 --requests 200
+Только для одноразовой локальной БД с применёнными db_migrations: скрипт создаёт пользователей, игру и дружбы.
+'''
+import argparse
+import json
+import sys
+import time
+import uuid
+from typing import Dict, Any, List
+
+import harness
+
+# Допустимый p95 (мс) для каждого сценария; превышение - код выхода 1
+P95_BUDGET_MS = {'friends': 30.0, 'friends_deep': 30.0, 'mutual_batch': 100.0, 'friends_owning_game': 50.0, 'add_remove': 20.0}
+
+
+def seed(conn: Any, users: int, edges: int, owners_every: int) -> Dict[str, Any]:
+    '''
+    Business: Пользователи, симметричные дружбы (две строки на связь) и игра, купленная каждым owners_every-м
+    Returns: id пользователей выборки и игры
+    '''
+    tag = uuid.uuid4().hex[:8]
+    cur = conn.cursor()
+    cur.execute(
+        """INSERT INTO users (email, password, username, display_name)
+           SELECT 'fg_' || %(tag)s || '_' || g || '@bench.local', 'x', 'fg_' || %(tag)s || '_' || g, 'fg_' || g
+           FROM generate_series(1, %(n)s) AS g
+           RETURNING id""",
+        {'tag': tag, 'n': users}
+    )
+    user_ids = sorted(row[0] for row in cur.fetchall())
+    # Связь i -> i + k*k + 1 (по кругу): разные смещения не дают петель и повторов при k*k + 1 < users / 2
+    per_user = max(edges // users, 1)
+    cur.execute(
+        """WITH u AS (SELECT id, ordinality - 1 AS rn FROM unnest(%(ids)s::integer[]) WITH ORDINALITY AS t(id))
+           INSERT INTO friendships (user_id, friend_id)
+           SELECT e.a, e.b
+           FROM u
+           CROSS JOIN generate_series(1, %(k)s) AS s(k)
+           JOIN u v ON v.rn = (u.rn + s.k * s.k + 1) %% %(n)s
+           CROSS JOIN LATERAL (VALUES (u.id, v.id), (v.id, u.id)) AS e(a, b)
+           ON CONFLICT DO NOTHING""",
+        {'ids': user_ids, 'k': per_user, 'n': users}
+    )
+    cur.execute("INSERT INTO games (title, price, status) VALUES (%s, 1, 'approved') RETURNING id", (f'friends_game_{tag}',))
+    game_id = cur.fetchone()[0]
+    cur.execute(
+        "INSERT INTO user_games (user_id, game_id) SELECT id, %s FROM unnest(%s::integer[]) AS t(id) WHERE id %% %s = 0",
+        (game_id, user_ids, owners_every)
+    )
+    conn.commit()
+    cur.execute("ANALYZE friendships")
+    cur.execute("ANALYZE user_games")
+    conn.commit()
+    cur.execute("SELECT count(*) FROM friendships WHERE user_id = ANY(%s)", (user_ids,))
+    rows = cur.fetchone()[0]
+    cur.close()
+    conn.rollback()
+    return {'user_ids': user_ids, 'game_id': game_id, 'friendship_rows': rows}
+
+
+def measure(function: harness.Function, requests: List[Dict[str, Any]]) -> Dict[str, Any]:
+    started = time.perf_counter()
+    samples = harness.run_serial(function, requests)
+    summary = harness.summarize(samples, time.perf_counter() - started, 0)
+    summary.pop('rows_scanned')
+    summary.pop('rows_scanned_per_request')
+    return summary
+
+
+def deep_cursor(function: harness.Function, user_id: int) -> int:
+    result = function.call(harness.event('GET', {'user_id': str(user_id), 'view': 'friends', 'limit': '100'}))
+    friends = json.loads(result['body'])['friends']
+    return friends[len(friends) // 2]['friendship_id'] if friends else 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=50000)
+    parser.add_argument('--edges', type=int, default=1000000, help='число связей; строк friendships вдвое больше')
+    parser.add_argument('--owners-every', type=int, default=10, help='игру купил каждый N-й пользователь')
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    conn = harness.connect()
+    data = seed(conn, args.users, args.edges, args.owners_every)
+    conn.close()
+
+    function = harness.Function('users')
+    event = harness.event
+    sample = data['user_ids'][::max(len(data['user_ids']) // args.requests, 1)][:args.requests]
+    cursors = {user_id: deep_cursor(function, user_id) for user_id in sample}
+    peers = data['user_ids'][:50]
+
+    report = {
+        'friends': measure(function, [event('GET', {'user_id': str(u), 'view': 'friends', 'limit': '30'}) for u in sample]),
+        'friends_deep': measure(function, [
+            event('GET', {'user_id': str(u), 'view': 'friends', 'limit': '30', 'cursor': str(cursors[u])}) for u in sample
+        ]),
+        'mutual_batch': measure(function, [
+            event('GET', {'user_id': str(u), 'view': 'mutual_friends', 'user_ids': ','.join(str(p) for p in peers)}) for u in sample
+        ]),
+        'friends_owning_game': measure(function, [
+            event('GET', {'user_id': str(u), 'view': 'friends', 'game_id': str(data['game_id'])}) for u in sample
+        ]),
+        'add_remove': measure(function, [
+            event('PUT', body={'action': action, 'user_id': u, 'friend_id': data['user_ids'][-1 - i]})
+            for i, u in enumerate(sample) for action in ('add_friend', 'remove_friend')
+        ])
+    }
+    failures = [
+        f'{name}: p95 {report[name]["p95_ms"]} мс > {budget} мс'
+        for name, budget in P95_BUDGET_MS.items()
+        if report[name]['p95_ms'] > budget
+    ]
+    seed_info = {'users': args.users, 'friendship_rows': data['friendship_rows']}
+    print(json.dumps({'seed': seed_info, 'report': report, 'failures': failures}, ensure_ascii=False, indent=2))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,246 @@
+'''
+Business: Общие части нагрузочных замеров: загрузка функций в процесс, наполнение БД, сбор метрик
+Только для одноразовой локальной БД: наполнение дописывает синтетические строки во все таблицы.
+'''
+import glob
+import importlib
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+from typing import Dict, Any, Callable, List, Optional
+
+import psycopg2
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+BACKEND = os.path.join(ROOT, 'backend')
+MIGRATIONS = os.path.join(ROOT, 'db_migrations')
+FUNCTIONS = ('auth', 'users', 'games', 'frames', 'marketplace', 'messages', 'media')
+
+
+class Function:
+    '''
+    Business: Функция из backend/<name>, загруженная в текущий процесс со своими копиями модулей
+    Метрики каждого вызова перехватываются из metrics.log_request вместо печати в лог.
+    С record_statements=True запоминаются и сами SQL-запросы вызова (с подставленными параметрами).
+    '''
+
+    def __init__(self, name: str, record_statements: bool = False):
+        self.name = name
+        self.module = _import_isolated(os.path.join(BACKEND, name))
+        self._local = threading.local()
+        metrics = self.module.metrics
+        metrics.LOG_ENABLED = True
+        metrics.log_request = self._capture
+        if record_statements:
+            self._record_statements(metrics.TimedCursor)
+
+    def _record_statements(self, cursor_class: Any) -> None:
+        execute = cursor_class.execute
+        local = self._local
+
+        def recording_execute(cur: Any, query: Any, vars: Any = None) -> None:
+            local.statements.append(cur.mogrify(query, vars).decode('utf-8', 'replace'))
+            return execute(cur, query, vars)
+
+        cursor_class.execute = recording_execute
+
+    def _capture(self, request: Any, status_code: int) -> None:
+        self._local.metrics = {'status': status_code, 'queries': request.queries, 'rows': request.rows, 'db_ms': request.db_ms}
+
+    def last_metrics(self) -> Dict[str, Any]:
+        return getattr(self._local, 'metrics', None) or {'queries': 0, 'rows': 0, 'db_ms': 0.0}
+
+    def statements(self) -> List[str]:
+        return list(getattr(self._local, 'statements', []))
+
+    def call(self, event: Dict[str, Any]) -> Dict[str, Any]:
+        self._local.statements = []
+        context = SimpleNamespace(request_id=uuid.uuid4().hex, function_name=self.name)
+        return self.module.handler(event, context)
+
+
+def _import_isolated(path: str) -> Any:
+    local_modules = [os.path.splitext(os.path.basename(f))[0] for f in glob.glob(os.path.join(path, '*.py'))]
+    for name in local_modules:
+        sys.modules.pop(name, None)
+    sys.path.insert(0, path)
+    try:
+        module = importlib.import_module('index')
+    finally:
+        sys.path.remove(path)
+        for name in local_modules:
+            sys.modules.pop(name, None)
+    return module
+
+
+def load_functions(names: Optional[List[str]] = None, record_statements: bool = False) -> Dict[str, Function]:
+    return {name: Function(name, record_statements) for name in (names or FUNCTIONS)}
+
+
+def event(method: str, params: Optional[Dict[str, Any]] = None, body: Optional[Dict[str, Any]] = None, headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    return {
+        'httpMethod': method,
+        'queryStringParameters': params or {},
+        'headers': headers or {},
+        'body': json.dumps(body) if body is not None else None
+    }
+
+
+def tests_json_events(name: str) -> List[Dict[str, Any]]:
+    with open(os.path.join(BACKEND, name, 'tests.json')) as f:
+        cases = json.load(f)['tests']
+    return [event(case['method'], case.get('queryParams'), case.get('body')) for case in cases]
+
+
+def connect() -> Any:
+    return psycopg2.connect(os.environ['DATABASE_URL'])
+
+
+def apply_migrations(conn: Any) -> None:
+    cur = conn.cursor()
+    for path in sorted(glob.glob(os.path.join(MIGRATIONS, 'V*.sql')), key=lambda p: int(os.path.basename(p)[1:].split('__')[0])):
+        with open(path) as f:
+            cur.execute(f.read())
+    conn.commit()
+    cur.close()
+
+
+def seed(conn: Any, users: int, games: int, frames: int, listings: int, ownership: int) -> Dict[str, int]:
+    '''
+    Business: Наполнение БД синтетическими данными заданного масштаба одним набором INSERT ... SELECT
+    Returns: сколько строк каждого вида добавлено
+    '''
+    tag = uuid.uuid4().hex[:6]
+    cur = conn.cursor()
+    cur.execute(
+        """INSERT INTO users (email, password, username, display_name, balance, is_verified)
+           SELECT 'u' || %(tag)s || g || '@bench.local', 'x', 'u' || %(tag)s || '_' || g,
+                  'Игрок ' || g, 1000 + (g %% 500), g %% 50 = 0
+           FROM generate_series(1, %(n)s) AS g""",
+        {'tag': tag, 'n': users}
+    )
+    cur.execute(
+        "INSERT INTO balance_transactions (user_id, amount, kind) SELECT id, balance, 'opening' FROM users WHERE email LIKE %s",
+        (f'u{tag}%@bench.local',)
+    )
+    cur.execute(
+        """INSERT INTO games (title, description, price, genre, age_rating, logo_url, screenshots, publisher_username, status, is_featured)
+           SELECT 'Игра ' || %(tag)s || ' ' || g,
+                  repeat('Описание приключения, стратегии и гонок. ', 20),
+                  (g %% 60) + 0.99,
+                  (ARRAY['action', 'strategy', 'racing', 'puzzle', 'rpg'])[1 + g %% 5],
+                  (ARRAY['0+', '6+', '12+', '16+', '18+'])[1 + g %% 5],
+                  'https://cdn.bench.local/logo/' || g || '.png',
+                  ARRAY['https://cdn.bench.local/s/' || g || '_1.png', 'https://cdn.bench.local/s/' || g || '_2.png'],
+                  'publisher' || (g %% 200),
+                  CASE WHEN g %% 10 = 0 THEN 'pending' ELSE 'approved' END,
+                  g %% 25 = 0
+           FROM generate_series(1, %(n)s) AS g""",
+        {'tag': tag, 'n': games}
+    )
+    cur.execute(
+        """INSERT INTO frames (name, price, image_url)
+           SELECT 'Рамка ' || %(tag)s || ' ' || g, (g %% 30) + 0.5, 'https://cdn.bench.local/frame/' || g || '.png'
+           FROM generate_series(1, %(n)s) AS g""",
+        {'tag': tag, 'n': frames}
+    )
+    cur.execute(
+        """WITH u AS (SELECT id, row_number() OVER (ORDER BY id DESC) AS rn FROM users ORDER BY id DESC LIMIT %(users)s),
+                g AS (SELECT id, row_number() OVER (ORDER BY id DESC) AS rn FROM games ORDER BY id DESC LIMIT %(games)s)
+           INSERT INTO user_games (user_id, game_id)
+           SELECT u.id, g.id
+           FROM u
+           CROSS JOIN generate_series(1, GREATEST(%(ownership)s / GREATEST(%(users)s, 1), 1)) AS s(k)
+           JOIN g ON g.rn = 1 + (u.rn * 7 + s.k * 13) %% %(games)s
+           ON CONFLICT DO NOTHING""",
+        {'users': users, 'games': games, 'ownership': ownership}
+    )
+    cur.execute(
+        """WITH u AS (SELECT id, row_number() OVER (ORDER BY id DESC) AS rn FROM users ORDER BY id DESC LIMIT %(users)s),
+                f AS (SELECT id, row_number() OVER (ORDER BY id DESC) AS rn FROM frames ORDER BY id DESC LIMIT %(frames)s)
+           INSERT INTO user_frames (user_id, frame_id)
+           SELECT u.id, f.id
+           FROM u
+           JOIN f ON f.rn = 1 + u.rn %% %(frames)s
+           ON CONFLICT DO NOTHING""",
+        {'users': users, 'frames': frames}
+    )
+    cur.execute(
+        """INSERT INTO marketplace_items (seller_id, item_type, item_id, price)
+           SELECT ug.user_id, 'game', ug.game_id, 5 + (ug.id %% 40)
+           FROM user_games ug ORDER BY ug.id DESC LIMIT %s""",
+        (listings,)
+    )
+    cur.execute(
+        """INSERT INTO marketplace_feed (listing_id, seller_id, seller_username, item_type, item_id, item_name, item_image, price, created_at)
+           SELECT m.id, m.seller_id, u.username, m.item_type, m.item_id, g.title, g.logo_url, m.price, m.created_at
+           FROM marketplace_items m
+           JOIN users u ON u.id = m.seller_id
+           JOIN games g ON g.id = m.item_id
+           WHERE m.status = 'active' AND m.item_type = 'game'
+           ON CONFLICT DO NOTHING"""
+    )
+    conn.commit()
+    cur.execute("ANALYZE")
+    conn.commit()
+    cur.close()
+    return {'users': users, 'games': games, 'frames': frames, 'listings': listings, 'ownership': ownership}
+
+
+def rows_scanned(conn: Any) -> int:
+    cur = conn.cursor()
+    cur.execute("SELECT pg_stat_clear_snapshot()")
+    cur.execute("SELECT coalesce(sum(seq_tup_read + coalesce(idx_tup_fetch, 0)), 0) FROM pg_stat_user_tables")
+    value = int(cur.fetchone()[0])
+    cur.close()
+    conn.rollback()
+    return value
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+def summarize(samples: List[Dict[str, Any]], elapsed: float, scanned: int) -> Dict[str, Any]:
+    latencies = [s['ms'] for s in samples]
+    statuses: Dict[str, int] = {}
+    for s in samples:
+        statuses[str(s['status'])] = statuses.get(str(s['status']), 0) + 1
+    return {
+        'requests': len(samples),
+        'throughput_rps': round(len(samples) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(statistics.median(latencies), 2) if latencies else 0.0,
+        'p95_ms': round(percentile(latencies, 0.95), 2),
+        'p99_ms': round(percentile(latencies, 0.99), 2),
+        'queries_per_request': round(sum(s['queries'] for s in samples) / len(samples), 2) if samples else 0.0,
+        'db_ms_per_request': round(sum(s['db_ms'] for s in samples) / len(samples), 2) if samples else 0.0,
+        'rows_scanned': scanned,
+        'rows_scanned_per_request': round(scanned / len(samples), 1) if samples else 0.0,
+        'statuses': statuses
+    }
+
+
+def timed_call(function: Function, request: Dict[str, Any]) -> Dict[str, Any]:
+    started = time.perf_counter()
+    result = function.call(request)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    captured = function.last_metrics()
+    return {'ms': elapsed_ms, 'status': result.get('statusCode'), 'queries': captured['queries'], 'db_ms': captured['db_ms'], 'response': result}
+
+
+def run_serial(function: Function, requests: List[Dict[str, Any]], on_result: Optional[Callable[[Dict[str, Any]], None]] = None) -> List[Dict[str, Any]]:
+    samples = []
+    for request in requests:
+        sample = timed_call(function, request)
+        if on_result:
+            on_result(sample)
+        samples.append(sample)
+    return samples
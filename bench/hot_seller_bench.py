@@ -0,0 +1,138 @@
+'''
+Business: Пропускная способность покупок у одного популярного продавца: обычный счёт против полосатого (hot_accounts)
+Запуск: DATABASE_URL=postgresql://... python bench/hot_seller_bench.py --buyers 64 --listings 2000 --stripes 16
+Только для одноразовой локальной БД с применёнными db_migrations: скрипт создаёт продавца, покупателей и лоты.
+'''
+import argparse
+import json
+import os
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List
+
+import harness
+
+
+def seed(conn: Any, buyers: int, listings: int, price: float) -> Dict[str, Any]:
+    tag = uuid.uuid4().hex[:8]
+    cur = conn.cursor()
+    cur.execute(
+        "INSERT INTO users (email, password, username, display_name) VALUES (%s, 'x', %s, %s) RETURNING id",
+        (f'hot_{tag}@bench.local', f'hot_{tag}', f'hot_{tag}')
+    )
+    seller_id = cur.fetchone()[0]
+    cur.execute(
+        """INSERT INTO users (email, password, username, display_name, balance)
+           SELECT 'hb_' || %(tag)s || '_' || g || '@bench.local', 'x', 'hb_' || %(tag)s || '_' || g, 'hb_' || g, %(balance)s
+           FROM generate_series(1, %(n)s) AS g
+           RETURNING id""",
+        {'tag': tag, 'n': buyers, 'balance': price * listings}
+    )
+    buyer_ids = [row[0] for row in cur.fetchall()]
+    cur.execute(
+        "INSERT INTO balance_transactions (user_id, amount, kind) SELECT unnest(%s::integer[]), %s, 'opening'",
+        (buyer_ids, price * listings)
+    )
+    cur.execute("INSERT INTO frames (name, price, image_url) VALUES (%s, %s, 'bench.png') RETURNING id", (f'hot_frame_{tag}', price))
+    frame_id = cur.fetchone()[0]
+    cur.execute(
+        """INSERT INTO marketplace_items (seller_id, item_type, item_id, price)
+           SELECT %s, 'frame', %s, %s FROM generate_series(1, %s)
+           RETURNING id""",
+        (seller_id, frame_id, price, listings)
+    )
+    listing_ids = [row[0] for row in cur.fetchall()]
+    cur.execute(
+        """INSERT INTO marketplace_feed (listing_id, seller_id, seller_username, item_type, item_id, item_name, item_image, price, created_at)
+           SELECT m.id, m.seller_id, %s, m.item_type, m.item_id, %s, 'bench.png', m.price, m.created_at
+           FROM marketplace_items m WHERE m.id = ANY(%s)""",
+        (f'hot_{tag}', f'hot_frame_{tag}', listing_ids)
+    )
+    conn.commit()
+    cur.close()
+    return {'seller_id': seller_id, 'buyer_ids': buyer_ids, 'listing_ids': listing_ids}
+
+
+def account_balance(conn: Any, user_id: int) -> float:
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT account_balance(id, balance) FROM users WHERE id = %s",
+        (user_id,)
+    )
+    value = float(cur.fetchone()[0])
+    cur.close()
+    conn.rollback()
+    return value
+
+
+def run_storm(conn: Any, function: harness.Function, buyers: int, listings: int, price: float, concurrency: int, stripes: int) -> Dict[str, Any]:
+    data = seed(conn, buyers, listings, price)
+    cur = conn.cursor()
+    if stripes:
+        cur.execute("INSERT INTO hot_accounts (user_id, stripes) VALUES (%s, %s)", (data['seller_id'], stripes))
+    conn.commit()
+    cur.close()
+
+    # Каждый лот покупает ровно один покупатель: конкуренция только за счёт продавца
+    requests = [
+        harness.event('POST', body={'action': 'buy', 'item_id': listing_id, 'buyer_id': data['buyer_ids'][i % buyers]})
+        for i, listing_id in enumerate(data['listing_ids'])
+    ]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        samples = list(pool.map(lambda request: harness.timed_call(function, request), requests))
+    elapsed = time.perf_counter() - started
+
+    sold = sum(1 for sample in samples if sample['status'] == 200)
+    failures: List[str] = []
+    earned = account_balance(conn, data['seller_id'])
+    if abs(earned - sold * round(price * 0.9, 2)) > 0.001:
+        failures.append(f'продавцу начислено {earned}, ожидалось {sold * round(price * 0.9, 2)}')
+
+    cur = conn.cursor()
+    cur.execute("SELECT ledger_fold_all()")
+    conn.commit()
+    cur.execute(
+        "SELECT count(*) FROM ledger_reconcile() WHERE user_id = ANY(%s)",
+        (data['buyer_ids'] + [data['seller_id']],)
+    )
+    mismatches = cur.fetchone()[0]
+    cur.close()
+    conn.rollback()
+    if mismatches:
+        failures.append(f'{mismatches} счетов расходятся с журналом')
+    if account_balance(conn, data['seller_id']) != earned:
+        failures.append('перенос полос изменил баланс продавца')
+
+    return {'stripes': stripes, 'sold': sold, **harness.summarize(samples, elapsed, 0), 'failures': failures}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--buyers', type=int, default=64)
+    parser.add_argument('--listings', type=int, default=2000)
+    parser.add_argument('--price', type=float, default=10.0)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--stripes', type=int, default=16)
+    args = parser.parse_args()
+
+    os.environ.setdefault('DB_POOL_MAX_SIZE', str(args.concurrency))
+    function = harness.Function('marketplace')
+    conn = harness.connect()
+
+    report = [
+        run_storm(conn, function, args.buyers, args.listings, args.price, args.concurrency, 0),
+        run_storm(conn, function, args.buyers, args.listings, args.price, args.concurrency, args.stripes)
+    ]
+    conn.close()
+    for result in report:
+        result.pop('rows_scanned')
+        result.pop('rows_scanned_per_request')
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    sys.exit(1 if any(result['failures'] for result in report) else 0)
+
+
+if __name__ == '__main__':
+    main()
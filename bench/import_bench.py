@@ -0,0 +1,110 @@
+'''
+Business: Загрузка каталога игр через COPY: время и пик памяти процесса для файлов растущего размера
+Запуск: DATABASE_URL=postgresql://... python bench/import_bench.py --rows 1000 10000 100000 --format ndjson
+Пик памяти сверх самого тела запроса должен оставаться постоянным: строки не собираются в список, а идут в COPY потоком.
+Только для одноразовой локальной БД с применёнными db_migrations: скрипт добавляет игры в каталог.
+'''
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+import uuid
+from typing import Dict, Any, List
+
+import harness
+
+# Допустимый пик памяти сверх тела запроса, МБ
+EXTRA_MEMORY_BUDGET_MB = 16.0
+
+
+def build_body(rows: int, fmt: str, tag: str) -> str:
+    '''
+    Business: Синтетический каталог: каждая 50-я строка без цены, каждая 100-я повторяет предыдущую
+    '''
+    records: List[Dict[str, Any]] = []
+    for i in range(rows):
+        n = i - 1 if i % 100 == 99 else i
+        records.append({
+            'title': f'Импорт {tag} {n}',
+            'description': 'Описание игры из каталога издателя. ' * 5,
+            'price': None if i % 50 == 24 else f'{n % 60}.99',
+            'genre': ('action', 'strategy', 'racing', 'puzzle', 'rpg')[n % 5],
+            'age_rating': '12+',
+            'logo_url': f'https://cdn.bench.local/import/{n}.png',
+            'screenshots': [f'https://cdn.bench.local/import/{n}_1.png']
+        })
+    if fmt == 'ndjson':
+        return '\n'.join(json.dumps(record, ensure_ascii=False) for record in records)
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=list(records[0]), lineterminator='\n')
+    writer.writeheader()
+    for record in records:
+        writer.writerow({**record, 'screenshots': ' '.join(record['screenshots'])})
+    return buffer.getvalue()
+
+
+def admin_headers(function: harness.Function) -> Dict[str, str]:
+    conn = harness.connect()
+    cur = conn.cursor()
+    cur.execute("SELECT id FROM users WHERE role = 'admin' ORDER BY id LIMIT 1")
+    admin_id = cur.fetchone()[0]
+    conn.close()
+    token = function.module.session.issue_tokens({'id': admin_id, 'role': 'admin', 'is_banned': False})['token']
+    return {'Authorization': f'Bearer {token}'}
+
+
+def run(function: harness.Function, headers: Dict[str, str], rows: int, fmt: str) -> Dict[str, Any]:
+    tag = uuid.uuid4().hex[:8]
+    body = build_body(rows, fmt, tag)
+    request = harness.event('POST', {'mode': 'import', 'format': fmt, 'publisher': f'import_{tag}'}, headers=headers)
+    request['body'] = body
+    body_mb = len(body.encode('utf-8')) / 2 ** 20
+
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    result = function.call(request)
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1] - baseline
+    tracemalloc.stop()
+
+    report = json.loads(result['body'])
+    return {
+        'rows': rows,
+        'status': result['statusCode'],
+        'body_mb': round(body_mb, 2),
+        'elapsed_s': round(elapsed, 2),
+        'rows_per_s': round(rows / elapsed) if elapsed else 0,
+        'peak_extra_mb': round(peak / 2 ** 20, 2),
+        'inserted': report.get('inserted'),
+        'rejected': report.get('rejected'),
+        'queries': function.last_metrics()['queries']
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--format', choices=('ndjson', 'csv'), default='ndjson')
+    args = parser.parse_args()
+
+    os.environ.setdefault('SESSION_SECRET', 'bench-secret')
+    function = harness.Function('games')
+    headers = admin_headers(function)
+    results = [run(function, headers, rows, args.format) for rows in args.rows]
+    failures = [
+        f"{result['rows']} строк: статус {result['status']}" if result['status'] != 200
+        else f"{result['rows']} строк: пик памяти {result['peak_extra_mb']} МБ > {EXTRA_MEMORY_BUDGET_MB} МБ"
+        for result in results
+        if result['status'] != 200 or result['peak_extra_mb'] > EXTRA_MEMORY_BUDGET_MB
+    ]
+    print(json.dumps({'format': args.format, 'results': results, 'failures': failures}, ensure_ascii=False, indent=2))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+'''
+Business: Задержка почты для пользователя со 100k сообщений: список диалогов, лента диалога, отметки о прочтении, long-poll
+Запуск: DATABASE_URL=postgresql://... python bench/inbox_bench.py --messages 100000 --peers 500 --requests 200
+Только для одноразовой локальной БД с применёнными db_migrations: скрипт создаёт пользователей и сообщения.
+'''
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from typing import Dict, Any, List
+
+import harness
+
+# Допустимый p95 (мс) для каждого сценария; превышение - код выхода 1
+P95_BUDGET_MS = {'conversations': 50.0, 'conversations_deep': 50.0, 'thread': 30.0, 'thread_deep': 30.0, 'read_receipts': 50.0}
+
+
+def seed(conn: Any, messages: int, peers: int) -> Dict[str, Any]:
+    '''
+    Business: Владелец почты, его собеседники и сообщения в обе стороны; диалоги заполняются как в V0017
+    Returns: id владельца и собеседников, самый длинный диалог и его первое сообщение, последнее входящее
+    '''
+    tag = uuid.uuid4().hex[:8]
+    cur = conn.cursor()
+    cur.execute(
+        """INSERT INTO users (email, password, username, display_name)
+           SELECT 'ib_' || %(tag)s || '_' || g || '@bench.local', 'x', 'ib_' || %(tag)s || '_' || g, 'ib_' || g
+           FROM generate_series(0, %(peers)s) AS g
+           ORDER BY g
+           RETURNING id""",
+        {'tag': tag, 'peers': peers}
+    )
+    ids = [row[0] for row in cur.fetchall()]
+    owner_id, peer_ids = ids[0], ids[1:]
+    # Каждое третье сообщение исходящее, непрочитанные - последние 5% входящих
+    cur.execute(
+        """INSERT INTO messages (sender_id, recipient_id, message, read_at)
+           SELECT CASE WHEN g %% 3 = 0 THEN %(owner)s ELSE p.peer END,
+                  CASE WHEN g %% 3 = 0 THEN p.peer ELSE %(owner)s END,
+                  'Сообщение ' || g,
+                  CASE WHEN g < %(n)s * 0.95 THEN now() END
+           FROM generate_series(1, %(n)s) AS g
+           CROSS JOIN LATERAL (SELECT (%(peers)s::integer[])[1 + (g * g) %% %(count)s] AS peer) p""",
+        {'owner': owner_id, 'peers': peer_ids, 'count': len(peer_ids), 'n': messages}
+    )
+    cur.execute(
+        """INSERT INTO conversations (user_id, peer_id, last_message_id, unread_count)
+           SELECT c.user_id, c.peer_id, max(c.id), count(*) FILTER (WHERE c.unread)
+           FROM (
+               SELECT sender_id AS user_id, recipient_id AS peer_id, id, false AS unread FROM messages WHERE sender_id = %(owner)s
+               UNION ALL
+               SELECT recipient_id, sender_id, id, read_at IS NULL FROM messages WHERE recipient_id = %(owner)s
+               UNION ALL
+               SELECT sender_id, recipient_id, id, false FROM messages WHERE recipient_id = %(owner)s
+               UNION ALL
+               SELECT recipient_id, sender_id, id, read_at IS NULL FROM messages WHERE sender_id = %(owner)s
+           ) c
+           GROUP BY c.user_id, c.peer_id""",
+        {'owner': owner_id}
+    )
+    cur.execute(
+        """SELECT CASE WHEN sender_id = %(owner)s THEN recipient_id ELSE sender_id END, min(id)
+           FROM messages WHERE sender_id = %(owner)s OR recipient_id = %(owner)s
+           GROUP BY 1 ORDER BY count(*) DESC LIMIT 1""",
+        {'owner': owner_id}
+    )
+    busiest_peer, oldest_id = cur.fetchone()
+    cur.execute("SELECT max(id) FROM messages WHERE recipient_id = %s", (owner_id,))
+    last_inbound_id = cur.fetchone()[0]
+    conn.commit()
+    cur.execute("ANALYZE messages")
+    cur.execute("ANALYZE conversations")
+    conn.commit()
+    cur.close()
+    return {
+        'owner_id': owner_id,
+        'peer_ids': peer_ids,
+        'busiest_peer': busiest_peer,
+        'oldest_id': oldest_id,
+        'last_inbound_id': last_inbound_id
+    }
+
+
+def measure(function: harness.Function, requests: List[Dict[str, Any]]) -> Dict[str, Any]:
+    started = time.perf_counter()
+    samples = harness.run_serial(function, requests)
+    summary = harness.summarize(samples, time.perf_counter() - started, 0)
+    summary.pop('rows_scanned')
+    summary.pop('rows_scanned_per_request')
+    return summary
+
+
+def measure_poll(function: harness.Function, data: Dict[str, Any], headers: Dict[str, str], rounds: int) -> Dict[str, Any]:
+    '''
+    Business: Время от отправки сообщения до возврата ожидающего long-poll запроса получателя
+    '''
+    peer_token = function.module.session.issue_tokens({'id': data['peer_ids'][0], 'role': 'user', 'is_banned': False})['token']
+    peer_headers = {'Authorization': f'Bearer {peer_token}'}
+    next_since = data['last_inbound_id']
+    delays = []
+    for _ in range(rounds):
+        result: Dict[str, Any] = {}
+        poll = threading.Thread(target=lambda: result.update(function.call(
+            harness.event('GET', {'view': 'poll', 'since': str(next_since), 'timeout': '5'}, headers=headers)
+        )))
+        poll.start()
+        time.sleep(0.05)
+        sent_at = time.perf_counter()
+        function.call(harness.event('POST', body={'action': 'send', 'recipient_id': data['owner_id'], 'message': 'ping'}, headers=peer_headers))
+        poll.join()
+        delays.append({'ms': (time.perf_counter() - sent_at) * 1000, 'status': result.get('statusCode')})
+        next_since = json.loads(result['body'])['next_since']
+    return {
+        'p50_ms': round(harness.percentile([d['ms'] for d in delays], 0.5), 2),
+        'p95_ms': round(harness.percentile([d['ms'] for d in delays], 0.95), 2),
+        'statuses': sorted({d['status'] for d in delays})
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=100000)
+    parser.add_argument('--peers', type=int, default=500)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--poll-rounds', type=int, default=20)
+    args = parser.parse_args()
+
+    os.environ.setdefault('SESSION_SECRET', 'bench-secret')
+    conn = harness.connect()
+    data = seed(conn, args.messages, args.peers)
+    conn.close()
+
+    function = harness.Function('messages')
+    token = function.module.session.issue_tokens({'id': data['owner_id'], 'role': 'user', 'is_banned': False})['token']
+    headers = {'Authorization': f'Bearer {token}'}
+    deep_cursor = data['oldest_id'] + 50
+    event = harness.event
+
+    report = {
+        'conversations': measure(function, [event('GET', {'limit': '30'}, headers=headers)] * args.requests),
+        'conversations_deep': measure(function, [event('GET', {'limit': '30', 'cursor': str(deep_cursor)}, headers=headers)] * args.requests),
+        'thread': measure(function, [event('GET', {'peer_id': str(data['busiest_peer'])}, headers=headers)] * args.requests),
+        'thread_deep': measure(function, [event('GET', {'peer_id': str(data['busiest_peer']), 'cursor': str(deep_cursor)}, headers=headers)] * args.requests),
+        'read_receipts': measure(function, [
+            event('POST', body={'action': 'read', 'receipts': [{'peer_id': peer_id, 'up_to_id': 2 ** 31 - 1} for peer_id in data['peer_ids'][i:i + 10]]}, headers=headers)
+            for i in range(0, min(len(data['peer_ids']), args.requests * 10), 10)
+        ]),
+        'long_poll_delivery': measure_poll(function, data, headers, args.poll_rounds)
+    }
+    failures = [
+        f'{name}: p95 {report[name]["p95_ms"]} мс > {budget} мс'
+        for name, budget in P95_BUDGET_MS.items()
+        if report[name]['p95_ms'] > budget
+    ]
+    print(json.dumps({'seed': {'messages': args.messages, 'peers': args.peers}, 'report': report, 'failures': failures}, ensure_ascii=False, indent=2))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+'''
+Business: Локальный нагрузочный прогон всех функций: сценарии из tests.json, просмотр каталога, поиск, шквал покупок
+Запуск: DATABASE_URL=postgresql://... python bench/load_test.py --migrate --users 10000 --games 5000 --output bench/results/before.json
+        DATABASE_URL=postgresql://... python bench/load_test.py --compare bench/results/before.json
+Только для одноразовой локальной БД: --migrate применяет db_migrations к пустой базе, наполнение добавляет синтетические строки.
+'''
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
+
+import harness
+
+SEARCH_TERMS = ('приключ', 'стратег', 'гонк', 'игра 1', 'rpg')
+USER_SEARCH_TERMS = ('u', 'игрок 1', 'игрок 42', 'adm')
+
+
+def body_of(sample: Dict[str, Any]) -> Dict[str, Any]:
+    result = sample['response']
+    if result.get('statusCode') != 200 or result.get('isBase64Encoded'):
+        return {}
+    return json.loads(result.get('body') or '{}')
+
+
+def scenario_tests(functions: Dict[str, harness.Function], rounds: int) -> List[Dict[str, Any]]:
+    samples = []
+    for _ in range(rounds):
+        for name, function in functions.items():
+            samples.extend(harness.run_serial(function, harness.tests_json_events(name)))
+    return samples
+
+
+def scenario_browse(functions: Dict[str, harness.Function], sessions: int, pages: int) -> List[Dict[str, Any]]:
+    samples = []
+    for _ in range(sessions):
+        cursor: Optional[str] = None
+        for _ in range(pages):
+            params = {'status': 'approved', 'view': 'card', 'limit': '24', **({'cursor': str(cursor)} if cursor else {})}
+            sample = harness.timed_call(functions['games'], harness.event('GET', params))
+            samples.append(sample)
+            cursor = body_of(sample).get('next_cursor')
+            if not cursor:
+                break
+        cursor = None
+        for _ in range(pages):
+            params = {'limit': '24', **({'cursor': cursor} if cursor else {})}
+            sample = harness.timed_call(functions['marketplace'], harness.event('GET', params))
+            samples.append(sample)
+            cursor = body_of(sample).get('next_cursor')
+            if not cursor:
+                break
+        samples.append(harness.timed_call(functions['frames'], harness.event('GET')))
+    return samples
+
+
+def scenario_search(functions: Dict[str, harness.Function], rounds: int) -> List[Dict[str, Any]]:
+    samples = []
+    for _ in range(rounds):
+        for term in SEARCH_TERMS:
+            samples.append(harness.timed_call(functions['games'], harness.event('GET', {'status': 'approved', 'search': term})))
+        for term in USER_SEARCH_TERMS:
+            samples.append(harness.timed_call(functions['users'], harness.event('GET', {'search': term})))
+    return samples
+
+
+def scenario_buy_storm(functions: Dict[str, harness.Function], conn: Any, buyers: int, listings: int, concurrency: int) -> List[Dict[str, Any]]:
+    cur = conn.cursor()
+    cur.execute("SELECT listing_id FROM marketplace_feed ORDER BY created_at DESC, listing_id DESC LIMIT %s", (listings,))
+    listing_ids = [row[0] for row in cur.fetchall()]
+    cur.execute("SELECT id FROM users WHERE email LIKE '%%@bench.local' ORDER BY id DESC LIMIT %s", (buyers,))
+    buyer_ids = [row[0] for row in cur.fetchall()]
+    cur.close()
+    conn.rollback()
+    if not listing_ids or not buyer_ids:
+        return []
+    # Несколько покупателей на каждый лот: успешной должна быть ровно одна покупка, остальные получают 409
+    requests = [
+        harness.event('POST', body={'action': 'buy', 'item_id': listing_id, 'buyer_id': random.choice(buyer_ids)})
+        for listing_id in listing_ids for _ in range(3)
+    ]
+    random.shuffle(requests)
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(lambda request: harness.timed_call(functions['marketplace'], request), requests))
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    conn = harness.connect()
+    if args.migrate:
+        harness.apply_migrations(conn)
+    seeded = harness.seed(conn, args.users, args.games, args.frames, args.listings, args.ownership) if args.users else {}
+    functions = harness.load_functions()
+
+    scenarios = {
+        'tests_json': lambda: scenario_tests(functions, args.rounds),
+        'browse': lambda: scenario_browse(functions, args.sessions, args.pages),
+        'search': lambda: scenario_search(functions, args.rounds),
+        'buy_storm': lambda: scenario_buy_storm(functions, conn, args.buyers, args.storm_listings, args.concurrency)
+    }
+    report: Dict[str, Any] = {
+        'started_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'seed': seeded,
+        'scenarios': {}
+    }
+    for name in args.scenarios:
+        before = harness.rows_scanned(conn)
+        started = time.perf_counter()
+        samples = scenarios[name]()
+        elapsed = time.perf_counter() - started
+        # Статистика pg_stat_user_tables публикуется с задержкой
+        time.sleep(args.stats_delay)
+        report['scenarios'][name] = harness.summarize(samples, elapsed, harness.rows_scanned(conn) - before)
+        print(f'{name}: ' + json.dumps(report['scenarios'][name], ensure_ascii=False), file=sys.stderr)
+    conn.close()
+    return report
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any]) -> Dict[str, Any]:
+    keys = ('p50_ms', 'p95_ms', 'p99_ms', 'queries_per_request', 'rows_scanned_per_request')
+    diff = {}
+    for name, current in report['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(name)
+        if previous:
+            diff[name] = {key: {'before': previous[key], 'after': current[key], 'delta': round(current[key] - previous[key], 2)} for key in keys}
+    return diff
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--migrate', action='store_true', help='применить db_migrations к пустой базе')
+    parser.add_argument('--users', type=int, default=0, help='0 - не наполнять базу')
+    parser.add_argument('--games', type=int, default=2000)
+    parser.add_argument('--frames', type=int, default=50)
+    parser.add_argument('--listings', type=int, default=2000)
+    parser.add_argument('--ownership', type=int, default=20000, help='примерное число строк user_games')
+    parser.add_argument('--scenarios', nargs='+', default=['tests_json', 'browse', 'search', 'buy_storm'],
+                        choices=['tests_json', 'browse', 'search', 'buy_storm'])
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--sessions', type=int, default=50)
+    parser.add_argument('--pages', type=int, default=5)
+    parser.add_argument('--buyers', type=int, default=200)
+    parser.add_argument('--storm-listings', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--stats-delay', type=float, default=1.0)
+    parser.add_argument('--output', help='куда сохранить JSON с результатами')
+    parser.add_argument('--compare', help='JSON предыдущего прогона для сравнения')
+    args = parser.parse_args()
+
+    os.environ.setdefault('DB_POOL_MAX_SIZE', str(args.concurrency))
+    os.environ.setdefault('SESSION_SECRET', 'bench-secret')
+    report = run(args)
+    if args.compare:
+        with open(args.compare) as f:
+            report['comparison'] = compare(report, json.load(f))
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+'''
+Business: Нагрузочная проверка покупки на торговой площадке при конкуренции покупателей
+Запуск: DATABASE_URL=postgresql://... python bench/marketplace_buy_stress.py --buyers 32 --listings 200
+Только для одноразовой локальной БД с применёнными db_migrations: скрипт создаёт тестовых пользователей и лоты.
+'''
+import argparse
+import json
+import os
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from typing import Dict, Any, List
+
+import psycopg2
+
+import harness
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'marketplace'))
+
+
+def seed(conn: Any, handler: Any, buyers: int, listings: int, price: float, buyer_balance: float) -> Dict[str, Any]:
+    tag = uuid.uuid4().hex[:8]
+    cur = conn.cursor()
+    cur.execute(
+        "INSERT INTO users (email, password, username, display_name) VALUES (%s, 'x', %s, %s) RETURNING id",
+        (f'seller_{tag}@bench.local', f'seller_{tag}', f'seller_{tag}')
+    )
+    seller_id = cur.fetchone()[0]
+    buyer_ids = []
+    for i in range(buyers):
+        cur.execute(
+            "INSERT INTO users (email, password, username, display_name, balance) VALUES (%s, 'x', %s, %s, %s) RETURNING id",
+            (f'buyer_{tag}_{i}@bench.local', f'buyer_{tag}_{i}', f'buyer_{tag}_{i}', buyer_balance)
+        )
+        buyer_ids.append(cur.fetchone()[0])
+    cur.execute("INSERT INTO frames (name, price, image_url) VALUES (%s, %s, 'bench.png') RETURNING id", (f'frame_{tag}', price))
+    frame_id = cur.fetchone()[0]
+    conn.commit()
+    cur.close()
+    listing_ids = []
+    for _ in range(listings):
+        event = {'httpMethod': 'POST', 'body': json.dumps({'action': 'sell', 'seller_id': seller_id, 'item_type': 'frame', 'item_id': frame_id, 'price': price})}
+        response = handler(event, SimpleNamespace(request_id=uuid.uuid4().hex, function_name='marketplace'))
+        listing_ids.append(json.loads(response['body'])['item_id'])
+    return {'seller_id': seller_id, 'buyer_ids': buyer_ids, 'listing_ids': listing_ids, 'frame_id': frame_id}
+
+
+def call(handler: Any, body: Dict[str, Any]) -> int:
+    # Исключение обработчика (например, DeadlockDetected) на платформе превращается в 500: считаем его так же,
+    # иначе pool.map пробросит его и прервёт прогон вместо того, чтобы засчитать как сбой
+    context = SimpleNamespace(request_id=uuid.uuid4().hex, function_name='marketplace')
+    try:
+        return handler({'httpMethod': 'POST', 'body': json.dumps(body)}, context)['statusCode']
+    except Exception:
+        return 500
+
+
+def buy(handler: Any, listing_id: int, buyer_id: int) -> int:
+    return call(handler, {'action': 'buy', 'item_id': listing_id, 'buyer_id': buyer_id})
+
+
+def checkout(handler: Any, listing_ids: List[int], buyer_id: int) -> int:
+    return call(handler, {'action': 'checkout', 'item_ids': listing_ids, 'buyer_id': buyer_id, 'mode': 'best_effort'})
+
+
+def frame_purchase_check(conn: Any, handler: Any, price: float) -> List[str]:
+    '''
+    Business: Покупка рамок через buy и checkout и переключение активной рамки при уникальном индексе из V0015
+    Returns: список нарушений (пустой, если всё прошло)
+    '''
+    failures = []
+    first = seed(conn, handler, 1, 1, price, price * 10)
+    second = seed(conn, handler, 0, 1, price, 0)
+    buyer_id = first['buyer_ids'][0]
+    codes = [buy(handler, first['listing_ids'][0], buyer_id), checkout(handler, second['listing_ids'], buyer_id)]
+    if codes != [200, 200]:
+        failures.append(f'рамки: покупка через buy и checkout вернула {codes}')
+
+    frames = harness.Function('frames')
+    for frame_id in (first['frame_id'], second['frame_id']):
+        result = frames.call(harness.event('PUT', body={'action': 'set_active', 'user_id': buyer_id, 'frame_id': frame_id}))
+        if result['statusCode'] != 200:
+            failures.append(f'рамки: set_active {frame_id} вернул {result["statusCode"]}')
+    cur = conn.cursor()
+    cur.execute("SELECT array_agg(frame_id) FROM user_frames WHERE user_id = %s AND is_active", (buyer_id,))
+    active = cur.fetchone()[0]
+    cur.close()
+    conn.rollback()
+    if active != [second['frame_id']]:
+        failures.append(f'рамки: активные рамки {active}, ожидалась {second["frame_id"]}')
+    return failures
+
+
+def balances(conn: Any, user_ids: List[int]) -> Dict[int, float]:
+    cur = conn.cursor()
+    cur.execute("SELECT id, balance FROM users WHERE id = ANY(%s)", (user_ids,))
+    result = {row[0]: float(row[1]) for row in cur.fetchall()}
+    cur.close()
+    conn.rollback()
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--buyers', type=int, default=32)
+    parser.add_argument('--listings', type=int, default=200)
+    parser.add_argument('--price', type=float, default=10.0)
+    args = parser.parse_args()
+
+    os.environ.setdefault('DB_POOL_MAX_SIZE', str(args.buyers))
+    from index import handler
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    failures = []
+
+    # Сценарий 1: все покупатели одновременно покупают один и тот же лот
+    data = seed(conn, handler, args.buyers, 1, args.price, args.price * 10)
+    with ThreadPoolExecutor(max_workers=args.buyers) as pool:
+        codes = list(pool.map(lambda b: buy(handler, data['listing_ids'][0], b), data['buyer_ids']))
+    if codes.count(200) != 1 or codes.count(409) != args.buyers - 1:
+        failures.append(f'один лот: ожидался 1 успех и {args.buyers - 1} конфликтов, получено {codes}')
+
+    # Сценарий 2: распродажа — покупатели разбирают много лотов одного продавца, денег хватает не всем
+    affordable = 3
+    data = seed(conn, handler, args.buyers, args.listings, args.price, args.price * affordable)
+    before = balances(conn, data['buyer_ids'] + [data['seller_id']])
+    jobs = [(listing_id, data['buyer_ids'][i % args.buyers]) for i, listing_id in enumerate(data['listing_ids'])]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.buyers) as pool:
+        codes = list(pool.map(lambda job: buy(handler, *job), jobs))
+    elapsed = time.perf_counter() - started
+    after = balances(conn, data['buyer_ids'] + [data['seller_id']])
+
+    sold = codes.count(200)
+    expected_sold = min(args.listings, args.buyers * affordable)
+    if sold != expected_sold:
+        failures.append(f'распродажа: продано {sold}, ожидалось {expected_sold}')
+    spent = sum(before[b] - after[b] for b in data['buyer_ids'])
+    earned = after[data['seller_id']] - before[data['seller_id']]
+    if abs(spent - sold * args.price) > 0.001 or abs(earned - sold * round(args.price * 0.9, 2)) > 0.001:
+        failures.append(f'распродажа: баланс не сходится, списано {spent}, начислено {earned}, продано {sold}')
+    if any(after[b] < 0 for b in data['buyer_ids']):
+        failures.append('распродажа: отрицательный баланс покупателя')
+
+    cur = conn.cursor()
+    cur.execute("SELECT count(*) FROM marketplace_feed WHERE listing_id = ANY(%s)", (data['listing_ids'],))
+    if cur.fetchone()[0] != args.listings - sold:
+        failures.append('распродажа: лента активных лотов рассинхронизирована')
+    cur.close()
+
+    # Сценарий 3: много независимых покупок одновременно - разные покупатели и разные обычные (не hot) продавцы.
+    # Каждая покупка меняет users дважды (списание и зачисление); ни одна не должна упасть на взаимной блокировке
+    pairs = [seed(conn, handler, 1, 1, args.price, args.price * 10) for _ in range(args.buyers)]
+    with ThreadPoolExecutor(max_workers=args.buyers) as pool:
+        independent = list(pool.map(lambda data: buy(handler, data['listing_ids'][0], data['buyer_ids'][0]), pairs))
+    if independent.count(200) != len(pairs):
+        failures.append(f'независимые продавцы: ожидалось {len(pairs)} успехов, получено {dict((str(c), independent.count(c)) for c in set(independent))}')
+
+    # Сценарий 4: рамки покупаются и переключаются при уникальном индексе активной рамки
+    failures += frame_purchase_check(conn, handler, args.price)
+    conn.close()
+
+    print(json.dumps({
+        'requests': len(jobs),
+        'sold': sold,
+        'status_codes': {str(code): codes.count(code) for code in sorted(set(codes))},
+        'seconds': round(elapsed, 3),
+        'requests_per_second': round(len(jobs) / elapsed, 1),
+        'failures': failures
+    }, ensure_ascii=False, indent=2))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
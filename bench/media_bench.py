@@ -0,0 +1,131 @@
+'''
+Business: Загрузка изображений: пропускная способность по числу потоков пула, повторная загрузка (дедупликация), вес вариантов против оригинала
+Запуск: DATABASE_URL=postgresql://... python bench/media_bench.py --images 40 --workers 1 2 4 8
+Нужен Pillow; файлы пишутся во временный каталог (ASSET_STORAGE=local), сравниваются размеры оригинала и вариантов.
+Только для одноразовой локальной БД с применёнными db_migrations: скрипт создаёт пользователя и строки image_assets.
+'''
+import argparse
+import base64
+import glob
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+from typing import Dict, Any, List
+
+from PIL import Image, ImageDraw
+
+import harness
+
+# Допустимый p95 (мс) повторной загрузки пакета и доля веса варианта от оригинала; превышение - код выхода 1
+DEDUP_P95_BUDGET_MS = 100.0
+VARIANT_SHARE_BUDGET = {'thumb': 0.02, 'card': 0.10}
+BATCH_SIZE = 10
+
+
+def synthetic_image(seed: int, width: int, height: int) -> bytes:
+    '''
+    Business: JPEG «скриншот»: градиент, фигуры и шум, чтобы сжатие было похоже на настоящие обложки
+    '''
+    rng = random.Random(seed)
+    image = Image.linear_gradient('L').resize((width, height)).convert('RGB')
+    draw = ImageDraw.Draw(image)
+    for _ in range(40):
+        x, y = rng.randrange(width), rng.randrange(height)
+        color = (rng.randrange(256), rng.randrange(256), rng.randrange(256))
+        draw.rectangle((x, y, x + rng.randrange(20, width // 3), y + rng.randrange(20, height // 3)), fill=color)
+    noise = Image.effect_noise((width, height), 40).convert('RGB')
+    image = Image.blend(image, noise, 0.15)
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def create_user(conn: Any) -> int:
+    tag = uuid.uuid4().hex[:8]
+    cur = conn.cursor()
+    cur.execute(
+        "INSERT INTO users (email, password, username, display_name) VALUES (%s, 'x', %s, %s) RETURNING id",
+        (f'media_{tag}@bench.local', f'media_{tag}', f'media_{tag}')
+    )
+    user_id = cur.fetchone()[0]
+    conn.commit()
+    cur.close()
+    return user_id
+
+
+def upload_events(payloads: List[bytes], headers: Dict[str, str]) -> List[Dict[str, Any]]:
+    return [
+        harness.event('POST', body={'action': 'upload', 'images': [{'data': base64.b64encode(p).decode('ascii')} for p in payloads[i:i + BATCH_SIZE]]}, headers=headers)
+        for i in range(0, len(payloads), BATCH_SIZE)
+    ]
+
+
+def measure_throughput(workers: int, payloads: List[bytes], user_id: int, root: str) -> Dict[str, Any]:
+    os.environ['ASSET_WORKERS'] = str(workers)
+    os.environ['ASSET_LOCAL_ROOT'] = root
+    os.environ['ASSET_BASE_URL'] = f'file://{root}'
+    function = harness.Function('media')
+    token = function.module.session.issue_tokens({'id': user_id, 'role': 'user', 'is_banned': False})['token']
+    headers = {'Authorization': f'Bearer {token}'}
+
+    started = time.perf_counter()
+    samples = harness.run_serial(function, upload_events(payloads, headers))
+    elapsed = time.perf_counter() - started
+    dedup = harness.run_serial(function, upload_events(payloads, headers))
+    uploaded = [image for sample in dedup for image in json.loads(sample['response']['body']).get('images', [])]
+    return {
+        'workers': workers,
+        'statuses': sorted({sample['status'] for sample in samples + dedup}),
+        'images_per_s': round(len(payloads) / elapsed, 1) if elapsed else 0,
+        'batch_p95_ms': round(harness.percentile([s['ms'] for s in samples], 0.95), 1),
+        'dedup_p95_ms': round(harness.percentile([s['ms'] for s in dedup], 0.95), 1),
+        'dedup_hits': sum(1 for image in uploaded if image.get('deduplicated'))
+    }
+
+
+def variant_shares(root: str) -> Dict[str, float]:
+    originals = sum(os.path.getsize(path) for path in glob.glob(os.path.join(root, '*', '*', 'original.*')))
+    return {
+        variant: round(sum(os.path.getsize(path) for path in glob.glob(os.path.join(root, '*', '*', f'{variant}.webp'))) / originals, 4)
+        for variant in ('thumb', 'card', 'large')
+    } if originals else {}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--images', type=int, default=40)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--size', type=int, nargs=2, default=[1920, 1080])
+    args = parser.parse_args()
+
+    os.environ.setdefault('SESSION_SECRET', 'bench-secret')
+    os.environ['ASSET_STORAGE'] = 'local'
+    conn = harness.connect()
+    user_id = create_user(conn)
+    conn.close()
+
+    results = []
+    shares: Dict[str, float] = {}
+    for workers in args.workers:
+        # Новые изображения на каждый прогон: иначе второй и следующие прогоны попадут в дедупликацию
+        seed = random.randrange(2 ** 31)
+        payloads = [synthetic_image(seed + i, *args.size) for i in range(args.images)]
+        with tempfile.TemporaryDirectory() as root:
+            results.append(measure_throughput(workers, payloads, user_id, root))
+            shares = shares or variant_shares(root)
+
+    failures = [f'{r["workers"]} потоков: статусы {r["statuses"]}' for r in results if r['statuses'] != [200]]
+    failures += [f'{r["workers"]} потоков: дедупликация {r["dedup_hits"]} из {args.images}' for r in results if r['dedup_hits'] != args.images]
+    failures += [f'{r["workers"]} потоков: p95 повтора {r["dedup_p95_ms"]} мс > {DEDUP_P95_BUDGET_MS} мс' for r in results if r['dedup_p95_ms'] > DEDUP_P95_BUDGET_MS]
+    failures += [f'{variant}: {shares.get(variant)} веса оригинала > {budget}' for variant, budget in VARIANT_SHARE_BUDGET.items() if shares.get(variant, 1.0) > budget]
+    print(json.dumps({'images': args.images, 'size': args.size, 'results': results, 'variant_share': shares, 'failures': failures}, ensure_ascii=False, indent=2))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+'''
+Business: Подбор рабочего фактора PBKDF2 под пиковую частоту входов
+Запуск: python bench/password_hash_bench.py --iterations 50000,100000,150000,300000 --peak-logins 50
+Показывает время одной проверки пароля и сколько ядер уйдёт на пиковую нагрузку входов.
+'''
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'auth'))
+
+import passwords
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', default='50000,100000,150000,300000,600000')
+    parser.add_argument('--repeats', type=int, default=20)
+    parser.add_argument('--peak-logins', type=float, default=50.0, help='входов в секунду в пике')
+    args = parser.parse_args()
+
+    report = []
+    for iterations in [int(value) for value in args.iterations.split(',')]:
+        stored = passwords.hash_password('benchmark-password', iterations)
+        samples = []
+        for _ in range(args.repeats):
+            started = time.perf_counter()
+            passwords.verify_password('benchmark-password', stored)
+            samples.append((time.perf_counter() - started) * 1000)
+        median_ms = statistics.median(samples)
+        report.append({
+            'iterations': iterations,
+            'verify_p50_ms': round(median_ms, 2),
+            'verify_max_ms': round(max(samples), 2),
+            'logins_per_core_per_second': round(1000 / median_ms, 1),
+            'cores_at_peak': round(args.peak_logins * median_ms / 1000, 2)
+        })
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+'''
+Business: Проверка планов запросов всех функций: EXPLAIN (FORMAT JSON) для каждого SQL, выполненного обработчиком
+Запуск: DATABASE_URL=postgresql://... python bench/plan_check.py --users 100000 --games 20000
+Код выхода 1, если горячий запрос перешёл на Seq Scan по большой таблице или его оценочная стоимость вышла за бюджет.
+Только для одноразовой локальной БД с применёнными db_migrations: --users наполняет базу синтетическими данными.
+'''
+import argparse
+import json
+import os
+import sys
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+import harness
+
+LARGE_TABLES = ('users', 'games', 'user_games', 'user_frames', 'frames', 'marketplace_items', 'marketplace_feed', 'friendships', 'item_rankings', 'seller_rankings')
+EXPLAINABLE = ('SELECT', 'WITH', 'UPDATE', 'INSERT', 'DELETE')
+
+
+class PlanCase:
+    '''
+    Business: Один вызов обработчика и требования к планам всех его запросов
+    Args: max_cost - бюджет оценочной стоимости (Total Cost) самого дорогого запроса вызова
+          allow_seq_scan - таблицы, полный просмотр которых для этого вызова ожидаем
+    '''
+
+    def __init__(self, name: str, function: str, event: Dict[str, Any], max_cost: float, allow_seq_scan: Tuple[str, ...] = ()):
+        self.name = name
+        self.function = function
+        self.event = event
+        self.max_cost = max_cost
+        self.allow_seq_scan = allow_seq_scan
+
+
+def load_fixtures(conn: Any) -> Dict[str, Any]:
+    cur = conn.cursor()
+    cur.execute("SELECT user_id FROM user_frames ORDER BY id DESC LIMIT 1")
+    frame_owner = cur.fetchone()
+    cur.execute("SELECT id, email FROM users ORDER BY id DESC LIMIT 1")
+    user = cur.fetchone()
+    cur.execute("SELECT genre FROM games WHERE status = 'approved' AND genre IS NOT NULL LIMIT 1")
+    genre = cur.fetchone()
+    cur.execute("SELECT user_id, friend_id FROM friendships ORDER BY id DESC LIMIT 1")
+    friendship = cur.fetchone()
+    cur.execute("SELECT game_id FROM user_games ORDER BY id DESC LIMIT 1")
+    owned_game = cur.fetchone()
+    cur.close()
+    conn.rollback()
+    return {
+        'frame_owner': frame_owner[0] if frame_owner else 1,
+        'user_id': user[0] if user else 1,
+        'email': user[1] if user else '',
+        'genre': genre[0] if genre else 'action',
+        'friend_owner': friendship[0] if friendship else 1,
+        'friend_id': friendship[1] if friendship else 1,
+        'owned_game': owned_game[0] if owned_game else 1
+    }
+
+
+def plan_cases(fixtures: Dict[str, Any]) -> List[PlanCase]:
+    event = harness.event
+    return [
+        PlanCase('games.catalog', 'games', event('GET', {'status': 'approved'}), 500),
+        PlanCase('games.catalog_card_page', 'games', event('GET', {'status': 'approved', 'view': 'card', 'limit': '24'}), 200),
+        PlanCase('games.catalog_cursor', 'games', event('GET', {'status': 'approved', 'view': 'card', 'cursor': '1000'}), 500),
+        PlanCase('games.genre', 'games', event('GET', {'status': 'approved', 'genre': fixtures['genre']}), 500),
+        PlanCase('games.featured', 'games', event('GET', {'status': 'approved', 'is_featured': 'true'}), 500),
+        PlanCase('games.pending', 'games', event('GET', {'status': 'pending', 'view': 'card'}), 500),
+        PlanCase('games.search', 'games', event('GET', {'status': 'approved', 'search': 'приключения'}), 5000),
+        PlanCase('games.home', 'games', event('GET', {'view': 'home'}), 200),
+        PlanCase('games.rankings_genre_trending', 'games', event('GET', {'view': 'rankings', 'ranking': 'trending', 'genre': fixtures['genre']}), 200),
+        PlanCase('games.rankings_frames_top', 'games', event('GET', {'view': 'rankings', 'item_type': 'frame'}), 200),
+        PlanCase('games.rankings_sellers', 'games', event('GET', {'view': 'rankings', 'item_type': 'seller', 'ranking': 'trending'}), 200),
+        PlanCase('frames.catalog', 'frames', event('GET'), 500, ('frames',)),
+        PlanCase('frames.inventory', 'frames', event('GET', {'user_id': str(fixtures['frame_owner'])}), 100, ('frames',)),
+        PlanCase('frames.inventory_page', 'frames', event('GET', {'user_id': str(fixtures['frame_owner']), 'view': 'inventory'}), 500, ('frames',)),
+        PlanCase('users.by_id', 'users', event('GET', {'user_id': str(fixtures['user_id'])}), 50),
+        PlanCase('users.profile', 'users', event('GET', {'user_id': str(fixtures['frame_owner']), 'view': 'profile'}), 200, ('frames',)),
+        PlanCase('users.profile_batch', 'users', event('GET', {'user_ids': ','.join(str(fixtures['user_id'] - i) for i in range(50)), 'view': 'profile'}), 5000, ('frames',)),
+        PlanCase('users.search_prefix', 'users', event('GET', {'search': 'u'}), 500),
+        PlanCase('users.search_trigram', 'users', event('GET', {'search': 'игрок 12'}), 5000),
+        PlanCase('users.friends', 'users', event('GET', {'user_id': str(fixtures['friend_owner']), 'view': 'friends'}), 500, ('frames',)),
+        PlanCase('users.friends_owning_game', 'users', event('GET', {'user_id': str(fixtures['friend_owner']), 'view': 'friends', 'game_id': str(fixtures['owned_game'])}), 5000, ('frames',)),
+        PlanCase('users.mutual_friends', 'users', event('GET', {'user_id': str(fixtures['friend_owner']), 'view': 'mutual_friends', 'user_ids': str(fixtures['friend_id'])}), 2000),
+        PlanCase('users.directory', 'users', event('GET'), 200),
+        PlanCase('users.directory_balance', 'users', event('GET', {'sort': 'balance', 'limit': '50'}), 200),
+        PlanCase('users.directory_created', 'users', event('GET', {'sort': 'created_at', 'created_from': '2020-01-01'}), 500),
+        PlanCase('users.directory_banned', 'users', event('GET', {'banned': 'true', 'sort': 'id'}), 200),
+        PlanCase('users.directory_role', 'users', event('GET', {'role': 'admin', 'sort': 'id'}), 200),
+        PlanCase('marketplace.feed', 'marketplace', event('GET', {'limit': '24'}), 200),
+        PlanCase('marketplace.feed_type', 'marketplace', event('GET', {'item_type': 'game', 'limit': '24'}), 500),
+        PlanCase('marketplace.feed_price', 'marketplace', event('GET', {'min_price': '10', 'max_price': '20', 'limit': '24'}), 2000),
+        PlanCase('auth.login', 'auth', event('POST', body={'action': 'login', 'email': fixtures['email'], 'password': 'x'}), 50)
+    ]
+
+
+def walk(plan: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from walk(child)
+
+
+def explain(conn: Any, statement: str) -> Optional[Dict[str, Any]]:
+    if not statement.lstrip().upper().startswith(EXPLAINABLE):
+        return None
+    cur = conn.cursor()
+    try:
+        cur.execute(f'EXPLAIN (FORMAT JSON) {statement}')
+        return cur.fetchone()[0][0]['Plan']
+    finally:
+        cur.close()
+        conn.rollback()
+
+
+def check_case(conn: Any, functions: Dict[str, harness.Function], case: PlanCase, budget_scale: float) -> Dict[str, Any]:
+    functions[case.function].call(case.event)
+    statements = []
+    violations = []
+    for statement in functions[case.function].statements():
+        plan = explain(conn, statement)
+        if plan is None:
+            continue
+        seq_scans = sorted({
+            node['Relation Name'] for node in walk(plan)
+            if node['Node Type'] == 'Seq Scan' and node.get('Relation Name') in LARGE_TABLES
+        } - set(case.allow_seq_scan))
+        cost = plan['Total Cost']
+        statements.append({'sql': statement[:200], 'cost': cost, 'seq_scans': seq_scans})
+        if seq_scans:
+            violations.append(f"Seq Scan по {', '.join(seq_scans)}: {statement[:120]}")
+        if cost > case.max_cost * budget_scale:
+            violations.append(f'стоимость {cost:.0f} > бюджета {case.max_cost * budget_scale:.0f}: {statement[:120]}')
+    return {'name': case.name, 'statements': statements, 'violations': violations}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=0, help='0 - не наполнять базу, проверять текущие данные')
+    parser.add_argument('--games', type=int, default=20000)
+    parser.add_argument('--frames', type=int, default=200)
+    parser.add_argument('--listings', type=int, default=20000)
+    parser.add_argument('--ownership', type=int, default=200000)
+    parser.add_argument('--budget-scale', type=float, default=1.0, help='множитель бюджетов стоимости')
+    parser.add_argument('--only', nargs='*', help='имена проверок, например games.search')
+    args = parser.parse_args()
+
+    os.environ.setdefault('SESSION_SECRET', 'bench-secret')
+    os.environ['CACHE_TTL'] = '0'
+    conn = harness.connect()
+    if args.users:
+        harness.seed(conn, args.users, args.games, args.frames, args.listings, args.ownership)
+    functions = harness.load_functions(record_statements=True)
+    cases = [case for case in plan_cases(load_fixtures(conn)) if not args.only or case.name in args.only]
+
+    results = [check_case(conn, functions, case, args.budget_scale) for case in cases]
+    conn.close()
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+    failed = [result for result in results if result['violations']]
+    for result in failed:
+        for violation in result['violations']:
+            print(f"FAIL {result['name']}: {violation}", file=sys.stderr)
+    print(f'{len(results) - len(failed)}/{len(results)} проверок без регрессий', file=sys.stderr)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+'''
+Business: Витрина при растущей истории покупок: задержка главной и рейтингов и стоимость инкрементального обновления
+Запуск: DATABASE_URL=postgresql://... python bench/rankings_bench.py --stages 4 --users 50000 --ownership 500000
+Каждый этап добавляет ещё столько же пользователей и покупок: задержка чтения должна оставаться постоянной,
+а время rankings_refresh - зависеть от прироста, а не от всей истории.
+Только для одноразовой локальной БД с применёнными db_migrations: скрипт наполняет базу синтетическими данными.
+'''
+import argparse
+import json
+import sys
+import time
+from typing import Dict, Any, List
+
+import harness
+
+READ_BUDGET_MS = 30.0
+
+
+def refresh(conn: Any, batch: int) -> Dict[str, Any]:
+    cur = conn.cursor()
+    started = time.perf_counter()
+    processed: Dict[str, int] = {}
+    while True:
+        # Без задержки оседания: все строки бенчмарка уже зафиксированы
+        cur.execute("SELECT source, processed FROM rankings_refresh(interval '0', %s)", (batch,))
+        rows = cur.fetchall()
+        conn.commit()
+        for source, count in rows:
+            processed[source] = processed.get(source, 0) + count
+        if all(count < batch for _, count in rows):
+            break
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    cur.execute("SELECT count(*) FROM user_games")
+    history = cur.fetchone()[0]
+    cur.close()
+    conn.rollback()
+    return {'refresh_ms': round(elapsed_ms, 1), 'processed': processed, 'history_rows': history}
+
+
+def measure(function: harness.Function, requests: List[Dict[str, Any]]) -> Dict[str, Any]:
+    started = time.perf_counter()
+    samples = harness.run_serial(function, requests)
+    summary = harness.summarize(samples, time.perf_counter() - started, 0)
+    return {key: summary[key] for key in ('p50_ms', 'p95_ms', 'queries_per_request', 'db_ms_per_request', 'statuses')}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--stages', type=int, default=4)
+    parser.add_argument('--users', type=int, default=50000, help='пользователей на этап')
+    parser.add_argument('--games', type=int, default=5000, help='игр на этап')
+    parser.add_argument('--ownership', type=int, default=500000, help='покупок игр на этап')
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--batch', type=int, default=100000)
+    args = parser.parse_args()
+
+    conn = harness.connect()
+    function = harness.Function('games')
+    event = harness.event
+    requests = {
+        'home': [event('GET', {'view': 'home'})] * args.requests,
+        'trending_genre': [event('GET', {'view': 'rankings', 'ranking': 'trending', 'genre': 'action'})] * args.requests,
+        'top_frames': [event('GET', {'view': 'rankings', 'item_type': 'frame'})] * args.requests
+    }
+
+    stages = []
+    for stage in range(1, args.stages + 1):
+        harness.seed(conn, args.users, args.games, 100, 0, args.ownership)
+        result = {'stage': stage, **refresh(conn, args.batch)}
+        result['reads'] = {name: measure(function, batch) for name, batch in requests.items()}
+        stages.append(result)
+
+    conn.close()
+    failures = [
+        f"этап {result['stage']}, {name}: p95 {summary['p95_ms']} мс > {READ_BUDGET_MS} мс"
+        for result in stages for name, summary in result['reads'].items()
+        if summary['p95_ms'] > READ_BUDGET_MS
+    ]
+    print(json.dumps({'stages': stages, 'failures': failures}, ensure_ascii=False, indent=2))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+'''
+Business: Замер задержки поиска пользователей на 10k/100k/1M строк
+Запуск: DATABASE_URL=postgresql://... python bench/user_search_bench.py --scales 10000,100000,1000000
+Только для одноразовой локальной БД с применёнными db_migrations: скрипт дописывает синтетических пользователей.
+'''
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import uuid
+from types import SimpleNamespace
+from typing import Dict, Any, List
+
+import psycopg2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'users'))
+
+QUERIES = ['ad', 'bench_7', 'user42', 'xq9', 'ивано']
+LEGACY_SQL = "SELECT id, username, display_name, avatar_url, role, is_verified, is_banned FROM users WHERE username LIKE %s ORDER BY is_verified DESC, id DESC"
+
+
+def grow_users(conn: Any, target: int) -> None:
+    cur = conn.cursor()
+    cur.execute("SELECT count(*) FROM users")
+    current = cur.fetchone()[0]
+    if current < target:
+        cur.execute(
+            """INSERT INTO users (email, password, username, display_name, is_verified)
+               SELECT 'bench_' || g || '@bench.local', 'x', 'bench_' || g || '_' || substr(md5(g::text), 1, 6),
+                      CASE WHEN g %% 5 = 0 THEN 'Иванов ' || g ELSE 'user' || g END, g %% 97 = 0
+               FROM generate_series(%s, %s) AS g""",
+            (current + 1, target)
+        )
+        cur.execute("ANALYZE users")
+    conn.commit()
+    cur.close()
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+def measure_handler(handler: Any, query: str, repeats: int) -> List[float]:
+    samples = []
+    for _ in range(repeats):
+        event = {'httpMethod': 'GET', 'queryStringParameters': {'search': query}}
+        started = time.perf_counter()
+        handler(event, SimpleNamespace(request_id=uuid.uuid4().hex, function_name='users'))
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def measure_legacy(conn: Any, query: str, repeats: int) -> List[float]:
+    samples = []
+    cur = conn.cursor()
+    for _ in range(repeats):
+        started = time.perf_counter()
+        cur.execute(LEGACY_SQL, (f'%{query}%',))
+        cur.fetchall()
+        samples.append((time.perf_counter() - started) * 1000)
+    cur.close()
+    conn.rollback()
+    return samples
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scales', default='10000,100000,1000000')
+    parser.add_argument('--repeats', type=int, default=30)
+    parser.add_argument('--skip-legacy', action='store_true')
+    args = parser.parse_args()
+
+    from index import handler
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    report: List[Dict[str, Any]] = []
+
+    for scale in [int(s) for s in args.scales.split(',')]:
+        grow_users(conn, scale)
+        for query in QUERIES:
+            indexed = measure_handler(handler, query, args.repeats)
+            row = {
+                'users': scale,
+                'query': query,
+                'p50_ms': round(statistics.median(indexed), 2),
+                'p95_ms': round(percentile(indexed, 0.95), 2)
+            }
+            if not args.skip_legacy:
+                legacy = measure_legacy(conn, query, max(3, args.repeats // 10))
+                row['legacy_p50_ms'] = round(statistics.median(legacy), 2)
+            report.append(row)
+            print(json.dumps(row, ensure_ascii=False))
+
+    conn.close()
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,8 @@
+-- Индекс для постраничной выдачи каталога по статусу (keyset по id)
+CREATE INDEX idx_games_status_id ON games(status, id DESC);
+
+-- Частичный индекс для витрины популярных игр
+CREATE INDEX idx_games_featured_id ON games(id DESC) WHERE status = 'approved' AND is_featured = true;
+
+-- Индекс для фильтра по жанру внутри одобренного каталога
+CREATE INDEX idx_games_status_genre_id ON games(status, genre, id DESC);
@@ -0,0 +1,37 @@
+-- Денормализованная лента активных лотов торговой площадки
+CREATE TABLE marketplace_feed (
+    listing_id INTEGER PRIMARY KEY REFERENCES marketplace_items(id),
+    seller_id INTEGER NOT NULL,
+    seller_username VARCHAR(100),
+    item_type VARCHAR(20) NOT NULL,
+    item_id INTEGER NOT NULL,
+    item_name VARCHAR(255),
+    item_image TEXT,
+    price DECIMAL(10, 2) NOT NULL,
+    created_at TIMESTAMP NOT NULL
+);
+
+-- Индексы для постраничной выдачи (keyset по created_at, listing_id)
+CREATE INDEX idx_marketplace_feed_created ON marketplace_feed(created_at DESC, listing_id DESC);
+CREATE INDEX idx_marketplace_feed_type_created ON marketplace_feed(item_type, created_at DESC, listing_id DESC);
+
+-- Индекс по статусу и дате для выборок из исходной таблицы
+CREATE INDEX idx_marketplace_status_created ON marketplace_items(status, created_at DESC);
+
+-- Заполняем ленту уже выставленными лотами
+INSERT INTO marketplace_feed (listing_id, seller_id, seller_username, item_type, item_id, item_name, item_image, price, created_at)
+SELECT m.id, m.seller_id, u.username, m.item_type, m.item_id,
+       CASE
+         WHEN m.item_type = 'game' THEN g.title
+         WHEN m.item_type = 'frame' THEN f.name
+       END,
+       CASE
+         WHEN m.item_type = 'game' THEN g.logo_url
+         WHEN m.item_type = 'frame' THEN f.image_url
+       END,
+       m.price, m.created_at
+FROM marketplace_items m
+JOIN users u ON m.seller_id = u.id
+LEFT JOIN games g ON m.item_type = 'game' AND m.item_id = g.id
+LEFT JOIN frames f ON m.item_type = 'frame' AND m.item_id = f.id
+WHERE m.status = 'active';
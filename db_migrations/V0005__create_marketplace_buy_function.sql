@@ -0,0 +1,53 @@
+-- Атомарная покупка лота торговой площадки за один вызов
+-- Статусы: ok, not_found (лота нет), sold (лот уже продан), buyer_not_found, insufficient_funds
+CREATE OR REPLACE FUNCTION marketplace_buy(p_listing_id INTEGER, p_buyer_id INTEGER)
+RETURNS TABLE (status TEXT, item_type VARCHAR, item_id INTEGER, price DECIMAL, buyer_balance DECIMAL) AS $$
+#variable_conflict use_column
+DECLARE
+    v_item marketplace_items%ROWTYPE;
+    v_balance DECIMAL(10, 2);
+BEGIN
+    -- Блокируем лот: конкурирующие покупатели ждут здесь и после коммита видят status = 'sold'
+    SELECT * INTO v_item FROM marketplace_items m
+    WHERE m.id = p_listing_id AND m.status = 'active'
+    FOR UPDATE;
+
+    IF NOT FOUND THEN
+        IF EXISTS (SELECT 1 FROM marketplace_items m WHERE m.id = p_listing_id) THEN
+            RETURN QUERY SELECT 'sold'::TEXT, NULL::VARCHAR, NULL::INTEGER, NULL::DECIMAL, NULL::DECIMAL;
+        ELSE
+            RETURN QUERY SELECT 'not_found'::TEXT, NULL::VARCHAR, NULL::INTEGER, NULL::DECIMAL, NULL::DECIMAL;
+        END IF;
+        RETURN;
+    END IF;
+
+    -- Блокируем покупателя и продавца в порядке id, чтобы встречные сделки не давали взаимоблокировку
+    PERFORM 1 FROM users u WHERE u.id IN (p_buyer_id, v_item.seller_id) ORDER BY u.id FOR UPDATE;
+
+    UPDATE users u SET balance = u.balance - v_item.price
+    WHERE u.id = p_buyer_id AND u.balance >= v_item.price
+    RETURNING u.balance INTO v_balance;
+
+    IF NOT FOUND THEN
+        IF EXISTS (SELECT 1 FROM users u WHERE u.id = p_buyer_id) THEN
+            RETURN QUERY SELECT 'insufficient_funds'::TEXT, v_item.item_type, v_item.item_id, v_item.price, NULL::DECIMAL;
+        ELSE
+            RETURN QUERY SELECT 'buyer_not_found'::TEXT, NULL::VARCHAR, NULL::INTEGER, NULL::DECIMAL, NULL::DECIMAL;
+        END IF;
+        RETURN;
+    END IF;
+
+    UPDATE users u SET balance = u.balance + ROUND(v_item.price * 0.9, 2) WHERE u.id = v_item.seller_id;
+
+    IF v_item.item_type = 'game' THEN
+        INSERT INTO user_games (user_id, game_id) VALUES (p_buyer_id, v_item.item_id) ON CONFLICT DO NOTHING;
+    ELSIF v_item.item_type = 'frame' THEN
+        INSERT INTO user_frames (user_id, frame_id) VALUES (p_buyer_id, v_item.item_id) ON CONFLICT DO NOTHING;
+    END IF;
+
+    UPDATE marketplace_items m SET status = 'sold' WHERE m.id = p_listing_id;
+    DELETE FROM marketplace_feed WHERE listing_id = p_listing_id;
+
+    RETURN QUERY SELECT 'ok'::TEXT, v_item.item_type, v_item.item_id, v_item.price, v_balance;
+END;
+$$ LANGUAGE plpgsql;
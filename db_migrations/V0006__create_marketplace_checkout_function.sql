@@ -0,0 +1,100 @@
+-- Оформление корзины торговой площадки одной транзакцией с множественными операциями
+-- Статусы позиций: ok, not_found, sold, buyer_not_found, insufficient_funds, aborted (корзина отменена целиком)
+CREATE OR REPLACE FUNCTION marketplace_checkout(p_listing_ids INTEGER[], p_buyer_id INTEGER, p_all_or_nothing BOOLEAN DEFAULT true)
+RETURNS TABLE (listing_id INTEGER, status TEXT, price DECIMAL, buyer_balance DECIMAL) AS $$
+#variable_conflict use_column
+DECLARE
+    v_balance DECIMAL(10, 2);
+    v_locked INTEGER[];
+    v_accepted INTEGER[] := '{}';
+    v_cart_size INTEGER;
+    v_total DECIMAL(10, 2);
+BEGIN
+    SELECT count(DISTINCT c) INTO v_cart_size FROM unnest(p_listing_ids) AS c;
+
+    -- Блокируем все доступные лоты корзины одним запросом в порядке id
+    SELECT coalesce(array_agg(l.id), '{}') INTO v_locked FROM (
+        SELECT m.id FROM marketplace_items m
+        WHERE m.id = ANY(p_listing_ids) AND m.status = 'active'
+        ORDER BY m.id
+        FOR UPDATE
+    ) l;
+
+    -- Блокируем покупателя и всех продавцов в порядке id
+    PERFORM 1 FROM users u
+    WHERE u.id = p_buyer_id OR u.id IN (SELECT m.seller_id FROM marketplace_items m WHERE m.id = ANY(v_locked))
+    ORDER BY u.id
+    FOR UPDATE;
+
+    SELECT u.balance INTO v_balance FROM users u WHERE u.id = p_buyer_id;
+
+    IF FOUND THEN
+        -- Позиции в порядке корзины с нарастающей суммой: в режиме best-effort берём префикс, который покрывает баланс
+        SELECT
+            CASE
+                WHEN p_all_or_nothing THEN
+                    CASE WHEN cardinality(v_locked) = v_cart_size AND sum(p.price) <= v_balance THEN array_agg(p.id) ELSE '{}' END
+                ELSE coalesce(array_agg(p.id) FILTER (WHERE p.running <= v_balance), '{}')
+            END
+        INTO v_accepted
+        FROM (
+            SELECT c.id, m.price, sum(m.price) OVER (ORDER BY c.ord) AS running
+            FROM (
+                SELECT DISTINCT ON (r.id) r.id, r.ord
+                FROM unnest(p_listing_ids) WITH ORDINALITY AS r(id, ord)
+                ORDER BY r.id, r.ord
+            ) c
+            JOIN marketplace_items m ON m.id = c.id
+            WHERE c.id = ANY(v_locked)
+        ) p;
+    END IF;
+
+    IF cardinality(v_accepted) > 0 THEN
+        SELECT sum(m.price) INTO v_total FROM marketplace_items m WHERE m.id = ANY(v_accepted);
+
+        UPDATE users u SET balance = u.balance - v_total WHERE u.id = p_buyer_id
+        RETURNING u.balance INTO v_balance;
+
+        UPDATE users u SET balance = u.balance + s.amount
+        FROM (
+            SELECT m.seller_id, sum(ROUND(m.price * 0.9, 2)) AS amount
+            FROM marketplace_items m WHERE m.id = ANY(v_accepted)
+            GROUP BY m.seller_id
+        ) s
+        WHERE u.id = s.seller_id;
+
+        INSERT INTO user_games (user_id, game_id)
+        SELECT p_buyer_id, m.item_id FROM marketplace_items m
+        WHERE m.id = ANY(v_accepted) AND m.item_type = 'game'
+        ON CONFLICT DO NOTHING;
+
+        INSERT INTO user_frames (user_id, frame_id)
+        SELECT p_buyer_id, m.item_id FROM marketplace_items m
+        WHERE m.id = ANY(v_accepted) AND m.item_type = 'frame'
+        ON CONFLICT DO NOTHING;
+
+        UPDATE marketplace_items m SET status = 'sold' WHERE m.id = ANY(v_accepted);
+        DELETE FROM marketplace_feed f WHERE f.listing_id = ANY(v_accepted);
+    END IF;
+
+    RETURN QUERY
+    SELECT c.id,
+        CASE
+            WHEN v_balance IS NULL THEN 'buyer_not_found'
+            WHEN c.id = ANY(v_accepted) THEN 'ok'
+            WHEN m.id IS NULL THEN 'not_found'
+            WHEN NOT c.id = ANY(v_locked) THEN 'sold'
+            WHEN p_all_or_nothing AND cardinality(v_locked) < v_cart_size THEN 'aborted'
+            ELSE 'insufficient_funds'
+        END,
+        m.price,
+        v_balance
+    FROM (
+        SELECT DISTINCT ON (r.id) r.id, r.ord
+        FROM unnest(p_listing_ids) WITH ORDINALITY AS r(id, ord)
+        ORDER BY r.id, r.ord
+    ) c
+    LEFT JOIN marketplace_items m ON m.id = c.id
+    ORDER BY c.ord;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,8 @@
+-- Триграммный поиск пользователей по логину и отображаемому имени
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX idx_users_username_trgm ON users USING GIN (lower(username) gin_trgm_ops);
+CREATE INDEX idx_users_display_name_trgm ON users USING GIN (lower(display_name) gin_trgm_ops);
+
+-- Быстрый путь для поиска по префиксу (короткие запросы, где триграммы неэффективны)
+CREATE INDEX idx_users_username_prefix ON users(lower(username) text_pattern_ops);
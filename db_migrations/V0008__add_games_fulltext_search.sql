@@ -0,0 +1,9 @@
+-- Полнотекстовый поиск по каталогу игр: вектор пересчитывается самой БД при каждом изменении строки
+ALTER TABLE games ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+    setweight(to_tsvector('russian', coalesce(title, '')), 'A') ||
+    setweight(to_tsvector('russian', coalesce(genre, '')), 'B') ||
+    setweight(to_tsvector('russian', coalesce(publisher_username, '')), 'B') ||
+    setweight(to_tsvector('russian', coalesce(description, '')), 'C')
+) STORED;
+
+CREATE INDEX idx_games_search_vector ON games USING GIN (search_vector);
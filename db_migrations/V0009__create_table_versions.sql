@@ -0,0 +1,25 @@
+-- Счётчики изменений таблиц для проверки актуальности кэша в тёплых экземплярах функций
+-- Счётчик разбит на шарды: горячая таблица увеличивает случайный шард, версия = сумма шардов
+CREATE TABLE table_versions (
+    name VARCHAR(50) NOT NULL,
+    shard INTEGER NOT NULL DEFAULT 0,
+    version BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (name, shard)
+);
+
+INSERT INTO table_versions (name) VALUES ('games'), ('frames');
+
+-- Аргументы триггера: имя счётчика и число шардов
+CREATE OR REPLACE FUNCTION bump_table_version() RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE table_versions SET version = version + 1
+    WHERE name = TG_ARGV[0] AND shard = floor(random() * TG_ARGV[1]::INTEGER)::INTEGER;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_games_version AFTER INSERT OR UPDATE OR DELETE ON games
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version('games', '1');
+
+CREATE TRIGGER trg_frames_version AFTER INSERT OR UPDATE OR DELETE ON frames
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version('frames', '1');
@@ -0,0 +1,28 @@
+-- Счётчики изменений для ETag списков торговой площадки, пользователей и инвентаря рамок
+-- Эти таблицы меняются при каждой покупке, поэтому счётчик разбит на 8 шардов
+INSERT INTO table_versions (name, shard)
+SELECT t.name, s.shard
+FROM (VALUES ('marketplace_feed'), ('users'), ('user_frames')) AS t(name)
+CROSS JOIN generate_series(0, 7) AS s(shard);
+
+CREATE TRIGGER trg_marketplace_feed_version AFTER INSERT OR UPDATE OR DELETE ON marketplace_feed
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version('marketplace_feed', '8');
+
+CREATE TRIGGER trg_users_version AFTER INSERT OR UPDATE OR DELETE ON users
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version('users', '8');
+
+CREATE TRIGGER trg_user_frames_version AFTER INSERT OR UPDATE OR DELETE ON user_frames
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version('user_frames', '8');
+
+-- Шард - по номеру транзакции: все изменения таблицы в одной транзакции (покупка меняет users дважды)
+-- увеличивают одну и ту же строку, поэтому две покупки не могут заблокировать шарды друг друга крест-накрест,
+-- а разные транзакции по-прежнему расходятся по шардам
+CREATE OR REPLACE FUNCTION bump_table_version() RETURNS TRIGGER AS $$
+DECLARE
+    v_shard INTEGER := (txid_current() % TG_ARGV[1]::INTEGER)::INTEGER;
+BEGIN
+    UPDATE table_versions SET version = version + 1
+    WHERE name = TG_ARGV[0] AND shard = v_shard;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
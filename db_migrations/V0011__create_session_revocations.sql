@@ -0,0 +1,7 @@
+-- Отозванные сессии: токены, выпущенные до revoked_at, считаются недействительными
+CREATE TABLE session_revocations (
+    user_id INTEGER PRIMARY KEY REFERENCES users(id),
+    revoked_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE INDEX idx_session_revocations_revoked_at ON session_revocations(revoked_at);
@@ -0,0 +1,7 @@
+-- Сортировка справочника пользователей (is_verified DESC, id DESC) без отдельного Sort
+CREATE INDEX idx_users_verified_id ON users(is_verified DESC, id DESC);
+
+-- Инвентарь рамок: покрывающий индекс, join с frames берёт frame_id и is_active прямо из индекса
+CREATE INDEX idx_user_frames_user_covering ON user_frames(user_id) INCLUDE (frame_id, is_active);
+
+-- user_games(user_id) уже обслуживается UNIQUE(user_id, game_id), games(status) - индексом idx_games_status_id (V0003)
@@ -0,0 +1,7 @@
+-- Ключи сортировки справочника пользователей (keyset по (ключ, id))
+CREATE INDEX idx_users_created_id ON users(created_at DESC, id DESC);
+CREATE INDEX idx_users_balance_id ON users(balance DESC, id DESC);
+
+-- Редкие фильтры справочника: заблокированные и роль
+CREATE INDEX idx_users_banned_id ON users(id DESC) WHERE is_banned = true;
+CREATE INDEX idx_users_role_id ON users(role, id DESC);
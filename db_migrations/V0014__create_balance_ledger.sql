@@ -0,0 +1,362 @@
+-- Журнал движений баланса: строки только добавляются, баланс восстанавливается как снимок + сумма хвоста
+CREATE TABLE balance_transactions (
+    id BIGSERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    amount DECIMAL(12, 2) NOT NULL,
+    kind VARCHAR(20) NOT NULL,
+    listing_id INTEGER,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX idx_balance_transactions_user ON balance_transactions(user_id, id);
+
+CREATE OR REPLACE FUNCTION forbid_ledger_changes() RETURNS trigger AS $$
+BEGIN
+    RAISE EXCEPTION 'balance_transactions: журнал допускает только добавление строк';
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_balance_transactions_append_only BEFORE UPDATE OR DELETE OR TRUNCATE ON balance_transactions
+    FOR EACH STATEMENT EXECUTE FUNCTION forbid_ledger_changes();
+
+-- Периодические снимки: баланс пользователя по журналу на момент last_transaction_id
+CREATE TABLE balance_snapshots (
+    user_id INTEGER PRIMARY KEY REFERENCES users(id),
+    balance DECIMAL(12, 2) NOT NULL,
+    last_transaction_id BIGINT NOT NULL,
+    taken_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX idx_balance_snapshots_last_tx ON balance_snapshots(last_transaction_id);
+
+-- Горячие продавцы: зачисления идут в одну из полос, а не в строку users, и не сериализуют покупки
+CREATE TABLE hot_accounts (
+    user_id INTEGER PRIMARY KEY REFERENCES users(id),
+    stripes SMALLINT NOT NULL DEFAULT 8 CHECK (stripes > 0)
+);
+
+CREATE TABLE balance_stripes (
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    stripe SMALLINT NOT NULL,
+    amount DECIMAL(12, 2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, stripe)
+);
+
+-- Начальные остатки, чтобы журнал сходился с текущими балансами
+INSERT INTO balance_transactions (user_id, amount, kind)
+SELECT id, balance, 'opening' FROM users WHERE coalesce(balance, 0) <> 0;
+
+-- Зачисление продавцу: запись в журнал и либо строка users, либо случайная полоса горячего счёта
+CREATE OR REPLACE FUNCTION ledger_credit(p_user_id INTEGER, p_amount DECIMAL, p_kind VARCHAR, p_listing_id INTEGER)
+RETURNS VOID AS $$
+DECLARE
+    v_stripes SMALLINT;
+BEGIN
+    INSERT INTO balance_transactions (user_id, amount, kind, listing_id) VALUES (p_user_id, p_amount, p_kind, p_listing_id);
+
+    SELECT h.stripes INTO v_stripes FROM hot_accounts h WHERE h.user_id = p_user_id;
+    IF FOUND THEN
+        INSERT INTO balance_stripes (user_id, stripe, amount)
+        VALUES (p_user_id, floor(random() * v_stripes)::SMALLINT, p_amount)
+        ON CONFLICT (user_id, stripe) DO UPDATE SET amount = balance_stripes.amount + EXCLUDED.amount;
+    ELSE
+        UPDATE users u SET balance = u.balance + p_amount WHERE u.id = p_user_id;
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Перенос накопленных полос в users.balance; вызывающий должен держать блокировку строки пользователя
+CREATE OR REPLACE FUNCTION ledger_fold_stripes(p_user_id INTEGER)
+RETURNS DECIMAL AS $$
+DECLARE
+    v_amount DECIMAL(12, 2);
+BEGIN
+    WITH folded AS (
+        DELETE FROM balance_stripes s WHERE s.user_id = p_user_id RETURNING s.amount
+    )
+    SELECT coalesce(sum(amount), 0) INTO v_amount FROM folded;
+
+    IF v_amount <> 0 THEN
+        UPDATE users u SET balance = u.balance + v_amount WHERE u.id = p_user_id;
+    END IF;
+    RETURN v_amount;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Перенос полос всех счетов, у которых они накопились (периодическая задача)
+CREATE OR REPLACE FUNCTION ledger_fold_all()
+RETURNS INTEGER AS $$
+DECLARE
+    v_user_id INTEGER;
+    v_count INTEGER := 0;
+BEGIN
+    FOR v_user_id IN SELECT DISTINCT s.user_id FROM balance_stripes s ORDER BY s.user_id LOOP
+        PERFORM 1 FROM users u WHERE u.id = v_user_id FOR UPDATE;
+        PERFORM ledger_fold_stripes(v_user_id);
+        v_count := v_count + 1;
+    END LOOP;
+    RETURN v_count;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Баланс по журналу: последний снимок плюс сумма более поздних движений
+CREATE OR REPLACE FUNCTION ledger_balance(p_user_id INTEGER)
+RETURNS DECIMAL AS $$
+    SELECT coalesce(s.balance, 0) + coalesce((
+        SELECT sum(t.amount) FROM balance_transactions t
+        WHERE t.user_id = p_user_id AND t.id > coalesce(s.last_transaction_id, 0)
+    ), 0)
+    FROM (SELECT p_user_id AS user_id) p
+    LEFT JOIN balance_snapshots s ON s.user_id = p.user_id;
+$$ LANGUAGE sql STABLE;
+
+-- Установка баланса администратором: разница записывается в журнал как admin_adjust
+CREATE OR REPLACE FUNCTION ledger_set_balance(p_user_id INTEGER, p_balance DECIMAL)
+RETURNS DECIMAL AS $$
+DECLARE
+    v_old DECIMAL(12, 2);
+BEGIN
+    SELECT coalesce(u.balance, 0) INTO v_old FROM users u WHERE u.id = p_user_id FOR UPDATE;
+    IF NOT FOUND THEN
+        RETURN NULL;
+    END IF;
+    v_old := v_old + ledger_fold_stripes(p_user_id);
+
+    UPDATE users u SET balance = p_balance WHERE u.id = p_user_id;
+    IF p_balance <> v_old THEN
+        INSERT INTO balance_transactions (user_id, amount, kind) VALUES (p_user_id, p_balance - v_old, 'admin_adjust');
+    END IF;
+    RETURN p_balance - v_old;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Снимки по всем пользователям с движениями после прошлого прогона
+-- id из последовательности коммитятся не по порядку, поэтому в снимок попадают только строки старше p_settle_lag
+CREATE OR REPLACE FUNCTION ledger_take_snapshots(p_settle_lag INTERVAL DEFAULT '5 minutes')
+RETURNS INTEGER AS $$
+DECLARE
+    v_from BIGINT;
+    v_upto BIGINT;
+    v_count INTEGER;
+BEGIN
+    SELECT coalesce(max(s.last_transaction_id), 0) INTO v_from FROM balance_snapshots s;
+    SELECT t.id INTO v_upto FROM balance_transactions t
+    WHERE t.created_at < now() - p_settle_lag
+    ORDER BY t.id DESC LIMIT 1;
+
+    IF v_upto IS NULL OR v_upto <= v_from THEN
+        RETURN 0;
+    END IF;
+
+    INSERT INTO balance_snapshots (user_id, balance, last_transaction_id, taken_at)
+    SELECT t.user_id, coalesce(max(s.balance), 0) + sum(t.amount), v_upto, now()
+    FROM balance_transactions t
+    LEFT JOIN balance_snapshots s ON s.user_id = t.user_id
+    WHERE t.id > v_from AND t.id <= v_upto
+    GROUP BY t.user_id
+    ON CONFLICT (user_id) DO UPDATE
+    SET balance = EXCLUDED.balance, last_transaction_id = EXCLUDED.last_transaction_id, taken_at = EXCLUDED.taken_at;
+
+    GET DIAGNOSTICS v_count = ROW_COUNT;
+    RETURN v_count;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Сверка: баланс счёта (users + полосы) против баланса по журналу, возвращаются только расхождения
+CREATE OR REPLACE FUNCTION ledger_reconcile()
+RETURNS TABLE (user_id INTEGER, account_balance DECIMAL, ledger_balance DECIMAL) AS $$
+    SELECT u.id, a.balance, l.balance
+    FROM users u
+    LEFT JOIN balance_snapshots s ON s.user_id = u.id
+    CROSS JOIN LATERAL (
+        SELECT coalesce(u.balance, 0) + coalesce((SELECT sum(b.amount) FROM balance_stripes b WHERE b.user_id = u.id), 0) AS balance
+    ) a
+    CROSS JOIN LATERAL (
+        SELECT coalesce(s.balance, 0) + coalesce((
+            SELECT sum(t.amount) FROM balance_transactions t
+            WHERE t.user_id = u.id AND t.id > coalesce(s.last_transaction_id, 0)
+        ), 0) AS balance
+    ) l
+    WHERE a.balance <> l.balance
+    ORDER BY u.id;
+$$ LANGUAGE sql STABLE;
+
+-- Покупка через журнал: строка горячего продавца не блокируется, зачисление идёт в полосу
+CREATE OR REPLACE FUNCTION marketplace_buy(p_listing_id INTEGER, p_buyer_id INTEGER)
+RETURNS TABLE (status TEXT, item_type VARCHAR, item_id INTEGER, price DECIMAL, buyer_balance DECIMAL) AS $$
+#variable_conflict use_column
+DECLARE
+    v_item marketplace_items%ROWTYPE;
+    v_balance DECIMAL(10, 2);
+BEGIN
+    SELECT * INTO v_item FROM marketplace_items m
+    WHERE m.id = p_listing_id AND m.status = 'active'
+    FOR UPDATE;
+
+    IF NOT FOUND THEN
+        IF EXISTS (SELECT 1 FROM marketplace_items m WHERE m.id = p_listing_id) THEN
+            RETURN QUERY SELECT 'sold'::TEXT, NULL::VARCHAR, NULL::INTEGER, NULL::DECIMAL, NULL::DECIMAL;
+        ELSE
+            RETURN QUERY SELECT 'not_found'::TEXT, NULL::VARCHAR, NULL::INTEGER, NULL::DECIMAL, NULL::DECIMAL;
+        END IF;
+        RETURN;
+    END IF;
+
+    -- Блокируем покупателя и обычного продавца в порядке id; горячий продавец получает зачисление в полосу без блокировки
+    PERFORM 1 FROM users u
+    WHERE u.id = p_buyer_id
+       OR (u.id = v_item.seller_id AND NOT EXISTS (SELECT 1 FROM hot_accounts h WHERE h.user_id = v_item.seller_id))
+    ORDER BY u.id
+    FOR UPDATE;
+
+    PERFORM ledger_fold_stripes(p_buyer_id);
+
+    UPDATE users u SET balance = u.balance - v_item.price
+    WHERE u.id = p_buyer_id AND u.balance >= v_item.price
+    RETURNING u.balance INTO v_balance;
+
+    IF NOT FOUND THEN
+        IF EXISTS (SELECT 1 FROM users u WHERE u.id = p_buyer_id) THEN
+            RETURN QUERY SELECT 'insufficient_funds'::TEXT, v_item.item_type, v_item.item_id, v_item.price, NULL::DECIMAL;
+        ELSE
+            RETURN QUERY SELECT 'buyer_not_found'::TEXT, NULL::VARCHAR, NULL::INTEGER, NULL::DECIMAL, NULL::DECIMAL;
+        END IF;
+        RETURN;
+    END IF;
+
+    INSERT INTO balance_transactions (user_id, amount, kind, listing_id) VALUES (p_buyer_id, -v_item.price, 'purchase', p_listing_id);
+    PERFORM ledger_credit(v_item.seller_id, ROUND(v_item.price * 0.9, 2), 'sale', p_listing_id);
+
+    IF v_item.item_type = 'game' THEN
+        INSERT INTO user_games (user_id, game_id) VALUES (p_buyer_id, v_item.item_id) ON CONFLICT DO NOTHING;
+    ELSIF v_item.item_type = 'frame' THEN
+        INSERT INTO user_frames (user_id, frame_id) VALUES (p_buyer_id, v_item.item_id) ON CONFLICT DO NOTHING;
+    END IF;
+
+    UPDATE marketplace_items m SET status = 'sold' WHERE m.id = p_listing_id;
+    DELETE FROM marketplace_feed WHERE listing_id = p_listing_id;
+
+    RETURN QUERY SELECT 'ok'::TEXT, v_item.item_type, v_item.item_id, v_item.price, v_balance;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Корзина через журнал: те же правила, зачисления продавцам группируются по продавцу
+CREATE OR REPLACE FUNCTION marketplace_checkout(p_listing_ids INTEGER[], p_buyer_id INTEGER, p_all_or_nothing BOOLEAN DEFAULT true)
+RETURNS TABLE (listing_id INTEGER, status TEXT, price DECIMAL, buyer_balance DECIMAL) AS $$
+#variable_conflict use_column
+DECLARE
+    v_balance DECIMAL(10, 2);
+    v_locked INTEGER[];
+    v_accepted INTEGER[] := '{}';
+    v_cart_size INTEGER;
+    v_total DECIMAL(10, 2);
+BEGIN
+    SELECT count(DISTINCT c) INTO v_cart_size FROM unnest(p_listing_ids) AS c;
+
+    SELECT coalesce(array_agg(l.id), '{}') INTO v_locked FROM (
+        SELECT m.id FROM marketplace_items m
+        WHERE m.id = ANY(p_listing_ids) AND m.status = 'active'
+        ORDER BY m.id
+        FOR UPDATE
+    ) l;
+
+    PERFORM 1 FROM users u
+    WHERE u.id = p_buyer_id
+       OR u.id IN (
+           SELECT m.seller_id FROM marketplace_items m
+           WHERE m.id = ANY(v_locked)
+             AND NOT EXISTS (SELECT 1 FROM hot_accounts h WHERE h.user_id = m.seller_id)
+       )
+    ORDER BY u.id
+    FOR UPDATE;
+
+    PERFORM ledger_fold_stripes(p_buyer_id);
+
+    SELECT u.balance INTO v_balance FROM users u WHERE u.id = p_buyer_id;
+
+    IF FOUND THEN
+        SELECT
+            CASE
+                WHEN p_all_or_nothing THEN
+                    CASE WHEN cardinality(v_locked) = v_cart_size AND sum(p.price) <= v_balance THEN array_agg(p.id) ELSE '{}' END
+                ELSE coalesce(array_agg(p.id) FILTER (WHERE p.running <= v_balance), '{}')
+            END
+        INTO v_accepted
+        FROM (
+            SELECT c.id, m.price, sum(m.price) OVER (ORDER BY c.ord) AS running
+            FROM (
+                SELECT DISTINCT ON (r.id) r.id, r.ord
+                FROM unnest(p_listing_ids) WITH ORDINALITY AS r(id, ord)
+                ORDER BY r.id, r.ord
+            ) c
+            JOIN marketplace_items m ON m.id = c.id
+            WHERE c.id = ANY(v_locked)
+        ) p;
+    END IF;
+
+    IF cardinality(v_accepted) > 0 THEN
+        SELECT sum(m.price) INTO v_total FROM marketplace_items m WHERE m.id = ANY(v_accepted);
+
+        UPDATE users u SET balance = u.balance - v_total WHERE u.id = p_buyer_id
+        RETURNING u.balance INTO v_balance;
+
+        INSERT INTO balance_transactions (user_id, amount, kind, listing_id)
+        SELECT p_buyer_id, -m.price, 'purchase', m.id FROM marketplace_items m WHERE m.id = ANY(v_accepted)
+        UNION ALL
+        SELECT m.seller_id, ROUND(m.price * 0.9, 2), 'sale', m.id FROM marketplace_items m WHERE m.id = ANY(v_accepted);
+
+        UPDATE users u SET balance = u.balance + s.amount
+        FROM (
+            SELECT m.seller_id, sum(ROUND(m.price * 0.9, 2)) AS amount
+            FROM marketplace_items m WHERE m.id = ANY(v_accepted)
+            GROUP BY m.seller_id
+        ) s
+        WHERE u.id = s.seller_id AND NOT EXISTS (SELECT 1 FROM hot_accounts h WHERE h.user_id = s.seller_id);
+
+        -- Полосы горячих продавцов блокируются в порядке продавца, чтобы встречные корзины не давали взаимоблокировку
+        INSERT INTO balance_stripes (user_id, stripe, amount)
+        SELECT s.seller_id, floor(random() * h.stripes)::SMALLINT, s.amount
+        FROM (
+            SELECT m.seller_id, sum(ROUND(m.price * 0.9, 2)) AS amount
+            FROM marketplace_items m WHERE m.id = ANY(v_accepted)
+            GROUP BY m.seller_id
+        ) s
+        JOIN hot_accounts h ON h.user_id = s.seller_id
+        ORDER BY s.seller_id
+        ON CONFLICT (user_id, stripe) DO UPDATE SET amount = balance_stripes.amount + EXCLUDED.amount;
+
+        INSERT INTO user_games (user_id, game_id)
+        SELECT p_buyer_id, m.item_id FROM marketplace_items m
+        WHERE m.id = ANY(v_accepted) AND m.item_type = 'game'
+        ON CONFLICT DO NOTHING;
+
+        INSERT INTO user_frames (user_id, frame_id)
+        SELECT p_buyer_id, m.item_id FROM marketplace_items m
+        WHERE m.id = ANY(v_accepted) AND m.item_type = 'frame'
+        ON CONFLICT DO NOTHING;
+
+        UPDATE marketplace_items m SET status = 'sold' WHERE m.id = ANY(v_accepted);
+        DELETE FROM marketplace_feed f WHERE f.listing_id = ANY(v_accepted);
+    END IF;
+
+    RETURN QUERY
+    SELECT c.id,
+        CASE
+            WHEN v_balance IS NULL THEN 'buyer_not_found'
+            WHEN c.id = ANY(v_accepted) THEN 'ok'
+            WHEN m.id IS NULL THEN 'not_found'
+            WHEN NOT c.id = ANY(v_locked) THEN 'sold'
+            WHEN p_all_or_nothing AND cardinality(v_locked) < v_cart_size THEN 'aborted'
+            ELSE 'insufficient_funds'
+        END,
+        m.price,
+        v_balance
+    FROM (
+        SELECT DISTINCT ON (r.id) r.id, r.ord
+        FROM unnest(p_listing_ids) WITH ORDINALITY AS r(id, ord)
+        ORDER BY r.id, r.ord
+    ) c
+    LEFT JOIN marketplace_items m ON m.id = c.id
+    ORDER BY c.ord;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,22 @@
+-- Оставляем не больше одной активной рамки на пользователя (самую позднюю), иначе индекс не создать
+UPDATE user_frames SET is_active = false
+WHERE is_active AND id NOT IN (
+    SELECT DISTINCT ON (user_id) id FROM user_frames WHERE is_active ORDER BY user_id, id DESC
+);
+
+-- Одна активная рамка на пользователя. Индекс не отложенный: ON CONFLICT без цели в marketplace_buy и
+-- marketplace_checkout не работает, если у таблицы есть отложенное ограничение, поэтому переключение
+-- делается двумя UPDATE в одной транзакции (сначала снять старую, потом включить новую)
+CREATE UNIQUE INDEX idx_user_frames_one_active ON user_frames(user_id) WHERE is_active;
+
+-- Постраничный инвентарь (keyset по id покупки); покрывающий индекс из V0012 заменяется более общим
+DROP INDEX idx_user_frames_user_covering;
+CREATE INDEX idx_user_frames_user_id ON user_frames(user_id, id DESC) INCLUDE (frame_id, is_active);
+CREATE INDEX idx_user_games_user_id ON user_games(user_id, id DESC) INCLUDE (game_id);
+
+-- Счётчик изменений для ETag инвентаря игр
+INSERT INTO table_versions (name, shard)
+SELECT 'user_games', s.shard FROM generate_series(0, 7) AS s(shard);
+
+CREATE TRIGGER trg_user_games_version AFTER INSERT OR UPDATE OR DELETE ON user_games
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version('user_games', '8');
@@ -0,0 +1,9 @@
+-- Счётчик активных лотов продавца для профиля
+CREATE INDEX idx_marketplace_seller_active ON marketplace_items(seller_id) WHERE status = 'active';
+
+-- Счётчик изменений для ETag профилей (число друзей)
+INSERT INTO table_versions (name, shard)
+SELECT 'friendships', s.shard FROM generate_series(0, 7) AS s(shard);
+
+CREATE TRIGGER trg_friendships_version AFTER INSERT OR UPDATE OR DELETE ON friendships
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version('friendships', '8');
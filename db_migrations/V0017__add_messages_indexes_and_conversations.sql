@@ -0,0 +1,36 @@
+-- Отметки о прочтении и ключ диалога (пара пользователей без учёта направления)
+ALTER TABLE messages ADD COLUMN read_at TIMESTAMP;
+ALTER TABLE messages ADD COLUMN user_low INTEGER GENERATED ALWAYS AS (least(sender_id, recipient_id)) STORED;
+ALTER TABLE messages ADD COLUMN user_high INTEGER GENERATED ALWAYS AS (greatest(sender_id, recipient_id)) STORED;
+
+-- Лента диалога (keyset по id), входящие для long-poll и непрочитанные для отметок о прочтении
+CREATE INDEX idx_messages_pair_id ON messages(user_low, user_high, id DESC);
+CREATE INDEX idx_messages_recipient_id ON messages(recipient_id, id);
+CREATE INDEX idx_messages_unread ON messages(recipient_id, sender_id, id) WHERE read_at IS NULL;
+
+-- Список диалогов: одна строка на пару (пользователь, собеседник), обновляется при отправке
+CREATE TABLE conversations (
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    peer_id INTEGER NOT NULL REFERENCES users(id),
+    last_message_id INTEGER NOT NULL,
+    unread_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, peer_id)
+);
+
+CREATE INDEX idx_conversations_user_last ON conversations(user_id, last_message_id DESC);
+
+-- Отметок о прочтении до этой миграции не было: существующие сообщения остаются непрочитанными (read_at IS NULL),
+-- а unread_count диалога считается по ним же, чтобы счётчик сходился с отметками о прочтении
+-- Заполняем диалоги последним сообщением с каждым собеседником (DISTINCT ON по индексам отправителя и получателя)
+INSERT INTO conversations (user_id, peer_id, last_message_id, unread_count)
+SELECT DISTINCT ON (c.user_id, c.peer_id) c.user_id, c.peer_id, c.id, coalesce(u.unread, 0)
+FROM (
+    SELECT sender_id AS user_id, recipient_id AS peer_id, id FROM messages
+    UNION ALL
+    SELECT recipient_id, sender_id, id FROM messages
+) c
+LEFT JOIN (
+    SELECT recipient_id, sender_id, count(*) AS unread FROM messages WHERE read_at IS NULL GROUP BY recipient_id, sender_id
+) u ON u.recipient_id = c.user_id AND u.sender_id = c.peer_id
+WHERE c.user_id IS NOT NULL AND c.peer_id IS NOT NULL
+ORDER BY c.user_id, c.peer_id, c.id DESC;
@@ -0,0 +1,13 @@
+-- Дружба симметрична: на каждую пару две строки (A, B) и (B, A), добавляются и удаляются одним запросом
+DELETE FROM friendships WHERE user_id IS NULL OR friend_id IS NULL OR user_id = friend_id;
+
+INSERT INTO friendships (user_id, friend_id, created_at)
+SELECT friend_id, user_id, created_at FROM friendships
+ON CONFLICT (user_id, friend_id) DO NOTHING;
+
+ALTER TABLE friendships ALTER COLUMN user_id SET NOT NULL, ALTER COLUMN friend_id SET NOT NULL;
+ALTER TABLE friendships ADD CONSTRAINT friendships_not_self CHECK (user_id <> friend_id);
+
+-- Список друзей (keyset по id дружбы) без обращения к таблице; общие друзья и проверки пары
+-- обслуживает UNIQUE(user_id, friend_id), обратный индекс (friend_id, user_id) при симметричном хранении не нужен
+CREATE INDEX idx_friendships_user_id ON friendships(user_id, id DESC) INCLUDE (friend_id);
@@ -0,0 +1,175 @@
+-- Рейтинги витрины: свёртки покупок, пополняемые от водяного знака, а не пересчётом всей истории
+-- Популярность с затуханием хранится в логарифмической шкале относительно фиксированной эпохи:
+-- trend_log = ln(sum(exp(rankings_decay_log(время покупки)))), поэтому новая покупка только прибавляется к строке,
+-- а порядок по trend_log совпадает с порядком по текущему затухшему счёту (период полураспада 3 дня)
+CREATE OR REPLACE FUNCTION rankings_decay_log(p_at TIMESTAMP) RETURNS DOUBLE PRECISION AS $$
+    SELECT extract(epoch FROM p_at - TIMESTAMP '2024-01-01') / 259200.0 * ln(2.0)
+$$ LANGUAGE sql IMMUTABLE;
+
+-- ln(exp(a) + exp(b)) без переполнения; exp в PostgreSQL падает на исчезновении порядка, поэтому разрыв ограничен
+CREATE OR REPLACE FUNCTION rankings_log_add(a DOUBLE PRECISION, b DOUBLE PRECISION) RETURNS DOUBLE PRECISION AS $$
+    SELECT greatest(a, b) + CASE WHEN abs(a - b) > 700 THEN 0 ELSE ln(1 + exp(-abs(a - b))) END
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Текущий затухший счёт для ответа API
+CREATE OR REPLACE FUNCTION rankings_trend_score(p_trend_log DOUBLE PRECISION) RETURNS DOUBLE PRECISION AS $$
+    SELECT exp(greatest(p_trend_log - rankings_decay_log(LOCALTIMESTAMP), -700))
+$$ LANGUAGE sql STABLE;
+
+-- Продажи товаров: игры (user_games) и рамки (user_frames), включая покупки на маркетплейсе
+CREATE TABLE item_rankings (
+    item_type VARCHAR(20) NOT NULL,
+    item_id INTEGER NOT NULL,
+    genre VARCHAR(100),
+    purchases BIGINT NOT NULL DEFAULT 0,
+    trend_log DOUBLE PRECISION NOT NULL,
+    last_purchase_at TIMESTAMP,
+    PRIMARY KEY (item_type, item_id)
+);
+
+CREATE INDEX idx_item_rankings_top ON item_rankings(item_type, purchases DESC, item_id DESC);
+CREATE INDEX idx_item_rankings_trending ON item_rankings(item_type, trend_log DESC, item_id DESC);
+CREATE INDEX idx_item_rankings_genre_top ON item_rankings(genre, purchases DESC, item_id DESC) WHERE item_type = 'game';
+CREATE INDEX idx_item_rankings_genre_trending ON item_rankings(genre, trend_log DESC, item_id DESC) WHERE item_type = 'game';
+
+-- Продавцы маркетплейса по строкам 'sale' журнала баланса
+CREATE TABLE seller_rankings (
+    seller_id INTEGER PRIMARY KEY REFERENCES users(id),
+    sales BIGINT NOT NULL DEFAULT 0,
+    revenue DECIMAL(14, 2) NOT NULL DEFAULT 0,
+    trend_log DOUBLE PRECISION NOT NULL,
+    last_sale_at TIMESTAMP
+);
+
+CREATE INDEX idx_seller_rankings_top ON seller_rankings(sales DESC, seller_id DESC);
+CREATE INDEX idx_seller_rankings_trending ON seller_rankings(trend_log DESC, seller_id DESC);
+
+-- Водяные знаки: последний учтённый id каждого источника
+CREATE TABLE rankings_watermarks (
+    source VARCHAR(50) PRIMARY KEY,
+    last_id BIGINT NOT NULL DEFAULT 0,
+    refreshed_at TIMESTAMP
+);
+
+INSERT INTO rankings_watermarks (source) VALUES ('user_games'), ('user_frames'), ('sales');
+
+-- Счётчик изменений для ETag витрины
+INSERT INTO table_versions (name, shard)
+SELECT 'rankings', s.shard FROM generate_series(0, 7) AS s(shard);
+
+CREATE TRIGGER trg_item_rankings_version AFTER INSERT OR UPDATE OR DELETE ON item_rankings
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version('rankings', '8');
+
+CREATE TRIGGER trg_seller_rankings_version AFTER INSERT OR UPDATE OR DELETE ON seller_rankings
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version('rankings', '8');
+
+-- Смена жанра игры сразу переносит её строку рейтинга в другой жанр
+CREATE OR REPLACE FUNCTION sync_item_rankings_genre() RETURNS trigger AS $$
+BEGIN
+    UPDATE item_rankings SET genre = NEW.genre WHERE item_type = 'game' AND item_id = NEW.id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_games_rankings_genre AFTER UPDATE OF genre ON games
+    FOR EACH ROW WHEN (OLD.genre IS DISTINCT FROM NEW.genre) EXECUTE FUNCTION sync_item_rankings_genre();
+
+-- Конец очередного окна источника: не больше p_batch строк после водяного знака и только до первой строки моложе
+-- p_settle_lag - id выдаются до фиксации, и строка с меньшим id может стать видимой позже строки с большим
+CREATE OR REPLACE FUNCTION rankings_window_end(p_table REGCLASS, p_time_column TEXT, p_from BIGINT, p_settle_lag INTERVAL, p_batch INTEGER)
+RETURNS BIGINT AS $$
+DECLARE
+    v_to BIGINT;
+BEGIN
+    EXECUTE format(
+        'WITH candidates AS (SELECT id, %1$I AS at FROM %2$s WHERE id > $1 ORDER BY id LIMIT $2)
+         SELECT coalesce((SELECT min(id) - 1 FROM candidates WHERE at >= LOCALTIMESTAMP - $3), (SELECT max(id) FROM candidates), $1)',
+        p_time_column, p_table
+    ) INTO v_to USING p_from, p_batch, p_settle_lag;
+    RETURN v_to;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Инкрементальное обновление рейтингов: одно окно каждого источника за вызов, сдвиг водяных знаков в той же транзакции
+CREATE OR REPLACE FUNCTION rankings_refresh(p_settle_lag INTERVAL DEFAULT interval '1 minute', p_batch INTEGER DEFAULT 100000)
+RETURNS TABLE (source VARCHAR, last_id BIGINT, processed BIGINT) AS $$
+#variable_conflict use_column
+DECLARE
+    v_games_from BIGINT;
+    v_games_to BIGINT;
+    v_frames_from BIGINT;
+    v_frames_to BIGINT;
+    v_sales_from BIGINT;
+    v_sales_to BIGINT;
+BEGIN
+    -- Блокировка водяных знаков: параллельные вызовы выполняются по очереди и не учитывают окно дважды
+    SELECT w.last_id INTO v_games_from FROM rankings_watermarks w WHERE w.source = 'user_games' FOR UPDATE;
+    SELECT w.last_id INTO v_frames_from FROM rankings_watermarks w WHERE w.source = 'user_frames' FOR UPDATE;
+    SELECT w.last_id INTO v_sales_from FROM rankings_watermarks w WHERE w.source = 'sales' FOR UPDATE;
+
+    v_games_to := rankings_window_end('user_games', 'purchased_at', v_games_from, p_settle_lag, p_batch);
+    v_frames_to := rankings_window_end('user_frames', 'purchased_at', v_frames_from, p_settle_lag, p_batch);
+    v_sales_to := rankings_window_end('balance_transactions', 'created_at', v_sales_from, p_settle_lag, p_batch);
+
+    IF v_games_to > v_games_from OR v_frames_to > v_frames_from THEN
+        WITH events AS (
+            SELECT 'game'::VARCHAR(20) AS item_type, ug.game_id AS item_id, coalesce(ug.purchased_at, LOCALTIMESTAMP) AS at
+            FROM user_games ug
+            WHERE ug.id > v_games_from AND ug.id <= v_games_to AND ug.game_id IS NOT NULL
+            UNION ALL
+            SELECT 'frame', uf.frame_id, coalesce(uf.purchased_at, LOCALTIMESTAMP)
+            FROM user_frames uf
+            WHERE uf.id > v_frames_from AND uf.id <= v_frames_to AND uf.frame_id IS NOT NULL
+        ), scored AS (
+            SELECT e.item_type, e.item_id, e.at, rankings_decay_log(e.at) AS x,
+                   max(rankings_decay_log(e.at)) OVER (PARTITION BY e.item_type, e.item_id) AS mx
+            FROM events e
+        ), batch AS (
+            SELECT s.item_type, s.item_id, count(*) AS purchases, max(s.at) AS last_at,
+                   max(s.mx) + ln(sum(exp(greatest(s.x - s.mx, -700)))) AS trend_log
+            FROM scored s
+            GROUP BY s.item_type, s.item_id
+        )
+        INSERT INTO item_rankings AS r (item_type, item_id, genre, purchases, trend_log, last_purchase_at)
+        SELECT b.item_type, b.item_id, g.genre, b.purchases, b.trend_log, b.last_at
+        FROM batch b
+        LEFT JOIN games g ON b.item_type = 'game' AND g.id = b.item_id
+        ON CONFLICT (item_type, item_id) DO UPDATE
+        SET purchases = r.purchases + EXCLUDED.purchases,
+            trend_log = rankings_log_add(r.trend_log, EXCLUDED.trend_log),
+            last_purchase_at = greatest(r.last_purchase_at, EXCLUDED.last_purchase_at),
+            genre = EXCLUDED.genre;
+    END IF;
+
+    IF v_sales_to > v_sales_from THEN
+        WITH sales AS (
+            SELECT t.user_id AS seller_id, t.amount, t.created_at AS at, rankings_decay_log(t.created_at) AS x,
+                   max(rankings_decay_log(t.created_at)) OVER (PARTITION BY t.user_id) AS mx
+            FROM balance_transactions t
+            WHERE t.id > v_sales_from AND t.id <= v_sales_to AND t.kind = 'sale'
+        ), batch AS (
+            SELECT s.seller_id, count(*) AS sales, sum(s.amount) AS revenue, max(s.at) AS last_at,
+                   max(s.mx) + ln(sum(exp(greatest(s.x - s.mx, -700)))) AS trend_log
+            FROM sales s
+            GROUP BY s.seller_id
+        )
+        INSERT INTO seller_rankings AS r (seller_id, sales, revenue, trend_log, last_sale_at)
+        SELECT b.seller_id, b.sales, b.revenue, b.trend_log, b.last_at
+        FROM batch b
+        ON CONFLICT (seller_id) DO UPDATE
+        SET sales = r.sales + EXCLUDED.sales,
+            revenue = r.revenue + EXCLUDED.revenue,
+            trend_log = rankings_log_add(r.trend_log, EXCLUDED.trend_log),
+            last_sale_at = greatest(r.last_sale_at, EXCLUDED.last_sale_at);
+    END IF;
+
+    RETURN QUERY
+    UPDATE rankings_watermarks w
+    SET last_id = n.to_id, refreshed_at = LOCALTIMESTAMP
+    FROM (VALUES ('user_games', v_games_from, v_games_to),
+                 ('user_frames', v_frames_from, v_frames_to),
+                 ('sales', v_sales_from, v_sales_to)) AS n(source, from_id, to_id)
+    WHERE w.source = n.source
+    RETURNING w.source, w.last_id, n.to_id - n.from_id;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,2 @@
+-- Загрузка каталога сопоставляет строки с существующими играми по издателю и названию без учёта регистра
+CREATE INDEX idx_games_publisher_title ON games(publisher_username, lower(title));
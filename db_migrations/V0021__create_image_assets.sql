@@ -0,0 +1,18 @@
+-- Загруженные изображения: одна строка на содержимое (sha256), варианты лежат рядом с оригиналом
+-- <база>/<hash[:2]>/<hash>/original.<ext> и <база>/<hash[:2]>/<hash>/<вариант>.webp
+CREATE TABLE image_assets (
+    content_hash CHAR(64) PRIMARY KEY,
+    url TEXT NOT NULL UNIQUE,
+    mime_type VARCHAR(50) NOT NULL,
+    width INTEGER NOT NULL,
+    height INTEGER NOT NULL,
+    bytes INTEGER NOT NULL,
+    variants JSONB NOT NULL,
+    uploaded_by INTEGER REFERENCES users(id),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- URL варианта по URL оригинала без обращения к таблице; внешние ссылки возвращаются как есть
+CREATE OR REPLACE FUNCTION image_variant_url(p_url TEXT, p_variant TEXT) RETURNS TEXT AS $$
+    SELECT regexp_replace(p_url, '/([0-9a-f]{64})/original\.[A-Za-z0-9]+$', '/\1/' || p_variant || '.webp')
+$$ LANGUAGE sql IMMUTABLE;
@@ -0,0 +1,9 @@
+-- Ключи сортировки справочника без NULL: keyset-курсор сравнивает (ключ, id) кортежем, и строки с NULL
+-- в ключе пропускались или повторялись между страницами. Индексы строятся по тем же выражениям, что и ORDER BY
+DROP INDEX idx_users_verified_id;
+DROP INDEX idx_users_created_id;
+DROP INDEX idx_users_balance_id;
+
+CREATE INDEX idx_users_verified_id ON users((coalesce(is_verified, false)) DESC, id DESC);
+CREATE INDEX idx_users_created_id ON users((coalesce(created_at, '1970-01-01'::timestamp)) DESC, id DESC);
+CREATE INDEX idx_users_balance_id ON users((coalesce(balance, 0)) DESC, id DESC);
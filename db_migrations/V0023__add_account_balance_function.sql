@@ -0,0 +1,22 @@
+-- Баланс счёта: users.balance плюс ещё не перенесённые полосы горячего счёта. Один расчёт для всех ответов,
+-- где отдаётся баланс (вход, профиль, справочник, обновление профиля), и для сверки с журналом
+CREATE OR REPLACE FUNCTION account_balance(p_user_id INTEGER, p_balance DECIMAL)
+RETURNS DECIMAL AS $$
+    SELECT coalesce(p_balance, 0) + coalesce((SELECT sum(s.amount) FROM balance_stripes s WHERE s.user_id = p_user_id), 0);
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION ledger_reconcile()
+RETURNS TABLE (user_id INTEGER, account_balance DECIMAL, ledger_balance DECIMAL) AS $$
+    SELECT u.id, a.balance, l.balance
+    FROM users u
+    LEFT JOIN balance_snapshots s ON s.user_id = u.id
+    CROSS JOIN LATERAL (SELECT account_balance(u.id, u.balance) AS balance) a
+    CROSS JOIN LATERAL (
+        SELECT coalesce(s.balance, 0) + coalesce((
+            SELECT sum(t.amount) FROM balance_transactions t
+            WHERE t.user_id = u.id AND t.id > coalesce(s.last_transaction_id, 0)
+        ), 0) AS balance
+    ) l
+    WHERE a.balance <> l.balance
+    ORDER BY u.id;
+$$ LANGUAGE sql STABLE;
@@ -0,0 +1,50 @@
+-- Окно снимков по created_at < now() - p_settle_lag теряло строки длинных транзакций: id выдан и created_at
+-- записан давно, коммит позже, а водяной знак к тому времени уже ушёл дальше, и строка навсегда выпадала из снимков.
+-- Теперь каждый прогон ставит отметку: последний выданный id журнала и xmax своего снимка транзакций. Отметка
+-- становится окном, когда все транзакции, начатые до неё, завершились (xmin текущего снимка >= xmax отметки):
+-- все строки с id не больше отметки к этому моменту либо зафиксированы, либо откачены
+CREATE TABLE ledger_snapshot_marks (
+    id BIGSERIAL PRIMARY KEY,
+    last_transaction_id BIGINT NOT NULL,
+    xmax BIGINT NOT NULL,
+    taken_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- p_settle_lag - минимальный возраст отметки: закрывает зазор между выдачей id и назначением номера транзакции
+CREATE OR REPLACE FUNCTION ledger_take_snapshots(p_settle_lag INTERVAL DEFAULT '5 minutes')
+RETURNS INTEGER AS $$
+DECLARE
+    v_from BIGINT;
+    v_upto BIGINT;
+    v_count INTEGER := 0;
+BEGIN
+    -- Параллельные прогоны выполняются по очереди, иначе одно окно прибавилось бы к снимкам дважды
+    LOCK TABLE ledger_snapshot_marks IN SHARE ROW EXCLUSIVE MODE;
+
+    SELECT coalesce(max(s.last_transaction_id), 0) INTO v_from FROM balance_snapshots s;
+    SELECT max(m.last_transaction_id) INTO v_upto FROM ledger_snapshot_marks m
+    WHERE m.xmax <= txid_snapshot_xmin(txid_current_snapshot())
+      AND m.taken_at <= LOCALTIMESTAMP - p_settle_lag;
+
+    IF v_upto > v_from THEN
+        INSERT INTO balance_snapshots (user_id, balance, last_transaction_id, taken_at)
+        SELECT t.user_id, coalesce(max(s.balance), 0) + sum(t.amount), v_upto, now()
+        FROM balance_transactions t
+        LEFT JOIN balance_snapshots s ON s.user_id = t.user_id
+        WHERE t.id > v_from AND t.id <= v_upto
+        GROUP BY t.user_id
+        ON CONFLICT (user_id) DO UPDATE
+        SET balance = EXCLUDED.balance, last_transaction_id = EXCLUDED.last_transaction_id, taken_at = EXCLUDED.taken_at;
+
+        GET DIAGNOSTICS v_count = ROW_COUNT;
+    END IF;
+
+    DELETE FROM ledger_snapshot_marks m WHERE m.last_transaction_id <= coalesce(v_upto, 0);
+    INSERT INTO ledger_snapshot_marks (last_transaction_id, xmax)
+    VALUES (
+        coalesce(pg_sequence_last_value(pg_get_serial_sequence('balance_transactions', 'id')::regclass), 0),
+        txid_snapshot_xmax(txid_current_snapshot())
+    );
+    RETURN v_count;
+END;
+$$ LANGUAGE plpgsql;